@@ -1,16 +1,30 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image, ImageDraw
-import base64
-import tempfile
-import os
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from datetime import datetime
-from fpdf import FPDF
-from io import BytesIO
-import openpyxl
-import re
+import os
+import threading
+import time
+
+from valvefigure import metrics
+from valvefigure.currency import RateError, RateTable, currency_symbol, format_money, load_rates
+from valvefigure.export import iter_proposal_csv
+from valvefigure.figcache import FigureCache
+from valvefigure.items import ProposalItems
+from valvefigure.jobs import CSV, FIGURES, PDF, SPRITE, XLSX, ExportQueue
+from valvefigure.pricing import (
+    FAIL_MODES, FLUID_TYPES, MATERIAL_DB, MAX_QUANTITY, VALVE_TYPES, calculate_valve_price, load_price_database,
+)
+from valvefigure.logo import LogoError, prepare_logo
+from valvefigure.pricebook import PriceBookSource
+from valvefigure.pricelists import PriceListError, PriceLists, load_price_lists, reprice
+from valvefigure.revisions import ADDED, CHANGED, REDLINE_COLUMNS, REMOVED, UNCHANGED, diff_quotes
+from valvefigure.rfq import SCHEDULE_COLUMNS, ImportJob, ScheduleError, read_schedule, validate_schedule
+from valvefigure.rules import RuleSet
+from valvefigure.store import ProposalStore
+from valvefigure.vector import SVG_MIME, render_valve_svg
+
+# Name of a proposal the user has not named
+DEFAULT_PROPOSAL_NAME = "Valve Proposal"
 
 # Initialize session state
 if 'valves' not in st.session_state:
@@ -18,259 +32,890 @@ if 'valves' not in st.session_state:
 if 'current_valve' not in st.session_state:
     st.session_state.current_valve = {}
 if 'proposal_name' not in st.session_state:
-    st.session_state.proposal_name = "Valve Proposal"
+    st.session_state.proposal_name = DEFAULT_PROPOSAL_NAME
 if 'proposal_date' not in st.session_state:
     st.session_state.proposal_date = datetime.now().strftime("%Y-%m-%d")
 if 'client_name' not in st.session_state:
     st.session_state.client_name = ""
 if 'proposal_items' not in st.session_state:
-    st.session_state.proposal_items = []
+    st.session_state.proposal_items = ProposalItems()
+if 'exports' not in st.session_state:
+    st.session_state.exports = {}
+
+# Proposal items shown per page in the Proposal page
+ITEMS_PER_PAGE = 20
+
+# Imported valves previewed while a batch import runs
+IMPORT_PREVIEW_ROWS = 200
 
 # ========================
-# MATERIAL DATABASE
+# PRICE BOOK
 # ========================
-MATERIAL_DB = {
-    'Body/Bonnet': {
-        'Carbon Steel': {'price': 150, 'color': '#A9A9A9'},
-        'Stainless Steel 316': {'price': 300, 'color': '#C0C0C0'},
-        'Duplex Steel': {'price': 450, 'color': '#4682B4'},
-        'Super Duplex': {'price': 600, 'color': '#5F9EA0'},
-        'Alloy 20': {'price': 700, 'color': '#6495ED'},
-        'Hastelloy C': {'price': 1200, 'color': '#B0C4DE'},
-    },
-    'Ball': {
-        'Stainless Steel 316': {'price': 200, 'color': '#C0C0C0'},
-        'Stellite 6': {'price': 500, 'color': '#FF6347'},
-        'Alloy 6': {'price': 800, 'color': '#FFA500'},
-        'Hastelloy C': {'price': 1500, 'color': '#B0C4DE'},
-    },
-    'Stem': {
-        'Stainless Steel 316': {'price': 100, 'color': '#C0C0C0'},
-        '17-4 PH': {'price': 250, 'color': '#9370DB'},
-        'Monel': {'price': 400, 'color': '#D8BFD8'},
-        'Inconel 718': {'price': 600, 'color': '#DA70D6'},
-    },
-    'Seat': {
-        'PTFE': {'price': 80, 'color': '#FFFFFF'},
-        'RPTFE': {'price': 120, 'color': '#F0F8FF'},
-        'PEEK': {'price': 200, 'color': '#ADD8E6'},
-        'Metal': {'price': 300, 'color': '#D3D3D3'},
-        'Graphoil': {'price': 350, 'color': '#708090'},
-    },
-    'Trim': {
-        'Standard': {'price': 100, 'color': '#D3D3D3'},
-        'Anti-cavitation': {'price': 300, 'color': '#87CEEB'},
-        'Low Noise': {'price': 400, 'color': '#20B2AA'},
-        'Cryogenic': {'price': 600, 'color': '#00BFFF'},
-    }
-}
+@st.cache_resource
+def get_price_book_source():
+    """Price book workbook named by VALVEFIGURE_PRICE_BOOK, shared by all
+    sessions and reloaded when the file changes; None for built-in prices."""
+    path = os.environ.get('VALVEFIGURE_PRICE_BOOK')
+    return PriceBookSource(path) if path else None
+
+def current_price_data():
+    """The (price_db, material_db) pair to price this rerun with."""
+    source = get_price_book_source()
+    if source is None:
+        return load_price_database(), MATERIAL_DB
+    book = source.get()
+    return book.price_db, book.material_db
 
 # ========================
-# EXCEL PRICE DATABASE
+# PRICE LISTS AND CURRENCIES
 # ========================
-def load_price_database():
-    return {
-        'Valve Size': {
-            '0.5"': 500,
-            '1"': 800,
-            '1.5"': 1200,
-            '2"': 1800,
-            '3"': 2500,
-            '4"': 3500,
-            '6"': 5000,
-            '8"': 7000,
-            '10"': 10000,
-            '12"': 14000,
-        },
-        'Pressure Rating': {
-            '150#': 1.0,
-            '300#': 1.2,
-            '600#': 1.5,
-            '900#': 1.8,
-            '1500#': 2.2,
-            '2500#': 3.0,
-        },
-        'Actuator Type': {
-            'Pneumatic': 800,
-            'Electric': 1500,
-            'Hydraulic': 2500,
-        },
-        'Accessories': {
-            'Positioner': 400,
-            'Solenoid Valve': 200,
-            'Limit Switches': 300,
-            'Air Filter Regulator': 150,
-            'Boosters': 350,
-        }
-    }
+@st.cache_resource
+def get_price_list_file(path):
+    """Versioned price lists read from ``path``, shared by all sessions."""
+    return load_price_lists(path)
+
+@st.cache_resource(max_entries=4)
+def get_single_price_list(digest, _price_db, _material_db):
+    """The current prices as a one-version price list, per price book digest."""
+    return PriceLists.single(_price_db, _material_db)
+
+def current_price_lists():
+    """The price lists named by VALVEFIGURE_PRICE_LISTS, or else the current
+    prices as a single version."""
+    path = os.environ.get('VALVEFIGURE_PRICE_LISTS')
+    if path:
+        try:
+            return get_price_list_file(path)
+        except PriceListError as e:
+            st.error(f"{e}; using the current price book")
+    source = get_price_book_source()
+    book = source.get() if source is not None else None
+    return get_single_price_list(book and book.digest, *current_price_data())
+
+@st.cache_resource
+def get_rates(path):
+    """Exchange rates read from ``path``, shared by all sessions."""
+    return load_rates(path)
+
+def current_rates(price_lists):
+    """Exchange rates from VALVEFIGURE_RATES, or only the price lists' own currency."""
+    path = os.environ.get('VALVEFIGURE_RATES')
+    if path:
+        try:
+            rates = get_rates(path)
+        except RateError as e:
+            st.error(f"{e}; quoting in {price_lists.currency} only")
+        else:
+            if price_lists.currency in rates.currencies:
+                return rates
+            st.error(f"{path} has no rate for {price_lists.currency}; quoting in {price_lists.currency} only")
+    return RateTable.single(price_lists.currency)
+
+def reprice_proposal(price_lists, rates, currency, version=None, default_version=None):
+    """Reprice the open proposal's items in ``currency`` in one pass, with
+    ``version`` or the version each item pins; returns the items changed.
+
+    Items the version has no price data for keep their price, with a warning.
+    """
+    import math
+
+    items = st.session_state.proposal_items
+    if not items:
+        return 0
+    prices = reprice(items, price_lists, rates, currency, version=version, default_version=default_version)
+    changed = 0
+    unpriced = []
+    for item, total, missing, version_name in zip(list(items), prices['total_price'], prices['missing'],
+                                                  prices['price_version']):
+        if missing:
+            unpriced.append(f"{item['size']} {item['type']} ({missing})")
+        elif (item.currency, item.price_version) != (currency, version_name) or \
+                not math.isclose(total, item.total_price, rel_tol=1e-9):
+            items.update(item.item_id, total_price=float(total), currency=currency, price_version=version_name)
+            changed += 1
+    if unpriced:
+        st.warning(f"{len(unpriced)} items kept their prices, having no price data in the price list: "
+                   + ", ".join(unpriced[:10]) + (" ..." if len(unpriced) > 10 else ""))
+    return changed
+
+def pinned_price_tables(price_lists, rates):
+    """``{version name: {currency: (price_db, material_db)}}`` for every price
+    list version and currency the open proposal's items are priced with."""
+    pinned = {(item.price_version, item.currency or st.session_state.currency)
+              for item in st.session_state.proposal_items if item.price_version}
+    tables = {}
+    for version_name, currency in pinned:
+        try:
+            tables.setdefault(version_name, {})[currency] = price_lists.tables(
+                price_lists.get(version_name), currency, rates)
+        except KeyError:
+            # An unknown version or currency: the export notes its items
+            continue
+    return tables
+
+def change_currency(price_lists, rates, default_version):
+    """Currency selectbox callback: reprice the proposal in the new currency."""
+    reprice_proposal(price_lists, rates, st.session_state.currency, default_version=default_version)
+
+def reprice_to_version(price_lists, rates, version):
+    """Button callback: reprice the whole proposal with ``version``."""
+    changed = reprice_proposal(price_lists, rates, st.session_state.currency, version=version)
+    st.success(f"Repriced with price list {version.name}: {changed} items changed")
 
 # ========================
-# VALVE FIGURE GENERATION
+# FIGURE CACHE
 # ========================
-def generate_valve_figure(valve_data):
-    # Create a blank image with white background
-    img = Image.new('RGB', (400, 600), color='white')
-    draw = ImageDraw.Draw(img)
-    
-    # Draw valve body
-    body_color = MATERIAL_DB['Body/Bonnet'][valve_data['body_material']]['color']
-    draw.rectangle([100, 100, 300, 400], fill=body_color, outline='black', width=2)
-    
-    # Draw ball
-    ball_color = MATERIAL_DB['Ball'][valve_data['ball_material']]['color']
-    draw.ellipse([150, 200, 250, 300], fill=ball_color, outline='black', width=2)
-    
-    # Draw stem
-    stem_color = MATERIAL_DB['Stem'][valve_data['stem_material']]['color']
-    draw.rectangle([190, 100, 210, 200], fill=stem_color, outline='black', width=1)
-    
-    # Draw actuator
-    draw.rectangle([150, 50, 250, 100], fill='#FFD700', outline='black', width=2)
-    
-    # Add labels
-    draw.text((200, 30), f"{valve_data['actuator_type']} Actuator", fill='black', anchor='ms')
-    draw.text((200, 450), f"{valve_data['size']} {valve_data['pressure_rating']}", fill='black', anchor='ms')
-    draw.text((200, 480), f"Body: {valve_data['body_material']}", fill='black', anchor='ms')
-    draw.text((200, 510), f"Ball: {valve_data['ball_material']}", fill='black', anchor='ms')
-    draw.text((200, 540), f"Stem: {valve_data['stem_material']}", fill='black', anchor='ms')
-    
-    return img
+@st.cache_resource
+def get_figure_cache():
+    """Figure cache shared by all sessions, warmed up in the background unless
+    VALVEFIGURE_WARM_FIGURES=0."""
+    price_db, material_db = current_price_data()
+    cache = FigureCache(material_db=material_db)
+    if os.environ.get('VALVEFIGURE_WARM_FIGURES', '1') != '0':
+        threading.Thread(target=cache.warm_up, args=(price_db,),
+                         kwargs={'workers': 1}, daemon=True).start()
+    return cache
 
 # ========================
-# PRICE CALCULATION
+# ENGINEERING RULES
 # ========================
-def calculate_valve_price(valve_data, price_db):
-    try:
-        # Base price based on size
-        base_price = price_db['Valve Size'][valve_data['size']]
-        
-        # Pressure rating multiplier
-        pressure_multiplier = price_db['Pressure Rating'][valve_data['pressure_rating']]
-        
-        # Material costs
-        body_cost = MATERIAL_DB['Body/Bonnet'][valve_data['body_material']]['price']
-        ball_cost = MATERIAL_DB['Ball'][valve_data['ball_material']]['price']
-        stem_cost = MATERIAL_DB['Stem'][valve_data['stem_material']]['price']
-        seat_cost = MATERIAL_DB['Seat'][valve_data['seat_material']]['price']
-        trim_cost = MATERIAL_DB['Trim'][valve_data['trim_type']]['price']
-        
-        # Actuator cost
-        actuator_cost = price_db['Actuator Type'][valve_data['actuator_type']]
-        
-        # Accessories cost
-        accessories_cost = 0
-        for accessory in valve_data['accessories']:
-            accessories_cost += price_db['Accessories'].get(accessory, 0)
-        
-        # Calculate total price
-        material_cost = body_cost + ball_cost + stem_cost + seat_cost + trim_cost
-        total_price = (base_price + material_cost + actuator_cost + accessories_cost) * pressure_multiplier
-        
-        # Apply quantity
-        total_price *= valve_data['quantity']
-        
-        return {
-            'base_price': base_price,
-            'pressure_multiplier': pressure_multiplier,
-            'material_cost': material_cost,
-            'actuator_cost': actuator_cost,
-            'accessories_cost': accessories_cost,
-            'total_price': total_price
+@st.cache_resource
+def get_rules():
+    """Compiled compatibility rules, shared by all sessions."""
+    return RuleSet()
+
+def compatible_options(rules, column, options, valve, label):
+    """The options of ``column`` the valve's operating conditions allow; every
+    option, with a warning, when the rules leave none."""
+    allowed = rules.allowed(column, options, valve)
+    if allowed:
+        return allowed
+    st.warning(f"No {label} option suits the operating conditions; showing all options")
+    return list(options)
+
+# ========================
+# PERSISTENCE
+# ========================
+# Session state that belongs to the open proposal
+PROPOSAL_SESSION_KEYS = ('proposal_id', 'valves', 'current_valve', 'proposal_name', 'proposal_date',
+                         'client_name', 'proposal_items', 'logo_bytes', 'exports', 'currency')
+
+@st.cache_resource
+def get_proposal_store():
+    """SQLite proposal store named by VALVEFIGURE_STORE (default proposals.db),
+    shared by all sessions; None when VALVEFIGURE_STORE is empty."""
+    path = os.environ.get('VALVEFIGURE_STORE', 'proposals.db')
+    return ProposalStore(path) if path else None
+
+def open_session_proposal(store):
+    """Bind this session to the proposal named in the URL, or to a new one.
+
+    Runs once per session: a refreshed page, or one served by another
+    replica sharing the store, picks up where it left off.
+    """
+    if 'proposal_id' in st.session_state:
+        return
+    proposal_id = st.query_params.get('proposal')
+    meta = store.load_meta(proposal_id) if proposal_id else None
+    if meta is None:
+        proposal_id = store.new_proposal_id()
+    else:
+        st.session_state.proposal_name = meta['name'] or st.session_state.proposal_name
+        st.session_state.client_name = meta['client_name']
+        st.session_state.proposal_date = meta['date'] or st.session_state.proposal_date
+        st.session_state.valves = meta['valves']
+        st.session_state.currency = meta['currency']
+        if meta['logo']:
+            st.session_state.logo_bytes = meta['logo']
+        st.session_state.proposal_items = store.load_items(proposal_id)
+    st.session_state.proposal_id = proposal_id
+    store.track(proposal_id, st.session_state.proposal_items)
+    st.query_params['proposal'] = proposal_id
+
+def proposal_worth_saving(store):
+    """Whether the open proposal belongs in the store: it was saved before,
+    or has items, valves or anything the user entered."""
+    state = st.session_state
+    return (store.has_saved(state.proposal_id) or bool(state.proposal_items) or bool(state.valves)
+            or state.proposal_name != DEFAULT_PROPOSAL_NAME or bool(state.client_name)
+            or state.get('logo_bytes') is not None)
+
+def switch_proposal(proposal_id=None):
+    """Button callback: open a saved proposal, or start a new one, in the
+    run the click triggers."""
+    store = get_proposal_store()
+    if store is not None and 'proposal_id' in st.session_state:
+        store.forget(st.session_state.proposal_id)
+    for key in PROPOSAL_SESSION_KEYS:
+        st.session_state.pop(key, None)
+    if proposal_id:
+        st.query_params['proposal'] = proposal_id
+    else:
+        st.query_params.pop('proposal', None)
+
+# ========================
+# CONFIGURATION EXPLORER
+# ========================
+# Explorer filters: (valve field, label, options from (price_db table or MATERIAL_DB category))
+EXPLORER_FILTERS = [
+    ('size', "Size", 'Valve Size'),
+    ('pressure_rating', "Pressure Rating", 'Pressure Rating'),
+    ('actuator_type', "Actuator", 'Actuator Type'),
+    ('body_material', "Body/Bonnet", 'Body/Bonnet'),
+    ('ball_material', "Ball", 'Ball'),
+    ('stem_material', "Stem", 'Stem'),
+    ('seat_material', "Seat", 'Seat'),
+    ('trim_type', "Trim", 'Trim'),
+]
+
+@st.cache_resource(max_entries=8)
+def get_price_cube(version_name, currency, _price_db, _material_db):
+    """Price cube over every configuration of one price list version in one
+    currency, shared by the sessions quoting with them and patched to the
+    current prices (a reloaded price book) before each search."""
+    from valvefigure.explorer import PriceCube
+
+    return PriceCube(_price_db, _material_db)
+
+# ========================
+# EXPORTS
+# ========================
+EXPORT_LABELS = {PDF: "Proposal", XLSX: "Excel", CSV: "CSV", FIGURES: "Figures (ZIP)", SPRITE: "Figure Sprite Sheet"}
+# Appended to the proposal name in the downloaded file's name
+EXPORT_FILE_SUFFIXES = {FIGURES: "_figures", SPRITE: "_figures"}
+
+@st.cache_resource
+def get_export_queue():
+    """Background export queue shared by all sessions, so every session reuses
+    the documents already rendered for an unchanged proposal."""
+    return ExportQueue(figure_cache=get_figure_cache())
+
+def show_export(slot, job):
+    """Show an export job's progress in ``slot``, or its download once done."""
+    label = EXPORT_LABELS[job.kind]
+    with slot.container():
+        if not job.done:
+            st.progress(job.progress, text=f"Generating {label}: {job.progress:.0%}")
+        elif job.failure is not None:
+            st.error(f"{label} could not be generated: {job.failure}")
+        else:
+            st.download_button(
+                label=f"Download {label}",
+                data=job.data,
+                file_name=f"{st.session_state.proposal_name.replace(' ', '_')}"
+                          f"{EXPORT_FILE_SUFFIXES.get(job.kind, '')}.{job.extension}",
+                mime=job.mime,
+                key=f"download_{job.kind}"
+            )
+            st.caption(f"{job.item_count} items, generated in {job.elapsed:.1f} s")
+
+def poll_exports(slots):
+    """Show this session's exports in their ``slots`` until every one is done.
+
+    Runs after the whole page is drawn; any interaction reruns the script
+    and ends the polling, so the page stays responsive.
+    """
+    pending = {}
+    for kind, slot in slots.items():
+        job = st.session_state.exports.get(kind)
+        if job is not None:
+            show_export(slot, job)
+            if not job.done:
+                pending[kind] = job
+    while pending:
+        time.sleep(0.25)
+        for kind, job in list(pending.items()):
+            show_export(slots[kind], job)
+            if job.done:
+                del pending[kind]
+
+# ========================
+# METRICS
+# ========================
+@st.cache_resource
+def start_metrics(_figure_cache, _export_queue):
+    """Export metrics once per server process, with the shared caches'
+    effectiveness sampled at every export."""
+    def requests(stats):
+        return {(('result', 'hit'),): stats['hits'], (('result', 'miss'),): stats['misses']}
+
+    metrics.register_collector('figure_cache_requests_total', lambda: requests(_figure_cache.stats()),
+                               "Figure cache lookups, by result.")
+    metrics.register_collector('figure_cache_entries', lambda: {(): len(_figure_cache)},
+                               "Figures held in the figure cache.")
+    metrics.register_collector('export_cache_requests_total', lambda: requests(_export_queue.stats()),
+                               "Export requests, by whether a rendered document was reused.")
+    metrics.register_collector('export_cache_bytes', lambda: {(): _export_queue.stats()['cached_bytes']},
+                               "Size of the documents kept for repeat downloads.")
+    return metrics.MetricsExporter().start()
+
+# ========================
+# PROPOSAL
+# ========================
+def current_proposal():
+    """The proposal being edited in this session, for rendering documents."""
+    # The PDF modules pull in fpdf; load them with the first document
+    from valvefigure.proposal import Proposal
+
+    return Proposal(
+        name=st.session_state.proposal_name,
+        client_name=st.session_state.client_name,
+        date=st.session_state.proposal_date,
+        items=st.session_state.proposal_items,
+        logo_bytes=st.session_state.get('logo_bytes'),
+        currency=st.session_state.currency,
+    )
+
+# ========================
+# PAGES
+# ========================
+# Sent as-is on every run; built once here rather than in main()
+APP_CSS = """
+<style>
+.stApp {
+    background-color: #f0f2f6;
+}
+.block-container {
+    padding-top: 1rem;
+}
+div[role="radiogroup"][aria-label="Section"] {
+    gap: 10px;
+}
+div[role="radiogroup"][aria-label="Section"] label {
+    padding: 15px 25px;
+    border-radius: 10px 10px 0 0;
+    font-size: 18px;
+    background-color: white;
+}
+div[role="radiogroup"][aria-label="Section"] label:has(input:checked) {
+    background-color: #1f77b4;
+    color: white;
+}
+.stButton button {
+    width: 100%;
+    font-weight: bold;
+    font-size: 18px;
+}
+.config-card {
+    background-color: white;
+    border-radius: 10px;
+    padding: 20px;
+    margin-bottom: 20px;
+    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+}
+.price-display {
+    font-size: 24px;
+    font-weight: bold;
+    color: #1f77b4;
+    text-align: center;
+    padding: 15px;
+    border: 2px solid #1f77b4;
+    border-radius: 10px;
+    margin: 20px 0;
+}
+.material-item {
+    padding: 10px;
+    margin: 5px 0;
+    border-radius: 5px;
+    border-left: 4px solid #1f77b4;
+    background-color: #e6f0ff;
+}
+</style>
+"""
+
+# Pages of the configurator: slug (also the ?page= value) -> title
+PAGES = {
+    'requirements': "⚙️ System Requirements",
+    'materials': "🛠️ Material Selection",
+    'pricing': "💰 Pricing",
+    'proposal': "📄 Proposal",
+    'batch_import': "📥 Batch Import",
+    'explorer': "🔍 Explorer",
+}
+PAGE_SLUGS = {title: slug for slug, title in PAGES.items()}
+
+# Widget values kept while their page is not shown, by key prefix
+KEPT_WIDGET_PREFIXES = ('explore_',)
+
+def select_page():
+    """The page picked in the section bar, which is kept in the URL as ?page=."""
+    titles = list(PAGES.values())
+    if 'page' not in st.session_state:
+        st.session_state.page = PAGES.get(st.query_params.get('page'), titles[0])
+    page = PAGE_SLUGS[st.radio("Section", titles, key='page', horizontal=True, label_visibility='collapsed')]
+    if st.query_params.get('page') != page:
+        st.query_params['page'] = page
+    return page
+
+def keep_widget_state(prefixes=KEPT_WIDGET_PREFIXES):
+    """Keep the values of widgets whose page is not shown this run.
+
+    Streamlit drops the state of widgets a run does not draw; writing the
+    values back before any widget is drawn keeps them for the next visit.
+    """
+    for key in [key for key in st.session_state if key.startswith(prefixes)]:
+        st.session_state[key] = st.session_state[key]
+
+@st.cache_data(max_entries=32)
+def material_color_key(material_db, currency):
+    """HTML of the material color key, one block for each of its two columns."""
+    columns = ['', '']
+    for i, (material_type, materials) in enumerate(material_db.items()):
+        columns[i % 2] += f"<p><strong>{material_type}</strong></p>" + ''.join(
+            f"<div style='background-color:{props['color']}; padding:5px; margin:2px; border-radius:5px;'>"
+            f"{mat} - {format_money(props['price'], currency)}</div>"
+            for mat, props in materials.items())
+    return columns
+
+def option_index(options, value):
+    """Position of ``value`` in ``options``, or 0 when it is not one of them."""
+    return options.index(value) if value in options else 0
+
+def requirements_page(price_db, rules):
+    """System requirements: operating conditions and valve specifications."""
+    st.header("System Requirements")
+    # Widgets forget their values while their page is not shown; start from the saved ones
+    saved = st.session_state.current_valve
+    with st.form("system_requirements_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Operating Conditions")
+            op_pressure = st.number_input("Operating Pressure (bar)", min_value=0.0, max_value=1000.0,
+                                          value=float(saved.get('op_pressure', 50.0)), step=1.0)
+            op_temp = st.number_input("Operating Temperature (°C)", min_value=-200.0, max_value=1000.0,
+                                      value=float(saved.get('op_temp', 150.0)), step=1.0)
+            fluid_type = st.selectbox("Fluid Type", FLUID_TYPES, index=option_index(FLUID_TYPES, saved.get('fluid_type')))
+
+        with col2:
+            st.subheader("Valve Specifications")
+            sizes = list(price_db['Valve Size'])
+            valve_size = st.selectbox("Valve Size", sizes, index=option_index(sizes, saved.get('size')))
+            ratings = list(price_db['Pressure Rating'])
+            pressure_rating = st.selectbox("Pressure Rating", ratings,
+                                           index=option_index(ratings, saved.get('pressure_rating')))
+            valve_type = st.selectbox("Valve Type", VALVE_TYPES, index=option_index(VALVE_TYPES, saved.get('type')))
+            fail_mode = st.selectbox("Fail Safe Mode", FAIL_MODES, index=option_index(FAIL_MODES, saved.get('fail_mode')))
+            actuators = list(price_db['Actuator Type'])
+            actuator_type = st.selectbox("Actuator Type", actuators,
+                                         index=option_index(actuators, saved.get('actuator_type')))
+
+        st.subheader("Additional Requirements")
+        accessory_options = list(price_db['Accessories'])
+        accessories = st.multiselect("Accessories", accessory_options,
+                                     default=[name for name in saved.get('accessories', []) if name in accessory_options])
+        quantity = st.number_input("Quantity", min_value=1, max_value=MAX_QUANTITY,
+                                   value=int(saved.get('quantity', 1)), step=1)
+        notes = st.text_area("Special Requirements or Notes", saved.get('notes', ''))
+
+        if st.form_submit_button("Save Requirements"):
+            requirements = {
+                'op_pressure': op_pressure,
+                'op_temp': op_temp,
+                'fluid_type': fluid_type,
+                'size': valve_size,
+                'pressure_rating': pressure_rating,
+                'type': valve_type,
+                'fail_mode': fail_mode,
+                'actuator_type': actuator_type,
+                'accessories': accessories,
+                'quantity': quantity,
+                'notes': notes
+            }
+            # The form only reruns on submit, so the rating is checked here
+            # rather than by filtering its options
+            problems = rules.violations(requirements)
+            if problems:
+                for problem in problems:
+                    st.error(problem)
+                suitable = rules.allowed('pressure_rating', list(price_db['Pressure Rating']), requirements)
+                st.info(f"Suitable pressure ratings: {', '.join(suitable)}" if suitable else
+                        "No pressure rating covers these operating conditions")
+            else:
+                st.session_state.current_valve.update(requirements)
+                st.success("System requirements saved!")
+                for problem in rules.violations(st.session_state.current_valve):
+                    st.warning(f"{problem}; choose again in Material Selection")
+
+def materials_page(material_db, version, currency, rules, figure_cache):
+    """Material selection, the valve figure and the material color key."""
+    st.header("Material Selection")
+
+    if not st.session_state.current_valve:
+        st.warning("Please complete System Requirements first")
+        return
+
+    col1, col2 = st.columns([1, 2])
+
+    with col1:
+        st.subheader("Material Options")
+        st.caption("Only materials suited to the saved operating conditions are listed.")
+        valve = st.session_state.current_valve
+
+        def material_select(label, column, category, description):
+            options = compatible_options(rules, column, material_db[category], valve, description)
+            return st.selectbox(label, options, index=option_index(options, valve.get(column)))
+
+        body_material = material_select("Body/Bonnet Material", 'body_material', 'Body/Bonnet', "body/bonnet material")
+        ball_material = material_select("Ball Material", 'ball_material', 'Ball', "ball material")
+        stem_material = material_select("Stem Material", 'stem_material', 'Stem', "stem material")
+        seat_material = material_select("Seat Material", 'seat_material', 'Seat', "seat material")
+        trim_type = material_select("Trim Type", 'trim_type', 'Trim', "trim type")
+
+        if st.button("Save Materials"):
+            st.session_state.current_valve.update({
+                'body_material': body_material,
+                'ball_material': ball_material,
+                'stem_material': stem_material,
+                'seat_material': seat_material,
+                'trim_type': trim_type
+            })
+            st.success("Material selection saved!")
+
+        st.divider()
+        st.subheader("Material Summary")
+        st.markdown(f"<div class='material-item'>Body: {body_material}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='material-item'>Ball: {ball_material}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='material-item'>Stem: {stem_material}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='material-item'>Seat: {seat_material}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='material-item'>Trim: {trim_type}</div>", unsafe_allow_html=True)
+
+    with col2:
+        st.subheader("Valve Configuration")
+        figure_valve = {
+            'type': st.session_state.current_valve.get('type', 'Ball'),
+            'size': st.session_state.current_valve.get('size', '2"'),
+            'pressure_rating': st.session_state.current_valve.get('pressure_rating', '150#'),
+            'body_material': body_material,
+            'ball_material': ball_material,
+            'stem_material': stem_material,
+            'actuator_type': st.session_state.current_valve.get('actuator_type', 'Pneumatic')
         }
+        figure_format = st.radio("Figure Format", ["Vector (SVG)", "Raster (PNG)"], horizontal=True)
+        if figure_format == "Vector (SVG)":
+            # A string substitution into the valve type's template; no caching needed
+            valve_svg = render_valve_svg(figure_valve, version.material_db)
+            st.image(valve_svg, caption="Valve Configuration", use_column_width=True)
+            st.download_button("Download Figure (SVG)", valve_svg,
+                               file_name="valve_figure.svg", mime=SVG_MIME)
+        else:
+            valve_img = figure_cache.get_png(figure_valve, version.material_db)
+            st.image(valve_img, caption="Valve Configuration", use_column_width=True)
+
+        # Material colors key
+        st.subheader("Material Color Key")
+        for column, html in zip(st.columns(2), material_color_key(material_db, currency)):
+            column.markdown(html, unsafe_allow_html=True)
+
+def pricing_page(price_db, material_db, version, currency, rules):
+    """Price breakdown of the current valve and adding it to the proposal."""
+    st.header("Pricing")
+
+    if not st.session_state.current_valve or 'body_material' not in st.session_state.current_valve:
+        st.warning("Please complete Material Selection first")
+        return
+
+    # Calculate price
+    try:
+        price_data = calculate_valve_price(st.session_state.current_valve, price_db, material_db)
     except KeyError as e:
         st.error(f"Missing price data for: {str(e)}")
-        return None
+        price_data = None
 
-# ========================
-# PDF REPORT GENERATION
-# ========================
-class PDF(FPDF):
-    def header(self):
-        if st.session_state.get('logo_bytes'):
+    if price_data:
+        col1, col2, col3 = st.columns([1, 2, 1])
+
+        with col2:
+            st.markdown(f"<div class='price-display'>Total Price: {format_money(price_data['total_price'], currency)}</div>", unsafe_allow_html=True)
+
+            # Price breakdown
+            st.subheader("Price Breakdown")
+            st.markdown(f"- **Base Valve Price**: {format_money(price_data['base_price'], currency)}")
+            st.markdown(f"- **Pressure Multiplier ({st.session_state.current_valve['pressure_rating']})**: x{price_data['pressure_multiplier']:.2f}")
+            st.markdown(f"- **Material Costs**: {format_money(price_data['material_cost'], currency)}")
+            st.markdown(f"- **Actuator ({st.session_state.current_valve['actuator_type']})**: {format_money(price_data['actuator_cost'], currency)}")
+            st.markdown(f"- **Accessories**: {format_money(price_data['accessories_cost'], currency)}")
+            st.markdown(f"- **Quantity**: {st.session_state.current_valve['quantity']}")
+
+            # Configurations the rules rule out cannot be quoted
+            problems = rules.violations(st.session_state.current_valve)
+            for problem in problems:
+                st.error(problem)
+
+            # Add to proposal button
+            if st.button("Add to Proposal", disabled=bool(problems)):
+                valve_with_price = st.session_state.current_valve.copy()
+                valve_with_price['total_price'] = price_data['total_price']
+                valve_with_price['currency'] = currency
+                valve_with_price['price_version'] = version.name
+                st.session_state.proposal_items.add(valve_with_price)
+                metrics.count('valves_quoted_total', type=valve_with_price['type'],
+                              size=valve_with_price['size'])
+                st.success("Added to proposal!")
+
+def proposal_page(price_db, material_db, price_lists, rates, version, currency, export_queue, export_slots):
+    """Proposal items, one page at a time, with totals, repricing and exports."""
+    st.header("Proposal Summary")
+
+    if not st.session_state.proposal_items:
+        st.info("No items in proposal yet. Add valves from the Pricing page.")
+        return
+
+    # Display proposal items, one page at a time
+    proposal_items = st.session_state.proposal_items
+    st.subheader("Valves in Proposal")
+    page_count = proposal_items.page_count(ITEMS_PER_PAGE)
+    page = 1
+    if page_count > 1:
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1)
+    for position, item in proposal_items.page(page, ITEMS_PER_PAGE):
+        with st.expander(f"Valve {position}: {item['size']} {item['type']} Valve - {format_money(item['total_price'], currency)}"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Configuration**")
+                st.markdown(f"- Size: {item['size']}")
+                st.markdown(f"- Pressure Rating: {item['pressure_rating']}")
+                st.markdown(f"- Type: {item['type']}")
+                st.markdown(f"- Fail Mode: {item['fail_mode']}")
+                st.markdown(f"- Actuator: {item['actuator_type']}")
+
+            with col2:
+                st.markdown("**Materials**")
+                st.markdown(f"- Body: {item['body_material']}")
+                st.markdown(f"- Ball: {item['ball_material']}")
+                st.markdown(f"- Stem: {item['stem_material']}")
+                st.markdown(f"- Seat: {item['seat_material']}")
+                st.markdown(f"- Trim: {item['trim_type']}")
+
+            st.markdown("**Pricing**")
+            # Lines stored before schedules were checked against the limit may exceed it
+            quantity = st.number_input("Quantity", min_value=1, max_value=max(MAX_QUANTITY, item['quantity']),
+                                       value=item['quantity'], step=1, key=f"quantity_{item.item_id}")
+            st.markdown(f"- Total Price: {format_money(item['total_price'], currency)}")
+            if item['price_version']:
+                st.markdown(f"- Price List: {item['price_version']}")
+
+            if quantity != item['quantity']:
+                unit_price = item['total_price'] / item['quantity']
+                proposal_items.update(item.item_id, quantity=quantity, total_price=unit_price * quantity)
+                st.rerun()
+            if st.button(f"Remove Valve {position}", key=f"remove_{item.item_id}"):
+                proposal_items.remove(item.item_id)
+                st.rerun()
+
+    # Proposal total
+    st.subheader(f"Proposal Total: {format_money(proposal_items.total_price, currency)}")
+    st.button(f"Reprice with Price List {version.name}", on_click=reprice_to_version,
+              args=(price_lists, rates, version),
+              help="Items keep the price list they were priced with until repriced")
+
+    # Export buttons: documents render in the background
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Export Proposal to Excel"):
+            st.session_state.exports[XLSX] = export_queue.submit(
+                XLSX, current_proposal(), price_db=price_db, material_db=material_db,
+                price_tables=pinned_price_tables(price_lists, rates))
+        export_slots[XLSX] = st.empty()
+    with col2:
+        if st.button("Export Proposal to CSV"):
+            st.session_state.exports[CSV] = export_queue.submit(CSV, current_proposal())
+        export_slots[CSV] = st.empty()
+
+    # Every distinct figure, for fabrication and document control
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Export Figures (ZIP)", help="One PNG per distinct configuration, with an index of the lines"):
+            st.session_state.exports[FIGURES] = export_queue.submit(
+                FIGURES, current_proposal(), material_db=version.material_db)
+        export_slots[FIGURES] = st.empty()
+    with col2:
+        if st.button("Export Figure Sprite Sheet (PNG)",
+                     help="Every distinct figure tiled into one image, in proposal order"):
+            st.session_state.exports[SPRITE] = export_queue.submit(
+                SPRITE, current_proposal(), material_db=version.material_db)
+        export_slots[SPRITE] = st.empty()
+
+def batch_import_page(price_db, material_db, rates, version, currency, rules, figure_cache):
+    """Valve schedule upload, validation and background pricing."""
+    st.header("Batch Import")
+    st.markdown("Upload a valve schedule (CSV or Excel) with one valve per row and the columns: "
+                + ", ".join(f"`{name}`" for name in SCHEDULE_COLUMNS)
+                + ". Separate accessories with `;`.")
+    schedule_upload = st.file_uploader("Valve Schedule", type=["csv", "xlsx"])
+
+    if schedule_upload is not None:
+        # Validate each upload once per price list and currency, not on every rerun
+        schedule_key = (schedule_upload.file_id, version.name, currency)
+        if st.session_state.get('schedule', (None,))[0] != schedule_key:
             try:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmpfile:
-                    tmpfile.write(st.session_state.logo_bytes)
-                    self.image(tmpfile.name, 10, 8, 25)
-                os.unlink(tmpfile.name)
-            except:
-                pass
-        self.set_font('Arial', 'B', 16)
-        self.cell(0, 10, st.session_state.proposal_name, 0, 1, 'C')
-        self.set_font('Arial', '', 12)
-        self.cell(0, 10, f'Prepared for: {st.session_state.client_name}', 0, 1, 'C')
-        self.cell(0, 10, f'Date: {st.session_state.proposal_date}', 0, 1, 'C')
-        self.ln(10)
-    
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-def generate_proposal_pdf():
-    pdf = PDF()
-    pdf.add_page()
-    
-    # Add title
-    pdf.set_font('Arial', 'B', 14)
-    pdf.cell(0, 10, 'Valve Configuration Proposal', 0, 1, 'C')
-    pdf.ln(5)
-    
-    # Add client info
-    pdf.set_font('Arial', '', 12)
-    pdf.cell(0, 10, f'Client: {st.session_state.client_name}', 0, 1)
-    pdf.cell(0, 10, f'Proposal Date: {st.session_state.proposal_date}', 0, 1)
-    pdf.cell(0, 10, f'Prepared By: VASTAŞ Valve Solutions', 0, 1)
-    pdf.ln(10)
-    
-    # Add valve configurations
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(0, 10, 'Valve Configurations', 0, 1)
-    pdf.ln(5)
-    
-    # Create table headers
-    col_widths = [40, 30, 25, 25, 25, 25, 30]
-    headers = ['Description', 'Size', 'Material', 'Actuator', 'Fail Mode', 'Qty', 'Price (€)']
-    
-    pdf.set_font('Arial', 'B', 10)
-    for i, header in enumerate(headers):
-        pdf.cell(col_widths[i], 10, header, 1, 0, 'C')
-    pdf.ln()
-    
-    # Add valve items
-    pdf.set_font('Arial', '', 10)
-    total_price = 0
-    for item in st.session_state.proposal_items:
-        description = f"{item['size']} {item['type']} Valve"
-        material = item['body_material']
-        pdf.cell(col_widths[0], 10, description, 1)
-        pdf.cell(col_widths[1], 10, item['size'], 1)
-        pdf.cell(col_widths[2], 10, material, 1)
-        pdf.cell(col_widths[3], 10, item['actuator_type'], 1)
-        pdf.cell(col_widths[4], 10, item['fail_mode'], 1)
-        pdf.cell(col_widths[5], 10, str(item['quantity']), 1)
-        pdf.cell(col_widths[6], 10, f"{item['total_price']:,.2f}", 1)
-        pdf.ln()
-        total_price += item['total_price']
-    
-    # Add total
-    pdf.set_font('Arial', 'B', 10)
-    pdf.cell(sum(col_widths[:-1]), 10, 'TOTAL:', 1, 0, 'R')
-    pdf.cell(col_widths[-1], 10, f"{total_price:,.2f}", 1, 1)
-    
-    # Add notes
-    pdf.ln(10)
-    pdf.set_font('Arial', 'I', 10)
-    pdf.multi_cell(0, 5, 'Notes: Prices are in Euros (€). Delivery time is 8-12 weeks from order confirmation. Prices valid for 30 days.')
-    
-    # Save to bytes buffer
-    pdf_bytes = BytesIO(pdf.output(dest='S').encode('latin1'))
-    pdf_bytes.seek(0)
-    return pdf_bytes
+                records = read_schedule(schedule_upload, schedule_upload.name)
+            except ScheduleError as e:
+                st.session_state.schedule = (schedule_key, [], [(None, str(e))])
+            else:
+                st.session_state.schedule = (schedule_key,
+                                             *validate_schedule(records, price_db, material_db, rules))
+        _, schedule_valves, schedule_errors = st.session_state.schedule
+
+        st.markdown(f"**{len(schedule_valves)}** valid rows, **{len(schedule_errors)}** problems")
+        if schedule_errors:
+            with st.expander("Validation problems"):
+                st.dataframe([{'Row': row, 'Problem': problem} for row, problem in schedule_errors],
+                             use_container_width=True)
+        as_revision = bool(st.session_state.proposal_items) and st.checkbox(
+            "Import as a revision of the current proposal",
+            help="Price only the lines that differ from the proposal, and review the price changes before "
+                 "applying them. Lines are matched by tag, else by configuration.")
+        if schedule_valves and st.button("Price and Render Schedule"):
+            revision = diff_quotes(st.session_state.proposal_items, schedule_valves) if as_revision else None
+            st.session_state.import_job = ImportJob(revision.to_price if revision else schedule_valves,
+                                                    price_db, material_db).start()
+            st.session_state.import_revision = revision
+            st.session_state.import_pricing = {'currency': currency, 'price_version': version.name}
+
+    job = st.session_state.get('import_job')
+    revision = st.session_state.get('import_revision')
+    if revision is not None and not revision.is_current(st.session_state.proposal_items):
+        # Lines were edited or removed since the schedule was compared with them
+        job.cancel()
+        del st.session_state.import_job, st.session_state.import_revision
+        job = None
+        st.warning("The proposal changed since the schedule was compared with it. "
+                   "Price the schedule again to revise the proposal.")
+    if job is not None:
+        st.divider()
+        if not job.done and st.button("Cancel Import"):
+            job.cancel()
+        progress_bar = st.progress(job.progress)
+        status = st.empty()
+        partial_results = st.empty()
+
+        pricing = st.session_state.get('import_pricing', {})
+        import_currency = pricing.get('currency', currency)
+        # Imported valves join the proposal in its current currency, converted
+        # from the one they were priced in if it changed since, as the items were
+        rate = rates.rate(import_currency, currency)
+
+        def as_item(valve):
+            return {**valve, **pricing, 'total_price': valve['total_price'] * rate, 'currency': currency}
+
+        def show_import_results():
+            results = job.results()
+            progress_bar.progress(job.progress)
+            state = "Cancelled" if job.cancelled else "Finished" if job.done else "Running"
+            status.markdown(f"{state}: {len(results)} of {job.total} valves priced, "
+                            f"{len(job.figures)} figures rendered, {len(job.errors)} errors")
+            partial_results.dataframe([
+                {'Row': valve['row'], 'Tag': valve['tag'],
+                 'Description': f"{valve['size']} {valve['type']} Valve",
+                 'Qty': valve['quantity'], f"Total Price ({currency_symbol(import_currency)})": valve['total_price']}
+                for valve in results[:IMPORT_PREVIEW_ROWS]
+            ], use_container_width=True)
+            return results
+
+        # Poll until the job finishes; any interaction reruns the script
+        # and ends this loop, so the page stays responsive.
+        results = show_import_results()
+        while not job.done:
+            time.sleep(0.5)
+            results = show_import_results()
+
+        if job.failure:
+            st.error(f"Import failed: {job.failure}")
+        for row, error in job.errors:
+            st.error(f"Row {row}: {error}")
+        col1, col2 = st.columns(2)
+        if revision is not None:
+            # Repriced lines by schedule row; the rest keep their quoted prices
+            priced = {valve['row']: as_item(valve) for valve in results}
+            revision = revision.merge([priced.get(valve['row']) for valve in revision.to_price])
+            counts = revision.counts
+            st.subheader("Revision")
+            st.markdown(f"**{counts[CHANGED]}** changed, **{counts[ADDED]}** added, **{counts[REMOVED]}** removed "
+                        f"and **{counts[UNCHANGED]}** unchanged lines. Total change: "
+                        f"**{format_money(revision.price_delta, currency)}**")
+            redline = revision.redline()
+            if redline:
+                st.dataframe(redline[:IMPORT_PREVIEW_ROWS], use_container_width=True, hide_index=True)
+                st.download_button("Download Redline (CSV)",
+                                   b''.join(iter_proposal_csv(redline, columns=REDLINE_COLUMNS)),
+                                   file_name=f"{st.session_state.proposal_name}_redline.csv", mime='text/csv')
+            with col1:
+                if job.done and not job.cancelled and st.button("Apply Revision"):
+                    written = revision.apply(st.session_state.proposal_items)
+                    for change in revision:
+                        if change.status == ADDED and change.new_price is not None:
+                            metrics.count('valves_quoted_total', type=change.new['type'], size=change.new['size'])
+                    for key, png in job.figures.items():
+                        figure_cache.put(key, png)
+                    del st.session_state.import_job, st.session_state.import_revision
+                    st.success(f"Applied the revision: {written} items updated")
+        with col1:
+            if revision is None and results and st.button(f"Add {len(results)} Valves to Proposal"):
+                for valve in results:
+                    st.session_state.proposal_items.add(as_item(valve))
+                    metrics.count('valves_quoted_total', type=valve['type'], size=valve['size'])
+                for key, png in job.figures.items():
+                    figure_cache.put(key, png)
+                del st.session_state.import_job
+                st.success(f"Added {len(results)} valves to the proposal")
+        with col2:
+            if st.button("Discard Import"):
+                job.cancel()
+                del st.session_state.import_job
+                st.session_state.pop('import_revision', None)
+                st.rerun()
+
+def explorer_page(version, price_db, material_db, currency):
+    """Search of every configuration for the cheapest, or those nearest a budget."""
+    st.header("Configuration Explorer")
+    st.markdown("Search every size, rating, actuator and material combination for the cheapest "
+                "configurations, or those nearest a budget. Leave a filter empty to allow every option.")
+    filters = {}
+    filter_cols = st.columns(4)
+    for i, (field, label, table) in enumerate(EXPLORER_FILTERS):
+        options = list(price_db[table] if table in price_db else material_db[table])
+        with filter_cols[i % 4]:
+            filters[field] = st.multiselect(label, options, key=f"explore_{field}")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        explore_accessories = st.multiselect("Accessories", list(price_db['Accessories']),
+                                             key="explore_accessories")
+    with col2:
+        explore_mode = st.radio("Find", ["Cheapest", "Nearest to budget"], key="explore_mode")
+    with col3:
+        explore_budget = st.number_input(f"Budget per valve ({currency_symbol(currency)}, 0 for none)", min_value=0.0,
+                                         value=0.0, step=500.0, key="explore_budget")
+    with col4:
+        explore_count = st.number_input("Results", min_value=1, max_value=200, value=10, key="explore_count")
+
+    if st.button("Search Configurations"):
+        from valvefigure.explorer import CHEAPEST, NEAREST
+
+        if explore_mode == "Nearest to budget" and not explore_budget:
+            st.warning("Enter a budget to search for the nearest configurations")
+        else:
+            cube = get_price_cube(version.name, currency, price_db, material_db)
+            cube.sync(price_db, material_db)
+            start = time.perf_counter()
+            results = cube.query(filters, explore_accessories, k=int(explore_count),
+                                 mode=NEAREST if explore_mode == "Nearest to budget" else CHEAPEST,
+                                 budget=explore_budget or None)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            st.caption(f"Searched {cube.size:,} configurations in {elapsed_ms:.1f} ms")
+            if not results:
+                st.info("No configuration matches these filters within the budget.")
+            else:
+                st.dataframe([
+                    {**{label: result[field] for field, label, _ in EXPLORER_FILTERS},
+                     f"Unit Price ({currency_symbol(currency)})": f"{result['unit_price']:,.2f}"}
+                    for result in results
+                ], use_container_width=True, hide_index=True)
 
 # ========================
 # STREAMLIT UI
 # ========================
 def main():
+    rerun_start = time.perf_counter()
     st.set_page_config(
         page_title="VASTAŞ Valve Configurator",
         page_icon="🔧",
@@ -279,61 +924,39 @@ def main():
     )
     
     # Custom CSS
-    st.markdown("""
-        <style>
-        .stApp {
-            background-color: #f0f2f6;
-        }
-        .block-container {
-            padding-top: 1rem;
-        }
-        .stTabs [data-baseweb="tab-list"] {
-            gap: 10px;
-        }
-        .stTabs [data-baseweb="tab"] {
-            height: 50px;
-            padding: 15px 25px;
-            border-radius: 10px 10px 0 0;
-            font-size: 18px;
-        }
-        .stTabs [aria-selected="true"] {
-            background-color: #1f77b4;
-            color: white;
-        }
-        .stButton button {
-            width: 100%;
-            font-weight: bold;
-            font-size: 18px;
-        }
-        .config-card {
-            background-color: white;
-            border-radius: 10px;
-            padding: 20px;
-            margin-bottom: 20px;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        }
-        .price-display {
-            font-size: 24px;
-            font-weight: bold;
-            color: #1f77b4;
-            text-align: center;
-            padding: 15px;
-            border: 2px solid #1f77b4;
-            border-radius: 10px;
-            margin: 20px 0;
-        }
-        .material-item {
-            padding: 10px;
-            margin: 5px 0;
-            border-radius: 5px;
-            border-left: 4px solid #1f77b4;
-            background-color: #e6f0ff;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(APP_CSS, unsafe_allow_html=True)
+    keep_widget_state()
     
-    # Load price database
-    price_db = load_price_database()
+    # Load price lists and exchange rates
+    price_lists = current_price_lists()
+    rates = current_rates(price_lists)
+    figure_cache = get_figure_cache()
+    rules = get_rules()
+    export_queue = get_export_queue()
+    if metrics.ENABLED:
+        start_metrics(figure_cache, export_queue)
+        metrics.session_seen(get_script_run_ctx().session_id)
+    # Where each export's progress or download is shown: {kind: st.empty()}
+    export_slots = {}
+    store = get_proposal_store()
+    if store is not None:
+        open_session_proposal(store)
+    st.session_state.setdefault('currency', price_lists.currency)
+    if st.session_state.currency not in rates.currencies:
+        st.warning(f"No exchange rate for {st.session_state.currency}; "
+                   f"prices are now in {price_lists.currency}")
+        st.session_state.currency = price_lists.currency
+        reprice_proposal(price_lists, rates, price_lists.currency)
+
+    # Prices in force on the proposal date, in the proposal's currency
+    version = price_lists.effective_on(st.session_state.proposal_date)
+    if len(price_lists) > 1:
+        with st.sidebar:
+            version = price_lists.get(st.selectbox(
+                "Price List", price_lists.names, index=price_lists.names.index(version.name),
+                help="Defaults to the price list in force on the proposal date"))
+    currency = st.session_state.currency
+    price_db, material_db = price_lists.tables(version, currency, rates)
     
     # Sidebar - Logo and Actions
     with st.sidebar:
@@ -341,8 +964,16 @@ def main():
         logo_upload = st.file_uploader("Upload Company Logo", type=["png", "jpg", "jpeg"])
         
         if logo_upload is not None:
-            st.session_state.logo_bytes = logo_upload.getvalue()
-            st.image(st.session_state.logo_bytes, caption="Your Logo", use_column_width=True)
+            try:
+                prepare_logo(logo_upload.getvalue())
+            except LogoError as e:
+                st.session_state.pop('logo_bytes', None)
+                st.error(str(e))
+            else:
+                st.session_state.logo_bytes = logo_upload.getvalue()
+                st.image(st.session_state.logo_bytes, caption="Your Logo", use_column_width=True)
+        elif st.session_state.get('logo_bytes'):
+            st.image(st.session_state.logo_bytes, caption="Saved Logo", use_column_width=True)
         else:
             st.image("https://via.placeholder.com/300x100?text=VASTAŞ+Logo", caption="Default Logo", use_column_width=True)
             
@@ -357,221 +988,78 @@ def main():
                 
         if st.button("Clear All Configurations"):
             st.session_state.valves = []
-            st.session_state.proposal_items = []
+            st.session_state.proposal_items.clear()
             st.success("All configurations cleared")
             
         st.divider()
         st.subheader("Proposal Info")
         st.session_state.proposal_name = st.text_input("Proposal Name", st.session_state.proposal_name)
         st.session_state.client_name = st.text_input("Client Name", st.session_state.client_name)
-        st.session_state.proposal_date = st.date_input("Proposal Date").strftime("%Y-%m-%d")
+        st.session_state.proposal_date = st.date_input(
+            "Proposal Date", datetime.strptime(st.session_state.proposal_date, "%Y-%m-%d")).strftime("%Y-%m-%d")
+        if len(rates.currencies) > 1:
+            st.selectbox("Currency", rates.currencies, key='currency', on_change=change_currency,
+                         args=(price_lists, rates, version),
+                         help="Changing the currency reprices every proposal item")
+        if store is not None and proposal_worth_saving(store):
+            store.save_meta(st.session_state.proposal_id,
+                            name=st.session_state.proposal_name,
+                            client_name=st.session_state.client_name,
+                            date=st.session_state.proposal_date,
+                            valves=st.session_state.valves,
+                            logo=st.session_state.get('logo_bytes'),
+                            currency=st.session_state.currency)
+            if store.last_error is not None:
+                st.warning(f"Proposal changes could not be saved: {store.last_error}")
         
+        include_figures = st.checkbox("Include valve figures", value=True)
         if st.button("Generate Proposal PDF"):
             if st.session_state.proposal_items:
-                pdf_bytes = generate_proposal_pdf()
-                st.sidebar.download_button(
-                    label="Download Proposal",
-                    data=pdf_bytes,
-                    file_name=f"{st.session_state.proposal_name.replace(' ', '_')}.pdf",
-                    mime="application/pdf"
-                )
+                st.session_state.exports[PDF] = export_queue.submit(
+                    PDF, current_proposal(), figures=include_figures, material_db=version.material_db)
             else:
                 st.warning("No items in proposal")
-    
-    # Main Tabs
-    tab1, tab2, tab3, tab4 = st.tabs([
-        "⚙️ System Requirements", 
-        "🛠️ Material Selection", 
-        "💰 Pricing", 
-        "📄 Proposal"
-    ])
-    
-    # Tab 1: System Requirements
-    with tab1:
-        st.header("System Requirements")
-        with st.form("system_requirements_form"):
+        export_slots[PDF] = st.empty()
+
+        if store is not None:
+            st.divider()
+            st.subheader("Saved Proposals")
+            st.button("New Proposal", on_click=switch_proposal)
+            search_client = st.text_input("Search by Client")
             col1, col2 = st.columns(2)
             with col1:
-                st.subheader("Operating Conditions")
-                op_pressure = st.number_input("Operating Pressure (bar)", min_value=0.0, max_value=1000.0, value=50.0, step=1.0)
-                op_temp = st.number_input("Operating Temperature (°C)", min_value=-200.0, max_value=1000.0, value=150.0, step=1.0)
-                fluid_type = st.selectbox("Fluid Type", ["Water", "Steam", "Oil", "Gas", "Chemical", "Cryogenic"])
-                
+                date_from = st.date_input("From", value=None)
             with col2:
-                st.subheader("Valve Specifications")
-                valve_size = st.selectbox("Valve Size", list(price_db['Valve Size'].keys()))
-                pressure_rating = st.selectbox("Pressure Rating", list(price_db['Pressure Rating'].keys()))
-                valve_type = st.selectbox("Valve Type", ["Ball", "Globe", "Butterfly", "Gate", "Check"])
-                fail_mode = st.selectbox("Fail Safe Mode", ["Fail to Close", "Fail to Open", "Fail in Position"])
-                actuator_type = st.selectbox("Actuator Type", list(price_db['Actuator Type'].keys()))
-            
-            st.subheader("Additional Requirements")
-            accessories = st.multiselect("Accessories", list(price_db['Accessories'].keys()))
-            quantity = st.number_input("Quantity", min_value=1, max_value=100, value=1, step=1)
-            notes = st.text_area("Special Requirements or Notes")
-            
-            if st.form_submit_button("Save Requirements"):
-                st.session_state.current_valve.update({
-                    'op_pressure': op_pressure,
-                    'op_temp': op_temp,
-                    'fluid_type': fluid_type,
-                    'size': valve_size,
-                    'pressure_rating': pressure_rating,
-                    'type': valve_type,
-                    'fail_mode': fail_mode,
-                    'actuator_type': actuator_type,
-                    'accessories': accessories,
-                    'quantity': quantity,
-                    'notes': notes
-                })
-                st.success("System requirements saved!")
+                date_to = st.date_input("To", value=None)
+            for summary in store.search(search_client.strip(),
+                                        date_from and date_from.isoformat(),
+                                        date_to and date_to.isoformat(), limit=20):
+                label = (f"{summary.date} · {summary.client_name or 'No client'} · {summary.name} "
+                         f"({summary.item_count} items, {format_money(summary.total_price, summary.currency)})")
+                if summary.id == st.session_state.proposal_id:
+                    st.caption(f"Open: {label}")
+                else:
+                    st.button(label, key=f"open_{summary.id}", on_click=switch_proposal, args=(summary.id,))
     
-    # Tab 2: Material Selection
-    with tab2:
-        st.header("Material Selection")
-        
-        if not st.session_state.current_valve:
-            st.warning("Please complete System Requirements first")
-            st.stop()
-            
-        col1, col2 = st.columns([1, 2])
-        
-        with col1:
-            st.subheader("Material Options")
-            body_material = st.selectbox("Body/Bonnet Material", list(MATERIAL_DB['Body/Bonnet'].keys()))
-            ball_material = st.selectbox("Ball Material", list(MATERIAL_DB['Ball'].keys()))
-            stem_material = st.selectbox("Stem Material", list(MATERIAL_DB['Stem'].keys()))
-            seat_material = st.selectbox("Seat Material", list(MATERIAL_DB['Seat'].keys()))
-            trim_type = st.selectbox("Trim Type", list(MATERIAL_DB['Trim'].keys()))
-            
-            if st.button("Save Materials"):
-                st.session_state.current_valve.update({
-                    'body_material': body_material,
-                    'ball_material': ball_material,
-                    'stem_material': stem_material,
-                    'seat_material': seat_material,
-                    'trim_type': trim_type
-                })
-                st.success("Material selection saved!")
-                
-            st.divider()
-            st.subheader("Material Summary")
-            st.markdown(f"<div class='material-item'>Body: {body_material}</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='material-item'>Ball: {ball_material}</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='material-item'>Stem: {stem_material}</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='material-item'>Seat: {seat_material}</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='material-item'>Trim: {trim_type}</div>", unsafe_allow_html=True)
-        
-        with col2:
-            st.subheader("Valve Configuration")
-            # Generate valve image
-            valve_img = generate_valve_figure({
-                'size': st.session_state.current_valve.get('size', '2"'),
-                'pressure_rating': st.session_state.current_valve.get('pressure_rating', '150#'),
-                'body_material': body_material,
-                'ball_material': ball_material,
-                'stem_material': stem_material,
-                'actuator_type': st.session_state.current_valve.get('actuator_type', 'Pneumatic')
-            })
-            
-            st.image(valve_img, caption="Valve Configuration", use_column_width=True)
-            
-            # Material colors key
-            st.subheader("Material Color Key")
-            col_col1, col_col2 = st.columns(2)
-            for i, (material_type, materials) in enumerate(MATERIAL_DB.items()):
-                cols = col_col1 if i % 2 == 0 else col_col2
-                with cols:
-                    st.markdown(f"**{material_type}**")
-                    for mat, props in materials.items():
-                        st.markdown(
-                            f"<div style='background-color:{props['color']}; padding:5px; margin:2px; border-radius:5px;'>"
-                            f"{mat} - €{props['price']}"
-                            f"</div>", 
-                            unsafe_allow_html=True
-                        )
-    
-    # Tab 3: Pricing
-    with tab3:
-        st.header("Pricing")
-        
-        if not st.session_state.current_valve or 'body_material' not in st.session_state.current_valve:
-            st.warning("Please complete Material Selection first")
-            st.stop()
-            
-        # Calculate price
-        price_data = calculate_valve_price(st.session_state.current_valve, price_db)
-        
-        if price_data:
-            col1, col2, col3 = st.columns([1, 2, 1])
-            
-            with col2:
-                st.markdown(f"<div class='price-display'>Total Price: €{price_data['total_price']:,.2f}</div>", unsafe_allow_html=True)
-                
-                # Price breakdown
-                st.subheader("Price Breakdown")
-                st.markdown(f"- **Base Valve Price**: €{price_data['base_price']:,.2f}")
-                st.markdown(f"- **Pressure Multiplier ({st.session_state.current_valve['pressure_rating']})**: x{price_data['pressure_multiplier']:.2f}")
-                st.markdown(f"- **Material Costs**: €{price_data['material_cost']:,.2f}")
-                st.markdown(f"- **Actuator ({st.session_state.current_valve['actuator_type']})**: €{price_data['actuator_cost']:,.2f}")
-                st.markdown(f"- **Accessories**: €{price_data['accessories_cost']:,.2f}")
-                st.markdown(f"- **Quantity**: {st.session_state.current_valve['quantity']}")
-                
-                # Add to proposal button
-                if st.button("Add to Proposal"):
-                    valve_with_price = st.session_state.current_valve.copy()
-                    valve_with_price['total_price'] = price_data['total_price']
-                    st.session_state.proposal_items.append(valve_with_price)
-                    st.success("Added to proposal!")
-    
-    # Tab 4: Proposal
-    with tab4:
-        st.header("Proposal Summary")
-        
-        if not st.session_state.proposal_items:
-            st.info("No items in proposal yet. Add valves from the Pricing tab.")
-            st.stop()
-            
-        # Display proposal items
-        st.subheader("Valves in Proposal")
-        for i, item in enumerate(st.session_state.proposal_items):
-            with st.expander(f"Valve {i+1}: {item['size']} {item['type']} Valve - €{item['total_price']:,.2f}"):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("**Configuration**")
-                    st.markdown(f"- Size: {item['size']}")
-                    st.markdown(f"- Pressure Rating: {item['pressure_rating']}")
-                    st.markdown(f"- Type: {item['type']}")
-                    st.markdown(f"- Fail Mode: {item['fail_mode']}")
-                    st.markdown(f"- Actuator: {item['actuator_type']}")
-                    
-                with col2:
-                    st.markdown("**Materials**")
-                    st.markdown(f"- Body: {item['body_material']}")
-                    st.markdown(f"- Ball: {item['ball_material']}")
-                    st.markdown(f"- Stem: {item['stem_material']}")
-                    st.markdown(f"- Seat: {item['seat_material']}")
-                    st.markdown(f"- Trim: {item['trim_type']}")
-                
-                st.markdown("**Pricing**")
-                st.markdown(f"- Quantity: {item['quantity']}")
-                st.markdown(f"- Total Price: €{item['total_price']:,.2f}")
-                
-                if st.button(f"Remove Valve {i+1}", key=f"remove_{i}"):
-                    st.session_state.proposal_items.pop(i)
-                    st.experimental_rerun()
-        
-        # Proposal total
-        total_price = sum(item['total_price'] for item in st.session_state.proposal_items)
-        st.subheader(f"Proposal Total: €{total_price:,.2f}")
-        
-        # Export buttons
-        st.download_button(
-            label="Export Proposal to Excel",
-            data=pd.DataFrame(st.session_state.proposal_items).to_csv(index=False).encode('utf-8'),
-            file_name=f"{st.session_state.proposal_name.replace(' ', '_')}.csv",
-            mime="text/csv"
-        )
+    # Only the selected page runs
+    page = select_page()
+    with metrics.timer('tab_render_seconds', tab=page):
+        if page == 'requirements':
+            requirements_page(price_db, rules)
+        elif page == 'materials':
+            materials_page(material_db, version, currency, rules, figure_cache)
+        elif page == 'pricing':
+            pricing_page(price_db, material_db, version, currency, rules)
+        elif page == 'proposal':
+            proposal_page(price_db, material_db, price_lists, rates, version, currency, export_queue, export_slots)
+        elif page == 'batch_import':
+            batch_import_page(price_db, material_db, rates, version, currency, rules, figure_cache)
+        else:
+            explorer_page(version, price_db, material_db, currency)
+
+    # Up to here the page is drawn; polling the exports is waiting, not work
+    metrics.observe('rerun_seconds', time.perf_counter() - rerun_start)
+    poll_exports(export_slots)
 
 if __name__ == "__main__":
     main()
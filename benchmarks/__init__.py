@@ -0,0 +1 @@
+"""Benchmarks for the valve configurator hot paths (run with ``python -m``)."""
@@ -0,0 +1,268 @@
+"""Regression checks of behaviour the benchmarks exercise but do not verify.
+
+Each check runs the headless core on a small synthetic input and fails with
+a message when a past bug comes back::
+
+    python -m benchmarks.checks                  # every check
+    python -m benchmarks.checks --checks schedule_quantity
+
+The exit status is 1 when a check failed.
+"""
+
+import argparse
+import math
+import re
+import sys
+import traceback
+
+
+class CheckFailed(AssertionError):
+    """A check found the behaviour it guards against."""
+
+
+def _schedule_records(valves):
+    """Schedule rows for ``valves``, as :func:`valvefigure.rfq.read_schedule` returns them."""
+    from valvefigure.rfq import SCHEDULE_COLUMNS
+
+    records = []
+    for row_no, valve in enumerate(valves, start=2):
+        row = {name: valve.get(name) for name in SCHEDULE_COLUMNS}
+        row['accessories'] = ';'.join(valve['accessories'])
+        records.append((row_no, {name: '' if value is None else str(value) for name, value in row.items()}))
+    return records
+
+
+def check_schedule_quantity():
+    """A schedule line over the configurator's quantity limit is rejected.
+
+    The Proposal page edits each line's quantity with an input bounded by
+    ``MAX_QUANTITY``, and Streamlit refuses to draw one whose value is
+    outside its bounds, so importing such a line broke the page for good.
+    """
+    from benchmarks.synthetic import synthetic_valves
+    from valvefigure.pricing import MATERIAL_DB, MAX_QUANTITY, load_price_database
+    from valvefigure.rfq import validate_schedule
+
+    price_db = load_price_database()
+    valves = list(synthetic_valves(3, price_db=price_db))
+    for valve, quantity in zip(valves, (1, MAX_QUANTITY, MAX_QUANTITY + 50)):
+        valve['quantity'] = quantity
+    valid, errors = validate_schedule(_schedule_records(valves), price_db, MATERIAL_DB)
+    if [valve['quantity'] for valve in valid] != [1, MAX_QUANTITY]:
+        raise CheckFailed(f"valid quantities are {[valve['quantity'] for valve in valid]}")
+    if [row_no for row_no, _ in errors] != [4]:
+        raise CheckFailed(f"schedule problems are {errors}")
+
+
+def check_stale_revision():
+    """A revision is not applied to a proposal edited since it was diffed.
+
+    The app diffs a schedule against the proposal when it starts pricing it
+    and applies the result on a later rerun; lines removed meanwhile made
+    the apply fail half way, with its first lines already written.
+    """
+    from benchmarks.synthetic import synthetic_valves
+    from valvefigure.items import ProposalItems
+    from valvefigure.revisions import RevisionError, diff_quotes
+
+    valves = list(synthetic_valves(4))
+    items = ProposalItems(valves)
+    revised = [{**valve, 'quantity': valve['quantity'] % 100 + 1} for valve in valves]
+    diff = diff_quotes(items, revised).merge(revised)
+    before = [item.digest for item in items]
+    items.remove(next(reversed(list(items))).item_id)
+    before.pop()
+    try:
+        diff.apply(items)
+    except RevisionError:
+        pass
+    else:
+        raise CheckFailed("a revision was applied to an edited proposal")
+    if [item.digest for item in items] != before:
+        raise CheckFailed("a refused revision changed the proposal")
+    items = ProposalItems(valves)
+    written = diff_quotes(items, revised).merge(revised).apply(items)
+    if written != len(valves) or [item['quantity'] for item in items] != [v['quantity'] for v in revised]:
+        raise CheckFailed(f"a current revision wrote {written} items")
+
+
+def check_xlsx_breakdown():
+    """The Excel Price Breakdown agrees with the prices items were quoted at.
+
+    Items keep the price list version and currency they were priced with,
+    while the session may since have moved to others; breaking them down
+    with the session's tables contradicted their total prices.
+    """
+    from io import BytesIO
+
+    from openpyxl import load_workbook
+
+    from benchmarks.synthetic import synthetic_valves
+    from valvefigure.currency import RateTable
+    from valvefigure.export import write_proposal_xlsx
+    from valvefigure.pricelists import PriceLists
+    from valvefigure.pricing import MATERIAL_DB, calculate_valve_price, load_price_database
+    from valvefigure.proposal import Proposal
+
+    price_lists = PriceLists('EUR')
+    old = price_lists.add_version('2026-01-01', load_price_database(), MATERIAL_DB)
+    new = price_lists.add_changes('2026-04-01',
+                                  {'Valve Size': {size: 99_999 for size in old.price_db['Valve Size']}})
+    rates = RateTable({'EUR': 1.0, 'USD': 1.08})
+    pinned = [(old, 'EUR'), (old, 'USD'), (new, 'USD')]
+    items = []
+    for valve, (version, currency) in zip(synthetic_valves(len(pinned)), pinned):
+        total_price = calculate_valve_price(valve, *price_lists.tables(version, currency, rates))['total_price']
+        items.append({**valve, 'total_price': total_price, 'currency': currency, 'price_version': version.name})
+    price_tables = {}
+    for version, currency in pinned[:-1]:
+        price_tables.setdefault(version.name, {})[currency] = price_lists.tables(version, currency, rates)
+
+    buffer = BytesIO()
+    proposal = Proposal(items=items, currency='USD')
+    write_proposal_xlsx(proposal, buffer, *price_lists.tables(new, 'USD', rates), price_tables=price_tables)
+    rows = list(load_workbook(buffer)['Price Breakdown'].iter_rows(values_only=True))
+    header, rows = rows[0], rows[1:]
+    totals = [row[header.index('Total Price ($)')] for row in rows]
+    notes = [row[header.index('Missing Price Data')] for row in rows]
+    agree = all(total is not None and math.isclose(total, item['total_price'])
+                for total, item in zip(totals[:2], items))
+    if not agree or notes[:2] != [None, None]:
+        raise CheckFailed(f"breakdown totals {totals[:2]} for item totals {[i['total_price'] for i in items[:2]]}")
+    if totals[2] is not None or not notes[2]:
+        raise CheckFailed("an item priced with tables not given was broken down with others")
+
+
+def _pdf_objects(data):
+    """``{number: dictionary text}`` of every object of the PDF ``data``,
+    found through its cross-reference table as a reader finds them."""
+    start = int(re.search(rb'startxref\s+(\d+)', data[-64:]).group(1))
+    match = re.match(rb'xref\s+0 (\d+)\s+', data[start:])
+    if match is None:
+        raise CheckFailed("no cross-reference table at startxref")
+    entries = data[start + match.end():].split(b'\n', int(match.group(1)))
+    objects = {}
+    for number, entry in enumerate(entries[:int(match.group(1))]):
+        offset, _, kind = entry.split()[:3]
+        if kind != b'n':
+            continue
+        head = f'{number} 0 obj'.encode()
+        offset = int(offset)
+        if not data.startswith(head, offset):
+            raise CheckFailed(f"object {number} is not at its cross-reference offset {offset}")
+        end = data.index(b'endobj', offset)
+        # Stream data is binary; only the dictionary before it is text
+        objects[number] = data[offset + len(head):end].split(b'stream', 1)[0].decode('latin1')
+    return objects
+
+
+def check_pdf_figure_forms():
+    """Both proposal PDF renderers write figure forms a reader can resolve.
+
+    The in-memory renderer extends private FPDF methods to embed the forms,
+    so a different FPDF would write objects and references that no longer
+    match; every reference, and the font each form's labels use, must
+    resolve to objects of the right kind.
+    """
+    from benchmarks.synthetic import synthetic_proposal
+    from valvefigure.pdfstream import iter_proposal_pdf
+    from valvefigure.proposal import generate_proposal_pdf
+
+    proposal = synthetic_proposal(12)
+    for renderer, data in [('fpdf', generate_proposal_pdf(proposal, figures=True).getvalue()),
+                           ('stream', b''.join(iter_proposal_pdf(proposal, figures=True)))]:
+        objects = _pdf_objects(data)
+        for number, text in objects.items():
+            for ref in re.findall(r'(\d+) 0 R', text):
+                if int(ref) not in objects:
+                    raise CheckFailed(f"{renderer}: object {number} refers to missing object {ref}")
+        forms = {number: text for number, text in objects.items() if '/Subtype /Form' in text}
+        if not forms:
+            raise CheckFailed(f"{renderer}: no figure forms")
+        for number, text in forms.items():
+            resources = re.search(r'/Resources (\d+ 0 R|<<.*?>> >>)', text).group(1)
+            if resources.endswith(' R'):
+                resources = objects[int(resources.split()[0])]
+            fonts = re.findall(r'/F\d+ (\d+) 0 R', resources)
+            if not fonts or any('/Type /Font' not in objects[int(font)] for font in fonts):
+                raise CheckFailed(f"{renderer}: the labels of form {number} have no font")
+            if not re.search(rf'/Fig\w+ {number} 0 R', ''.join(objects.values())):
+                raise CheckFailed(f"{renderer}: form {number} is not in any resource dictionary")
+
+
+def check_store_read_through():
+    """Loading a proposal reads its unwritten changes without writing them.
+
+    Loads flushed the write-behind queue first, so opening a proposal made
+    the script thread wait for the database, for as long as another
+    process held its write lock.
+    """
+    import os
+    import sqlite3
+    import tempfile
+
+    from benchmarks.synthetic import synthetic_valves
+    from valvefigure.items import ProposalItems
+    from valvefigure.store import ProposalStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'proposals.db')
+        store = ProposalStore(path, flush_interval=3600)
+        try:
+            items = ProposalItems()
+            store.track('p1', items)
+            store.save_meta('p1', name='Check', client_name='ACME', valves=[])
+            for valve in synthetic_valves(6):
+                items.add(valve)
+            store.flush()
+            # Changes after the flush stay queued
+            store.save_meta('p1', name='Revised')
+            ids = [item.item_id for item in items]
+            items.remove(ids[1])
+            items.update(ids[2], quantity=99)
+            items.add(next(synthetic_valves(1)))
+            items.reorder(reversed([item.item_id for item in items]))
+            meta = store.load_meta('p1')
+            loaded = store.load_items('p1')
+            written = sqlite3.connect(path).execute("SELECT name FROM proposals WHERE id = 'p1'").fetchone()
+        finally:
+            store.close()
+    if written != ('Check',):
+        raise CheckFailed(f"loading wrote the queued changes: the database has {written}")
+    if (meta['name'], meta['client_name']) != ('Revised', 'ACME'):
+        raise CheckFailed(f"loaded metadata {meta}")
+    if [(item.item_id, item.digest) for item in loaded] != [(item.item_id, item.digest) for item in items]:
+        raise CheckFailed("loaded items differ from the proposal's")
+
+
+CHECKS = {
+    'schedule_quantity': check_schedule_quantity,
+    'stale_revision': check_stale_revision,
+    'xlsx_breakdown': check_xlsx_breakdown,
+    'pdf_figure_forms': check_pdf_figure_forms,
+    'store_read_through': check_store_read_through,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checks', nargs='+', choices=list(CHECKS), default=list(CHECKS))
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for name in args.checks:
+        try:
+            CHECKS[name]()
+        except Exception as error:
+            failures += 1
+            print(f"FAIL  {name}: {error}")
+            if not isinstance(error, CheckFailed):
+                traceback.print_exc()
+        else:
+            print(f"ok    {name}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Import-time report and check for the Streamlit entry point's startup imports.
+
+Runs the module-level imports of ``app_valvefigure1.py`` in a fresh
+interpreter under ``-X importtime`` and reports what they cost on top of
+``import streamlit``, which every Streamlit app pays anyway::
+
+    python -m benchmarks.importtime              # report and check
+    python -m benchmarks.importtime --top 30 --budget-ms 150
+
+The exit status is 1 when startup loads one of :data:`HEAVY_MODULES` (they
+must wait until their feature is used) or when the app's own imports take
+longer than ``--budget-ms``. Timings are the median of ``--runs`` runs.
+"""
+
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app_valvefigure1.py')
+
+# Loaded on first use by the features that need them, never at startup
+HEAVY_MODULES = ('matplotlib', 'numpy', 'pandas', 'pyarrow', 'openpyxl', 'fpdf', 'PIL')
+
+DEFAULT_BUDGET_MS = 100
+
+
+def startup_imports(path=APP_PATH):
+    """Source of the import statements at the top level of the app."""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def import_times(code):
+    """``{module: (self_us, cumulative_us)}`` for every module ``code`` imports."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        check=True, capture_output=True, text=True, cwd=os.path.dirname(APP_PATH),
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def _heavy(name):
+    return name.split('.')[0] in HEAVY_MODULES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="list the slowest N modules the app adds")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="maximum time the app's imports may add to import streamlit")
+    args = parser.parse_args(argv)
+
+    code = startup_imports()
+    totals, streamlit_totals = [], []
+    for _ in range(args.runs):
+        baseline = import_times('import streamlit')
+        times = import_times(code)
+        streamlit_totals.append(sum(self_us for self_us, _ in baseline.values()))
+        totals.append(sum(self_us for self_us, _ in times.values()))
+    added_modules = {name: times[name] for name in times.keys() - baseline.keys()}
+    added_ms = (statistics.median(totals) - statistics.median(streamlit_totals)) / 1000
+
+    print(f"import streamlit:  {statistics.median(streamlit_totals) / 1000:8.1f} ms")
+    print(f"app imports:       {statistics.median(totals) / 1000:8.1f} ms "
+          f"({added_ms:+.1f} ms, {len(added_modules)} more modules)")
+    print(f"\nSlowest modules added by the app (cumulative, last run):")
+    for name, (_, cumulative_us) in sorted(added_modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    heavy = sorted(name for name in added_modules if _heavy(name) and '.' not in name)
+    if heavy:
+        failures.append(f"startup imports heavy modules: {', '.join(heavy)}")
+    if added_ms > args.budget_ms:
+        failures.append(f"app imports take {added_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""Load test of the configurator's core flow across many concurrent sessions.
+
+Every simulated session is a Streamlit ``AppTest`` running
+``app_valvefigure1.py`` in this process, the way one Streamlit server runs
+every browser session in its own script thread and shares the
+``st.cache_resource`` objects (price lists, export queue, figure cache,
+store) between them. No server, browser or network is involved; the
+sessions share one mock runtime (see :func:`shared_runtime_app_test`). Each session
+walks the core flow with a configuration of its own::
+
+    load -> requirements -> materials -> pricing -> add (x --items) -> pdf
+
+where every step is the script reruns a user's clicks cause (navigating to
+the page and pressing its button), and ``pdf`` lasts until the proposal PDF
+is ready for download::
+
+    python -m benchmarks.loadtest                              # 20 sessions, 4 at a time
+    python -m benchmarks.loadtest --sessions 100 --concurrency 16 --items 5
+    python -m benchmarks.loadtest --output load.json
+
+It reports throughput, per-step latency percentiles, the process RSS growth
+per session (each session's state is kept alive until the end, as a server
+keeps an idle browser tab's, while the AppTest element trees are dropped)
+and the size of each session's ``st.session_state`` with its largest
+keys. The exit status is 1 when a session failed. A first warm-up session,
+not counted, pays for the shared caches unless ``--no-warmup`` is given.
+The startup figure warm-up is off unless ``--warm-figures`` is given (or
+``VALVEFIGURE_WARM_FIGURES`` is set), as its background renders would
+dominate a short run; proposals go to a temporary store unless
+``VALVEFIGURE_STORE`` is set.
+"""
+
+import argparse
+import concurrent.futures
+import functools
+import gc
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import defaultdict
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app_valvefigure1.py')
+
+STEPS = ('load', 'requirements', 'materials', 'pricing', 'add', 'pdf')
+QUANTILES = (0.5, 0.95, 0.99)
+# Page radio options, in the order the app lists them
+PAGES = ('requirements', 'materials', 'pricing', 'proposal', 'batch_import', 'explorer')
+# Requirement selectboxes set the same in every session (the default rating is too
+# low for the default operating conditions), and those each session picks a random option of
+FIXED_FIELDS = {"Pressure Rating": "600#"}
+VARIED_FIELDS = ("Valve Size", "Valve Type", "Fail Safe Mode")
+SCRIPT_TIMEOUT = 120
+# Not counted in session_state sizes: shared by every session or not data
+_OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                 type(threading.Lock()), threading.Event, threading.Thread, concurrent.futures.Future)
+
+
+class SessionError(RuntimeError):
+    """A step of a simulated session failed; ``step`` names it."""
+
+    def __init__(self, step, message):
+        super().__init__(f"{step}: {message}")
+        self.step = step
+
+
+# ========================
+# MEASUREMENTS
+# ========================
+def rss_bytes():
+    """Resident set size of this process (the peak where /proc is missing)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def deep_size(obj, seen=None):
+    """Bytes of ``obj`` and everything it references, each object once.
+
+    Classes, modules, functions and synchronisation primitives are skipped:
+    they are shared code or bookkeeping, not session data.
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _OPAQUE_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not isinstance(obj, (str, bytes, bytearray, int, float, complex, bool)):
+            if hasattr(obj, '__dict__'):
+                stack.append(vars(obj))
+            for cls in type(obj).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return size
+
+
+def session_state_sizes(session_state):
+    """``{key: bytes}`` of an AppTest's session state."""
+    state = session_state._state.filtered_state
+    return {key: deep_size(value) for key, value in state.items()}
+
+
+def percentile(sorted_values, q):
+    """Linearly interpolated ``q`` quantile of a sorted, non-empty list."""
+    position = q * (len(sorted_values) - 1)
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+# ========================
+# SESSIONS
+# ========================
+def _check(at, step):
+    if at.exception:
+        raise SessionError(step, at.exception[0].value)
+    if at.error:
+        raise SessionError(step, at.error[0].value)
+
+
+def _button(at, label, step):
+    for button in at.button:
+        if button.label == label:
+            if button.disabled:
+                raise SessionError(step, f"{label!r} is disabled")
+            return button
+    raise SessionError(step, f"no {label!r} button")
+
+
+@functools.cache
+def shared_runtime_app_test():
+    """An ``AppTest`` subclass whose script runs may overlap.
+
+    ``AppTest`` installs a mock Streamlit runtime for the length of each run
+    and removes it afterwards, so concurrent runs pull it from under each
+    other, and compiles the script on every run. Here one mock runtime is
+    installed for the whole test and the script compiled once into a shared
+    script cache, as a server does.
+    """
+    from unittest.mock import MagicMock
+    from urllib import parse
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import AppTest
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage('/mock/media'))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    script_cache = ScriptCache()
+
+    class SharedRuntimeAppTest(AppTest):
+        def _run(self, widget_state=None, timeout=None):
+            runner = LocalScriptRunner(self._script_path, self.session_state, args=self.args, kwargs=self.kwargs)
+            runner._script_cache = script_cache
+            self._tree = runner.run(widget_state, self.query_params,
+                                    self.default_timeout if timeout is None else timeout)
+            self._tree._runner = self
+            self.query_params = parse.parse_qs(runner.event_data[-1]['client_state'].query_string)
+            return self
+
+    return SharedRuntimeAppTest
+
+
+def _go(at, page):
+    radio = at.radio(key='page')
+    return radio.set_value(radio.options[PAGES.index(page)]).run()
+
+
+def run_session(rng, items=1):
+    """Walk one session through the core flow with a configuration chosen by
+    ``rng``; returns ``(app_test, {step: [seconds, ...]})``."""
+    timings = defaultdict(list)
+
+    def step(name, action):
+        start = time.perf_counter()
+        try:
+            at = action()
+        except SessionError:
+            raise
+        except Exception as e:  # a timeout or a missing widget fails the session, not the test
+            raise SessionError(name, f"{type(e).__name__}: {e}") from e
+        timings[name].append(time.perf_counter() - start)
+        _check(at, name)
+        return at
+
+    at = step('load', lambda: shared_runtime_app_test()(APP_PATH, default_timeout=SCRIPT_TIMEOUT).run())
+
+    def requirements():
+        for box in at.selectbox:
+            if box.label in FIXED_FIELDS:
+                box.select(FIXED_FIELDS[box.label])
+            elif box.label in VARIED_FIELDS:
+                box.select(rng.choice(box.options))
+        return _button(at, "Save Requirements", 'requirements').click().run()
+
+    step('requirements', requirements)
+    step('materials', lambda: _button(_go(at, 'materials'), "Save Materials", 'materials').click().run())
+    step('pricing', lambda: _go(at, 'pricing'))
+    for _ in range(items):
+        step('add', lambda: _button(at, "Add to Proposal", 'add').click().run())
+    step('pdf', lambda: _button(at, "Generate Proposal PDF", 'pdf').click().run())
+    if not any(button.label == "Download Proposal" for button in at.get('download_button')):
+        raise SessionError('pdf', "no proposal download after the export")
+    return at, timings
+
+
+def load_test(sessions, concurrency, items=1, seed=0, warmup=True):
+    """Run ``sessions`` simulated sessions, ``concurrency`` at a time; returns
+    the report as a dict (see :func:`print_report`)."""
+    shared_runtime_app_test()
+    if warmup:
+        run_session(random.Random(seed - 1), items)
+
+    gc.collect()
+    rss_before = rss_bytes()
+    live, errors = [], []
+    timings = defaultdict(list)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency, thread_name_prefix='session') as pool:
+        futures = [pool.submit(run_session, random.Random(seed + i), items) for i in range(sessions)]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                at, session_timings = future.result()
+            except SessionError as e:
+                errors.append(str(e))
+                continue
+            live.append(at.session_state)
+            del at
+            for name, seconds in session_timings.items():
+                timings[name].extend(seconds)
+    wall_seconds = time.perf_counter() - start
+    gc.collect()
+    rss_after = rss_bytes()
+
+    state_sizes = [session_state_sizes(state) for state in live]
+    totals = sorted(sum(sizes.values()) for sizes in state_sizes)
+    by_key = defaultdict(list)
+    for sizes in state_sizes:
+        for key, size in sizes.items():
+            by_key[key].append(size)
+
+    steps = {}
+    for name in STEPS:
+        values = sorted(timings.get(name, ()))
+        if values:
+            steps[name] = {'count': len(values), 'mean': statistics.fmean(values), 'max': values[-1],
+                           **{f'p{round(q * 100)}': percentile(values, q) for q in QUANTILES}}
+    return {
+        'sessions': sessions,
+        'concurrency': concurrency,
+        'items_per_session': items,
+        'completed': len(live),
+        'errors': errors,
+        'wall_seconds': wall_seconds,
+        'sessions_per_second': len(live) / wall_seconds,
+        'reruns_per_second': sum(len(values) for values in timings.values()) / wall_seconds,
+        'steps': steps,
+        'rss_before_mb': rss_before / 2**20,
+        'rss_after_mb': rss_after / 2**20,
+        'rss_per_session_kb': (rss_after - rss_before) / 1024 / max(len(live), 1),
+        'session_state_kb': {
+            'median': statistics.median(totals) / 1024 if totals else 0.0,
+            'max': totals[-1] / 1024 if totals else 0.0,
+            'by_key': {key: statistics.fmean(sizes) / 1024 for key, sizes in
+                       sorted(by_key.items(), key=lambda item: -statistics.fmean(item[1]))},
+        },
+    }
+
+
+# ========================
+# REPORT
+# ========================
+def print_report(report, top=8):
+    print(f"{report['completed']}/{report['sessions']} sessions completed, "
+          f"{report['concurrency']} at a time, {report['items_per_session']} item(s) each, "
+          f"in {report['wall_seconds']:.1f} s")
+    print(f"throughput: {report['sessions_per_second']:.2f} sessions/s, "
+          f"{report['reruns_per_second']:.1f} script runs/s")
+    print(f"\n{'step':<13} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in report['steps'].items():
+        print(f"{name:<13} {stats['count']:>6} {stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} "
+              f"{stats['p99'] * 1000:>9.1f} {stats['max'] * 1000:>9.1f}")
+    print(f"\nRSS: {report['rss_before_mb']:.1f} MB -> {report['rss_after_mb']:.1f} MB, "
+          f"{report['rss_per_session_kb']:+.1f} KB per live session")
+    state = report['session_state_kb']
+    print(f"session_state: {state['median']:.1f} KB median, {state['max']:.1f} KB max; largest keys:")
+    for key, kb in list(state['by_key'].items())[:top]:
+        print(f"  {kb:9.1f} KB  {key}")
+    if report['errors']:
+        print(f"\n{len(report['errors'])} session(s) failed:")
+        for message in sorted(set(report['errors'])):
+            print(f"  {message}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4, help="sessions running at the same time")
+    parser.add_argument('--items', type=int, default=1, help="valves each session adds to its proposal")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false',
+                        help="count the first session's cold caches too")
+    parser.add_argument('--warm-figures', action='store_true', help="keep the startup figure warm-up")
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if not args.warm_figures:
+        os.environ.setdefault('VALVEFIGURE_WARM_FIGURES', '0')
+
+    # Keep the sessions' proposals out of the real store
+    store_dir = None
+    if 'VALVEFIGURE_STORE' not in os.environ:
+        store_dir = tempfile.TemporaryDirectory()
+        os.environ['VALVEFIGURE_STORE'] = os.path.join(store_dir.name, 'loadtest.db')
+    try:
+        report = load_test(args.sessions, args.concurrency, args.items, args.seed, args.warmup)
+    finally:
+        if store_dir is not None:
+            store_dir.cleanup()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if report['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
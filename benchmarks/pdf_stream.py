@@ -0,0 +1,86 @@
+"""Time and peak RSS of the streaming PDF renderer against the FPDF one.
+
+Each measurement runs in a fresh interpreter so peak RSS is not polluted by
+earlier runs::
+
+    python -m benchmarks.pdf_stream                    # 100, 10k and 100k items
+    python -m benchmarks.pdf_stream --counts 100 1000 --fpdf-limit 1000
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_COUNTS = [100, 10_000, 100_000]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(renderer, count):
+    """Render a synthetic proposal of ``count`` items in this process."""
+    from benchmarks.synthetic import synthetic_proposal
+
+    # Both renderers get the items as a generator, so the input list itself
+    # does not count towards peak memory.
+    proposal = synthetic_proposal(count, lazy=True)
+    baseline_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as fp:
+        if renderer == 'stream':
+            from valvefigure.pdfstream import write_proposal_pdf
+            size = write_proposal_pdf(proposal, fp)
+        else:
+            from valvefigure.proposal import generate_proposal_pdf
+            size = fp.write(generate_proposal_pdf(proposal).getbuffer())
+    return {
+        'renderer': renderer,
+        'items': count,
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'baseline_rss_mb': round(baseline_rss, 1),
+        'pdf_bytes': size,
+    }
+
+
+def run_isolated(renderer, count):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.pdf_stream', '--measure', renderer, str(count)],
+        check=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    return json.loads(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=DEFAULT_COUNTS)
+    parser.add_argument('--fpdf-limit', type=int, default=10_000,
+                        help="skip the FPDF renderer above this many items")
+    parser.add_argument('--measure', nargs=2, metavar=('RENDERER', 'COUNT'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        renderer, count = args.measure
+        print(json.dumps(measure(renderer, int(count))))
+        return
+
+    print(f"{'renderer':<8} {'items':>8} {'seconds':>9} {'peak RSS MB':>12} {'PDF MB':>8}")
+    for count in args.counts:
+        for renderer in ('stream', 'fpdf'):
+            if renderer == 'fpdf' and count > args.fpdf_limit:
+                continue
+            result = run_isolated(renderer, count)
+            print(f"{renderer:<8} {count:>8} {result['seconds']:>9.3f} "
+                  f"{result['peak_rss_mb']:>12.1f} {result['pdf_bytes'] / 1e6:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
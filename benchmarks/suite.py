@@ -0,0 +1,397 @@
+"""Benchmark suite for the pricing, repricing, re-quote, rules, figure, PDF and export hot paths.
+
+Every case runs on synthetic proposals whose materials cycle through all
+MATERIAL_DB combinations (see :func:`benchmarks.synthetic.synthetic_valves`),
+at sizes from 1 to 100k items. For each case and size the suite records the
+best wall time of ``--repeat`` runs, then runs once more under tracemalloc
+for the peak and retained Python allocations::
+
+    python -m benchmarks.suite                          # every case, 1 to 100k items
+    python -m benchmarks.suite --quick                  # up to 1,000 items
+    python -m benchmarks.suite --cases pdf csv --counts 10000
+    python -m benchmarks.suite --quick --output results.json --baseline benchmarks/baseline.json
+
+With ``--baseline`` the results are compared against a stored run and the
+exit status is 1 when a case got slower or allocates more than
+``--threshold`` times the baseline. ``--save-baseline`` stores the run as the
+new baseline; record it with the default sizes and repeats, on the machine the
+gate runs on: baselines are only comparable on the machine that recorded them,
+which the file notes (and a comparison warns about a different one).
+
+``--profile DIR`` also runs each case under cProfile and writes
+``DIR/<case>-<items>.prof`` (open with ``python -m pstats`` or snakeviz). For
+sampling profilers, run a single case in the foreground, e.g.
+``py-spy record -o pdf.svg -- python -m benchmarks.suite --cases pdf --counts 10000``.
+"""
+
+import argparse
+import cProfile
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+DEFAULT_COUNTS = [1, 10, 100, 1_000, 10_000, 100_000]
+QUICK_MAX_ITEMS = 1_000
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.005
+MIN_ALLOC_DELTA_KB = 64
+
+
+# ========================
+# CASES
+# ========================
+class Case:
+    """A benchmarked operation: ``setup(valves)`` builds its input outside the
+    timed region and ``run(data)`` is what gets measured."""
+
+    def __init__(self, name, run, setup=None, max_items=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda valves: valves)
+        self.max_items = max_items
+
+
+def _price(valves):
+    from valvefigure.pricing import MATERIAL_DB, calculate_valve_price, load_price_database
+
+    price_db = load_price_database()
+    for valve in valves:
+        calculate_valve_price(valve, price_db, MATERIAL_DB)
+
+
+def _valves_frame(valves):
+    import pandas as pd
+
+    return pd.DataFrame(valves)
+
+
+def _price_bulk(frame):
+    from valvefigure.pricing import calculate_prices_bulk, load_price_database
+
+    calculate_prices_bulk(frame, load_price_database())
+
+
+def _priced_items(valves):
+    from valvefigure.currency import RateTable
+    from valvefigure.items import ProposalItems
+    from valvefigure.pricelists import PriceLists
+    from valvefigure.pricing import MATERIAL_DB, load_price_database
+
+    # Two years of quarterly lists, each changing a size price
+    price_lists = PriceLists('EUR')
+    price_lists.add_version('2026-01-01', load_price_database(), MATERIAL_DB)
+    for quarter in range(1, 8):
+        year, month = 2026 + quarter // 4, 1 + 3 * (quarter % 4)
+        price_lists.add_changes(f'{year}-{month:02d}-01', {'Valve Size': {'2"': 1800 + 50 * quarter}})
+    names = price_lists.names
+    items = ProposalItems({**valve, 'price_version': names[i % len(names)]} for i, valve in enumerate(valves))
+    return items, price_lists, RateTable({'EUR': 1.0, 'USD': 1.08})
+
+
+def _reprice(data):
+    from valvefigure.pricelists import reprice
+
+    items, price_lists, rates = data
+    reprice(items, price_lists, rates, 'USD')
+
+
+def _rules(valves):
+    from valvefigure.rules import RuleSet
+
+    rules = RuleSet()
+    for valve in valves:
+        rules.violations(valve)
+
+
+def _figure(valves):
+    from valvefigure.figure import generate_valve_figure
+
+    for valve in valves:
+        generate_valve_figure(valve)
+
+
+def _figure_zip(valves):
+    from valvefigure.figexport import iter_figures_zip
+
+    for _ in iter_figures_zip(valves):
+        pass
+
+
+def _figure_sprite(valves):
+    from valvefigure.figexport import iter_figure_sprite
+
+    for _ in iter_figure_sprite(valves):
+        pass
+
+
+def _proposal(valves):
+    from valvefigure.proposal import Proposal
+
+    return Proposal(name="Benchmark Proposal", client_name="Benchmark Client",
+                    date="2026-01-01", items=valves)
+
+
+def _pdf(proposal):
+    from valvefigure.proposal import generate_proposal_pdf
+
+    generate_proposal_pdf(proposal)
+
+
+def _pdf_stream(proposal):
+    from valvefigure.pdfstream import iter_proposal_pdf
+
+    for _ in iter_proposal_pdf(proposal):
+        pass
+
+
+def _quote(valves):
+    from valvefigure.items import ProposalItems
+    from valvefigure.pricing import MATERIAL_DB, calculate_valve_price, load_price_database
+
+    # A full rebuild: every line priced and every page laid out
+    price_db = load_price_database()
+    items = ProposalItems({**valve, 'total_price': calculate_valve_price(valve, price_db, MATERIAL_DB)['total_price']}
+                          for valve in valves)
+    _pdf_stream(_proposal(items))
+
+
+def _revision(valves):
+    from valvefigure.items import ProposalItems
+    from valvefigure.pdfstream import PageCache, iter_proposal_pdf
+    from valvefigure.pricing import MATERIAL_DB, load_price_database
+
+    # 1% of the lines revised at random, half in quantity and half in size;
+    # the old revision's PDF was rendered before
+    price_db = load_price_database()
+    sizes = list(price_db['Valve Size'])
+    old = ProposalItems(valves)
+    new = [dict(valve) for valve in valves]
+    for n, i in enumerate(random.Random(0).sample(range(len(new)), len(new) // 100)):
+        if n % 2:
+            new[i]['quantity'] += 1
+        else:
+            new[i]['size'] = sizes[(sizes.index(new[i]['size']) + 1) % len(sizes)]
+    page_cache = PageCache()
+    for _ in iter_proposal_pdf(_proposal(old), page_cache=page_cache):
+        pass
+    return old, new, price_db, MATERIAL_DB, page_cache
+
+
+def _requote(data):
+    from valvefigure.pdfstream import iter_proposal_pdf
+    from valvefigure.revisions import requote
+
+    old, new, price_db, material_db, page_cache = data
+    # As in the app: unchanged items are kept, changed ones replaced. Each
+    # run starts from the old revision and its pages only
+    items = old.copy()
+    diff, _ = requote(items, new, price_db, material_db)
+    diff.apply(items)
+    for _ in iter_proposal_pdf(_proposal(items), page_cache=page_cache.copy()):
+        pass
+
+
+def _csv(valves):
+    from valvefigure.export import iter_proposal_csv
+
+    for _ in iter_proposal_csv(valves):
+        pass
+
+
+def _xlsx(proposal):
+    from io import BytesIO
+
+    from valvefigure.export import write_proposal_xlsx
+    from valvefigure.pricing import load_price_database
+
+    write_proposal_xlsx(proposal, BytesIO(), load_price_database())
+
+
+CASES = {case.name: case for case in [
+    Case('price', _price),
+    Case('price_bulk', _price_bulk, setup=_valves_frame),
+    Case('reprice', _reprice, setup=_priced_items),
+    Case('rules', _rules),
+    # ~5 ms a figure; 2,000 items already cover every material combination
+    Case('figure', _figure, max_items=2_000),
+    # Every distinct figure rendered on all cores, then zipped or tiled
+    Case('figure_zip', _figure_zip, max_items=2_000),
+    Case('sprite', _figure_sprite, max_items=2_000),
+    # The FPDF renderer needs minutes and hundreds of MB beyond 10k items
+    Case('pdf', _pdf, setup=_proposal, max_items=10_000),
+    Case('pdf_stream', _pdf_stream, setup=_proposal),
+    # Compare with quote: re-quoting 1% of the lines against a full rebuild
+    Case('quote', _quote),
+    Case('requote', _requote, setup=_revision),
+    Case('csv', _csv),
+    Case('xlsx', _xlsx, setup=_proposal),
+]}
+
+
+# ========================
+# MEASUREMENT
+# ========================
+def measure(case, count, repeat=3, profile_dir=None):
+    """Time ``case`` on ``count`` synthetic items and trace its allocations."""
+    from benchmarks.synthetic import synthetic_valves
+
+    data = case.setup(list(synthetic_valves(count, all_materials=True)))
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        case.run(data)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.run(data)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler = cProfile.Profile()
+        profiler.runcall(case.run, data)
+        profiler.dump_stats(os.path.join(profile_dir, f'{case.name}-{count}.prof'))
+
+    return {
+        'case': case.name,
+        'items': count,
+        'seconds': round(min(times), 6),
+        'mean_seconds': round(sum(times) / len(times), 6),
+        'alloc_peak_kb': round(peak / 1024, 1),
+        'alloc_retained_kb': round(retained / 1024, 1),
+    }
+
+
+def _cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+# Environment fields that must match for timings to be comparable
+MACHINE_FIELDS = ('python', 'platform', 'cpu', 'cpu_count')
+
+
+def environment(args=None):
+    """The recording machine and, given the parsed ``args``, the run's settings."""
+    env = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.node(),
+        'cpu': _cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    if args is not None:
+        env['settings'] = {'counts': args.counts, 'repeat': args.repeat, 'quick': args.quick}
+    return env
+
+
+# ========================
+# BASELINE COMPARISON
+# ========================
+def compare(results, baseline, threshold):
+    """Pair ``results`` with the ``baseline`` run; returns (rows, regressions).
+
+    A result regresses when its best time or its allocation peak exceeds
+    ``threshold`` times the baseline by more than the noise floor.
+    """
+    previous = {(r['case'], r['items']): r for r in baseline['results']}
+    rows, regressions = [], []
+    for result in results:
+        before = previous.get((result['case'], result['items']))
+        if before is None:
+            rows.append((result, None, None, None))
+            continue
+        time_ratio = result['seconds'] / before['seconds'] if before['seconds'] else None
+        alloc_ratio = result['alloc_peak_kb'] / before['alloc_peak_kb'] if before['alloc_peak_kb'] else None
+        slower = (time_ratio is not None and time_ratio > threshold
+                  and result['seconds'] - before['seconds'] > MIN_SECONDS_DELTA)
+        bigger = (alloc_ratio is not None and alloc_ratio > threshold
+                  and result['alloc_peak_kb'] - before['alloc_peak_kb'] > MIN_ALLOC_DELTA_KB)
+        rows.append((result, time_ratio, alloc_ratio, slower or bigger))
+        if slower or bigger:
+            regressions.append(result)
+    return rows, regressions
+
+
+def _ratio(value):
+    return f'{value:>7.2f}x' if value is not None else f"{'-':>8}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--counts', type=int, nargs='+', default=DEFAULT_COUNTS)
+    parser.add_argument('--quick', action='store_true', help=f"only sizes up to {QUICK_MAX_ITEMS:,} items")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case; the best is kept")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against a JSON results file")
+    parser.add_argument('--save-baseline', action='store_true', help=f"store the results in {BASELINE_PATH}")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="ratio to the baseline that counts as a regression")
+    parser.add_argument('--profile', metavar='DIR', help="also dump a cProfile run of each case to DIR")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = []
+    print(f"{'case':<11} {'items':>8} {'seconds':>10} {'alloc peak KB':>14} {'retained KB':>12}")
+    for name in args.cases:
+        case = CASES[name]
+        for count in args.counts:
+            if args.quick and count > QUICK_MAX_ITEMS or case.max_items and count > case.max_items:
+                continue
+            result = measure(case, count, args.repeat, args.profile)
+            results.append(result)
+            print(f"{name:<11} {count:>8} {result['seconds']:>10.4f} "
+                  f"{result['alloc_peak_kb']:>14.1f} {result['alloc_retained_kb']:>12.1f}", flush=True)
+
+    run = {'environment': environment(args), 'results': results}
+    for path in filter(None, [args.output, BASELINE_PATH if args.save_baseline else None]):
+        with open(path, 'w') as f:
+            json.dump(run, f, indent=2)
+            f.write('\n')
+
+    if baseline is not None:
+        rows, regressions = compare(results, baseline, args.threshold)
+        recorded = baseline['environment']
+        print(f"\nAgainst {args.baseline} (recorded {recorded.get('timestamp', '?')} "
+              f"on {recorded.get('machine', '?')}, {recorded.get('cpu', '?')} x{recorded.get('cpu_count', '?')}):")
+        differs = [name for name in MACHINE_FIELDS if recorded.get(name) != run['environment'][name]]
+        if differs:
+            print(f"Warning: the baseline was recorded on another machine ({', '.join(differs)} differ); "
+                  "timings are not comparable")
+        print(f"{'case':<11} {'items':>8} {'time':>8} {'alloc':>8}")
+        for result, time_ratio, alloc_ratio, regressed in rows:
+            print(f"{result['case']:<11} {result['items']:>8} {_ratio(time_ratio)} {_ratio(alloc_ratio)}"
+                  f"{'  REGRESSION' if regressed else ''}")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.2f}x")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Synthetic valve configurations and proposals for benchmarks."""
+
+import itertools
+import random
+
+from valvefigure.pricing import (
+    FAIL_MODES, FLUID_TYPES, MATERIAL_COLUMNS, MATERIAL_DB, VALVE_TYPES, calculate_valve_price, load_price_database,
+)
+from valvefigure.proposal import Proposal
+
+
+def material_combinations():
+    """Every combination of MATERIAL_DB materials, as dicts of the material columns."""
+    columns = list(MATERIAL_COLUMNS)
+    for values in itertools.product(*(MATERIAL_DB[MATERIAL_COLUMNS[col]] for col in columns)):
+        yield dict(zip(columns, values))
+
+
+def synthetic_valves(count, seed=0, price_db=None, all_materials=False):
+    """Yield ``count`` random priced valve configurations, reproducibly for ``seed``.
+
+    With ``all_materials`` the materials cycle through
+    :func:`material_combinations` instead of being drawn at random, so any
+    ``count`` of at least 1,920 covers every combination.
+    """
+    price_db = load_price_database() if price_db is None else price_db
+    rng = random.Random(seed)
+    sizes = list(price_db['Valve Size'])
+    ratings = list(price_db['Pressure Rating'])
+    actuators = list(price_db['Actuator Type'])
+    accessories = list(price_db['Accessories'])
+    materials = {col: list(MATERIAL_DB[category]) for col, category in MATERIAL_COLUMNS.items()}
+    combinations = itertools.cycle(material_combinations()) if all_materials else None
+    for _ in range(count):
+        valve = {
+            'op_pressure': float(rng.randint(1, 400)),
+            'op_temp': float(rng.randint(-50, 500)),
+            'fluid_type': rng.choice(FLUID_TYPES),
+            'size': rng.choice(sizes),
+            'pressure_rating': rng.choice(ratings),
+            'type': rng.choice(VALVE_TYPES),
+            'fail_mode': rng.choice(FAIL_MODES),
+            'actuator_type': rng.choice(actuators),
+            'accessories': rng.sample(accessories, rng.randint(0, len(accessories))),
+            'quantity': rng.randint(1, 100),
+            'notes': '',
+            **(next(combinations) if combinations
+               else {col: rng.choice(options) for col, options in materials.items()}),
+        }
+        valve['total_price'] = calculate_valve_price(valve, price_db)['total_price']
+        yield valve
+
+
+def synthetic_proposal(count, seed=0, lazy=False):
+    """A proposal with ``count`` synthetic items; ``lazy`` keeps them a generator."""
+    items = synthetic_valves(count, seed)
+    return Proposal(
+        name="Benchmark Proposal",
+        client_name="Benchmark Client",
+        date="2026-01-01",
+        items=items if lazy else list(items),
+    )
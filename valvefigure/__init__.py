@@ -0,0 +1,7 @@
+"""Headless core of the VASTAŞ valve configurator.
+
+The submodules price valves (:mod:`valvefigure.pricing`), draw valve figures
+(:mod:`valvefigure.figure`) and render proposal documents
+(:mod:`valvefigure.proposal`, :mod:`valvefigure.export`) from explicit
+inputs, without Streamlit.
+"""
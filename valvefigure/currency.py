@@ -0,0 +1,97 @@
+"""Currencies: exchange rates from a local file and money formatting.
+
+Rates are supplied offline as a CSV file with ``currency,rate`` rows, each
+the value of one unit of a common base currency (the row whose rate is 1).
+:class:`RateTable` precomputes every cross rate when it loads, so a
+conversion is one dict lookup and a multiplication.
+"""
+
+import csv
+
+DEFAULT_CURRENCY = 'EUR'
+
+# code: (name, symbol)
+CURRENCIES = {
+    'EUR': ('Euros', '€'),
+    'USD': ('US Dollars', '$'),
+    'GBP': ('Pounds Sterling', '£'),
+    'TRY': ('Turkish Lira', '₺'),
+}
+
+
+class RateError(ValueError):
+    """The rates file is missing or has malformed rows."""
+
+
+def currency_symbol(code):
+    return CURRENCIES[code][1] if code in CURRENCIES else code
+
+
+def currency_name(code):
+    return CURRENCIES[code][0] if code in CURRENCIES else code
+
+
+def format_money(amount, currency=DEFAULT_CURRENCY):
+    """``amount`` with the currency's symbol and two decimals, e.g. '€1,234.50'."""
+    symbol = currency_symbol(currency)
+    if len(symbol) > 1:
+        return f"{amount:,.2f} {symbol}"
+    return f"{'-' if amount < 0 else ''}{symbol}{abs(amount):,.2f}"
+
+
+class RateTable:
+    """Exchange rates between ``rates``' currencies (``{code: units per base unit}``)."""
+
+    def __init__(self, rates):
+        if not rates:
+            raise RateError("No exchange rates given")
+        bad = [code for code, rate in rates.items() if not rate > 0]
+        if bad:
+            raise RateError(f"Rates must be positive: {', '.join(bad)}")
+        self.rates = dict(rates)
+        self.cross = {(source, target): rates[target] / rates[source] for source in rates for target in rates}
+
+    @classmethod
+    def single(cls, currency=DEFAULT_CURRENCY):
+        """A table that only knows ``currency``."""
+        return cls({currency: 1.0})
+
+    @property
+    def currencies(self):
+        return list(self.rates)
+
+    def rate(self, source, target):
+        """Units of ``target`` per unit of ``source``; raises KeyError for an unknown currency."""
+        if source == target:
+            return 1.0
+        try:
+            return self.cross[source, target]
+        except KeyError:
+            unknown = source if source not in self.rates else target
+            raise KeyError(f"No exchange rate for {unknown}") from None
+
+    def convert(self, amount, source, target):
+        return amount * self.rate(source, target)
+
+
+def load_rates(path):
+    """Read a ``currency,rate`` CSV file into a :class:`RateTable`.
+
+    A header row and blank or '#' comment lines are skipped.
+    """
+    rates = {}
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for line_no, row in enumerate(csv.reader(f), start=1):
+                if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                    continue
+                code = row[0].strip().upper()
+                if line_no == 1 and code == 'CURRENCY':
+                    continue
+                try:
+                    rates[code] = float(row[1])
+                except (IndexError, ValueError):
+                    raise RateError(f"{path} line {line_no}: expected 'currency,rate'") from None
+    except OSError as e:
+        raise RateError(f"Could not read rates file {path}: {e}") from e
+    return RateTable(rates)
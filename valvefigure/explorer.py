@@ -0,0 +1,187 @@
+"""Configuration-space explorer: a precomputed price cube over every option.
+
+:class:`PriceCube` holds the unit price (quantity 1, no accessories) of every
+combination of size, pressure rating, actuator and the five MATERIAL_DB
+categories as one NumPy array, built once by broadcasting the price tables.
+Queries such as "the cheapest configurations for 4\" 600# Electric under
+EUR X" are then a slice and a partial sort, answered in milliseconds.
+
+Prices follow :func:`~valvefigure.pricing.calculate_valve_price`::
+
+    (base + materials + actuator + accessories) * pressure multiplier
+
+so accessories are added at query time. When a price table changes,
+:meth:`PriceCube.sync` recomputes only the slices of the entries that
+changed, and rebuilds the cube only when options were added or removed.
+"""
+
+import threading
+
+import numpy as np
+
+from valvefigure.pricing import MATERIAL_COLUMNS, MATERIAL_DB
+
+# Cube axes: (valve field, price_db table or None for MATERIAL_DB columns)
+AXES = (
+    ('size', 'Valve Size'),
+    ('pressure_rating', 'Pressure Rating'),
+    ('actuator_type', 'Actuator Type'),
+    *((column, None) for column in MATERIAL_COLUMNS),
+)
+AXIS_NAMES = tuple(name for name, _ in AXES)
+RATING_AXIS = AXIS_NAMES.index('pressure_rating')
+
+CHEAPEST = 'cheapest'
+NEAREST = 'nearest'
+
+
+def _axis_tables(price_db, material_db):
+    """``{axis: {label: price}}`` for every cube axis."""
+    tables = {}
+    for name, table in AXES:
+        if table is None:
+            tables[name] = {label: props['price'] for label, props in material_db[MATERIAL_COLUMNS[name]].items()}
+        else:
+            tables[name] = dict(price_db[table])
+    return tables
+
+
+class PriceCube:
+    """Unit prices of every configuration, indexed by :data:`AXIS_NAMES`.
+
+    Safe to share between threads: updates and queries are serialized.
+    """
+
+    def __init__(self, price_db, material_db=None):
+        self._lock = threading.RLock()
+        material_db = MATERIAL_DB if material_db is None else material_db
+        self.accessories = dict(price_db['Accessories'])
+        self._set_tables(_axis_tables(price_db, material_db))
+        self.cube = self._compute({})
+
+    def _set_tables(self, tables):
+        self.tables = tables
+        self.labels = {name: list(table) for name, table in tables.items()}
+        self.index = {name: {label: i for i, label in enumerate(labels)} for name, labels in self.labels.items()}
+        self.values = {name: np.array(list(table.values()), dtype=float) for name, table in tables.items()}
+
+    @property
+    def size(self):
+        return self.cube.size
+
+    def _compute(self, fixed):
+        """Prices of the sub-cube where each axis in ``fixed`` is held at one index."""
+        ndim = len(AXIS_NAMES)
+        total = 0
+        multiplier = None
+        for axis, name in enumerate(AXIS_NAMES):
+            values = self.values[name]
+            if name in fixed:
+                values = values[fixed[name]:fixed[name] + 1]
+            shape = [1] * ndim
+            shape[axis] = len(values)
+            if axis == RATING_AXIS:
+                multiplier = values.reshape(shape)
+            else:
+                total = total + values.reshape(shape)
+        return total * multiplier
+
+    # ------------------------
+    # Incremental updates
+    # ------------------------
+    def set_price(self, axis, label, price):
+        """Change one option's price, recomputing only the slice it affects."""
+        with self._lock:
+            self._set_price(axis, label, price)
+
+    def _set_price(self, axis, label, price):
+        i = self.index[axis][label]
+        self.tables[axis][label] = price
+        self.values[axis][i] = price
+        selection = [slice(None)] * len(AXIS_NAMES)
+        selection[AXIS_NAMES.index(axis)] = slice(i, i + 1)
+        self.cube[tuple(selection)] = self._compute({axis: i})
+
+    def sync(self, price_db, material_db=None):
+        """Bring the cube up to date with ``price_db`` and ``material_db``.
+
+        Changed prices are patched slice by slice; added or removed options
+        rebuild the cube. Returns the number of prices patched, or -1 for a
+        rebuild.
+        """
+        material_db = MATERIAL_DB if material_db is None else material_db
+        tables = _axis_tables(price_db, material_db)
+        with self._lock:
+            self.accessories = dict(price_db['Accessories'])
+            if any(list(tables[name]) != self.labels[name] for name in AXIS_NAMES):
+                self._set_tables(tables)
+                self.cube = self._compute({})
+                return -1
+            changed = [(name, label, price) for name in AXIS_NAMES
+                       for label, price in tables[name].items() if price != self.tables[name][label]]
+            for name, label, price in changed:
+                self._set_price(name, label, price)
+            return len(changed)
+
+    # ------------------------
+    # Queries
+    # ------------------------
+    def query(self, filters=None, accessories=(), k=10, mode=CHEAPEST, budget=None):
+        """The ``k`` best configurations matching ``filters``.
+
+        ``filters`` maps axis names to a label or a list of allowed labels;
+        other axes range over every option. ``accessories`` are added to each
+        unit price. With ``mode`` CHEAPEST the cheapest configurations are
+        returned, limited to ``budget`` when given; with NEAREST, those whose
+        price is closest to ``budget``. Returns dicts of the axis labels plus
+        ``unit_price``, best first. Raises KeyError for unknown labels.
+        """
+        if mode not in (CHEAPEST, NEAREST):
+            raise ValueError(f"Unknown query mode: {mode!r}")
+        if mode == NEAREST and budget is None:
+            raise ValueError("A nearest-to-budget query needs a budget")
+        filters = filters or {}
+        unknown = set(filters) - set(AXIS_NAMES)
+        if unknown:
+            raise KeyError(f"Unknown axes: {', '.join(sorted(unknown))}")
+
+        with self._lock:
+            indices = []
+            for name in AXIS_NAMES:
+                allowed = filters.get(name)
+                if allowed is None or (not isinstance(allowed, str) and not allowed):
+                    indices.append(np.arange(len(self.labels[name])))
+                else:
+                    allowed = [allowed] if isinstance(allowed, str) else allowed
+                    indices.append(np.array([self.index[name][label] for label in allowed]))
+            # Fancy indexing copies, so later updates cannot tear the result
+            prices = self.cube[np.ix_(*indices)]
+            labels = {name: [self.labels[name][i] for i in axis_indices]
+                      for name, axis_indices in zip(AXIS_NAMES, indices)}
+            accessories_cost = sum(self.accessories[name] for name in accessories)
+            multipliers = self.values['pressure_rating'][indices[RATING_AXIS]]
+        if accessories_cost:
+            shape = [1] * len(AXIS_NAMES)
+            shape[RATING_AXIS] = -1
+            prices = prices + accessories_cost * multipliers.reshape(shape)
+
+        flat = prices.ravel()
+        if mode == NEAREST:
+            score = np.abs(flat - budget)
+        elif budget is not None:
+            score = np.where(flat <= budget, flat, np.inf)
+        else:
+            score = flat
+        k = min(k, flat.size)
+        if k <= 0:
+            return []
+        best = np.argpartition(score, k - 1)[:k]
+        best = best[np.argsort(score[best], kind='stable')]
+        best = best[np.isfinite(score[best])]
+
+        results = []
+        for position in zip(*np.unravel_index(best, prices.shape)):
+            result = {name: labels[name][i] for name, i in zip(AXIS_NAMES, position)}
+            result['unit_price'] = float(prices[position])
+            results.append(result)
+        return results
@@ -0,0 +1,185 @@
+"""Streaming proposal exports: CSV and Excel.
+
+Both exports walk the proposal items once and never hold the whole document
+in memory: the CSV export is a generator of encoded chunks, and the Excel
+export uses openpyxl's write-only mode, which spools rows to disk.
+"""
+
+import csv
+from io import StringIO
+
+from valvefigure.currency import DEFAULT_CURRENCY, currency_symbol
+from valvefigure.items import ITEM_FIELDS
+from valvefigure.pricing import calculate_valve_price
+
+# Exported valve fields, in the order the configurator collects them
+EXPORT_COLUMNS = list(ITEM_FIELDS)
+
+ACCESSORY_SEPARATOR = '; '
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _export_value(value):
+    if isinstance(value, (list, tuple)):
+        return ACCESSORY_SEPARATOR.join(map(str, value))
+    return value
+
+
+# ========================
+# CSV EXPORT
+# ========================
+def iter_proposal_csv(items, columns=None, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+    """Yield proposal ``items`` as encoded CSV chunks of about ``chunk_size`` bytes.
+
+    Columns default to :data:`EXPORT_COLUMNS`; other item fields are left
+    out. Accessory lists are joined with '; '.
+    """
+    columns = EXPORT_COLUMNS if columns is None else columns
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    for item in items:
+        writer.writerow({name: _export_value(item.get(name, '')) for name in columns})
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode(encoding)
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode(encoding)
+
+
+# ========================
+# EXCEL EXPORT
+# ========================
+# Proposal sheet: (header, value of an item, column width)
+PROPOSAL_SHEET_COLUMNS = [
+    ('Item', None, 6),
+    ('Description', lambda item: f"{item['size']} {item['type']} Valve", 22),
+    ('Size', lambda item: item['size'], 8),
+    ('Pressure Rating', lambda item: item['pressure_rating'], 10),
+    ('Type', lambda item: item['type'], 10),
+    ('Fail Mode', lambda item: item['fail_mode'], 16),
+    ('Actuator', lambda item: item['actuator_type'], 12),
+    ('Body/Bonnet', lambda item: item['body_material'], 20),
+    ('Ball', lambda item: item['ball_material'], 20),
+    ('Stem', lambda item: item['stem_material'], 20),
+    ('Seat', lambda item: item['seat_material'], 10),
+    ('Trim', lambda item: item['trim_type'], 16),
+    ('Accessories', lambda item: _export_value(item.get('accessories', [])), 30),
+    ('Qty', lambda item: item['quantity'], 6),
+    ('Unit Price', lambda item: item['total_price'] / item['quantity'], 14),
+    ('Total Price', lambda item: item['total_price'], 16),
+]
+MONEY_COLUMNS = {'Unit Price', 'Total Price'}
+
+# Price Breakdown sheet: (calculate_valve_price key, header); all but the multiplier are money
+BREAKDOWN_COLUMNS = [
+    ('base_price', 'Base Price'),
+    ('pressure_multiplier', 'Pressure Multiplier'),
+    ('material_cost', 'Material Cost'),
+    ('actuator_cost', 'Actuator Cost'),
+    ('accessories_cost', 'Accessories Cost'),
+    ('total_price', 'Total Price'),
+]
+
+MONEY_FORMAT = '#,##0.00'
+
+
+def money_header(header, currency=DEFAULT_CURRENCY):
+    """``header`` labelled with the currency's symbol, e.g. 'Total Price (€)'."""
+    return f"{header} ({currency_symbol(currency)})"
+
+
+def write_proposal_xlsx(proposal, fp, price_db, material_db=None, price_tables=None):
+    """Write ``proposal`` as an .xlsx workbook to ``fp`` (a path or binary file).
+
+    The Proposal sheet has one typed row per item and a totals row; the
+    Price Breakdown sheet recalculates each item with the tables it was
+    priced with, noting items whose keys have no price data. ``price_tables``
+    maps price list version names to ``{currency: (price_db, material_db)}``;
+    an item pinning a ``price_version`` is broken down with the tables of its
+    version and currency, and noted when they are not given. Items pinning
+    none, or all items when ``price_tables`` is None, are broken down with
+    ``price_db`` and ``material_db``. Prices are labelled with
+    ``proposal.currency``, which the tables must be priced in. Items are
+    consumed in a single pass.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Proposal')
+    breakdown = workbook.create_sheet('Price Breakdown')
+    bold = Font(bold=True)
+
+    def styled(ws, value, font=None, number_format=None):
+        cell = WriteOnlyCell(ws, value=value)
+        if font:
+            cell.font = font
+        if number_format:
+            cell.number_format = number_format
+        return cell
+
+    for i, (_, _, width) in enumerate(PROPOSAL_SHEET_COLUMNS):
+        sheet.column_dimensions[get_column_letter(i + 1)].width = width
+    sheet.freeze_panes = 'A6'
+    sheet.append([styled(sheet, proposal.name, Font(bold=True, size=14))])
+    sheet.append(['Client', proposal.client_name])
+    sheet.append(['Date', proposal.date])
+    sheet.append([])
+    sheet.append([styled(sheet, money_header(header, proposal.currency) if header in MONEY_COLUMNS else header, bold)
+                  for header, _, _ in PROPOSAL_SHEET_COLUMNS])
+
+    breakdown.freeze_panes = 'A2'
+    breakdown.append([styled(breakdown, header, bold)
+                      for header in ['Item', 'Description', 'Price List',
+                                     *(header if name == 'pressure_multiplier' else money_header(header, proposal.currency)
+                                       for name, header in BREAKDOWN_COLUMNS),
+                                     'Quantity', 'Missing Price Data']])
+
+    total_price = 0
+    total_quantity = 0
+    count = 0
+    for count, item in enumerate(proposal.items, start=1):
+        row = [count]
+        for header, value, _ in PROPOSAL_SHEET_COLUMNS[1:]:
+            row.append(styled(sheet, value(item), number_format=MONEY_FORMAT) if header in MONEY_COLUMNS
+                       else value(item))
+        sheet.append(row)
+        total_price += item['total_price']
+        total_quantity += item['quantity']
+
+        description = row[1]
+        # The tables the item was priced with, so the breakdown adds up to its total
+        version_name = item.get('price_version')
+        tables = (price_db, material_db)
+        if price_tables is not None and version_name:
+            currency = item.get('currency') or proposal.currency
+            tables = price_tables.get(version_name, {}).get(currency)
+            if tables is None:
+                breakdown.append([count, description, version_name, *[None] * len(BREAKDOWN_COLUMNS),
+                                  item['quantity'], f"No price list {version_name} in {currency}"])
+                continue
+        try:
+            price_data = calculate_valve_price(item, *tables)
+        except KeyError as e:
+            breakdown.append([count, description, version_name, *[None] * len(BREAKDOWN_COLUMNS),
+                              item['quantity'], str(e)])
+        else:
+            breakdown.append([count, description, version_name,
+                              *[styled(breakdown, price_data[name],
+                                       number_format='0.00' if name == 'pressure_multiplier' else MONEY_FORMAT)
+                                for name, _ in BREAKDOWN_COLUMNS],
+                              item['quantity'], None])
+
+    totals = [None] * len(PROPOSAL_SHEET_COLUMNS)
+    totals[0] = styled(sheet, 'TOTAL', bold)
+    totals[-3] = styled(sheet, total_quantity, bold)
+    totals[-1] = styled(sheet, total_price, bold, MONEY_FORMAT)
+    sheet.append(totals)
+
+    workbook.save(fp)
@@ -0,0 +1,163 @@
+"""Shared cache of rendered valve figures.
+
+A figure depends only on the fields in :data:`FIGURE_FIELDS` and the colors
+the material database gives its materials, so renders are cached as encoded
+PNG bytes under a digest of those and shared by every session in the process,
+whichever price list version (material database) each one draws with.
+"""
+
+import hashlib
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from valvefigure.pricing import MATERIAL_DB
+
+# Valve fields that determine what generate_valve_figure draws
+FIGURE_FIELDS = ('size', 'pressure_rating', 'body_material', 'ball_material',
+                 'stem_material', 'actuator_type')
+
+# Valve fields whose material's color (MATERIAL_DB category) is drawn
+FIGURE_COLORS = (('body_material', 'Body/Bonnet'), ('ball_material', 'Ball'), ('stem_material', 'Stem'))
+
+# Enough for the full cartesian product of the built-in databases (17,280 figures)
+DEFAULT_MAXSIZE = int(os.environ.get('VALVEFIGURE_FIGURE_CACHE_SIZE', 20000))
+
+
+def figure_key(valve_data, material_db=None):
+    """Content address of a valve figure: a digest of its :data:`FIGURE_FIELDS`
+    and of its materials' colors in ``material_db`` (default MATERIAL_DB)."""
+    material_db = MATERIAL_DB if material_db is None else material_db
+    colors = (material_db.get(category, {}).get(valve_data[name], {}).get('color')
+              for name, category in FIGURE_COLORS)
+    content = '\x1f'.join([*(str(valve_data[name]) for name in FIGURE_FIELDS), *map(str, colors)])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def render_figure_png(valve_data, material_db=None):
+    """Render a valve figure and encode it as PNG bytes."""
+    # PIL is only loaded once a figure is actually drawn
+    from valvefigure.figure import generate_valve_figure
+
+    buffer = BytesIO()
+    generate_valve_figure(valve_data, material_db).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class FigureCache:
+    """Thread-safe LRU cache of valve figure PNGs, keyed by :func:`figure_key`.
+
+    ``material_db`` is the one figures are drawn with when a call names none.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, material_db=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.material_db = material_db
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, valve_data):
+        return figure_key(valve_data, self.material_db) in self._entries
+
+    def get_png(self, valve_data, material_db=None):
+        """PNG bytes of the figure for ``valve_data`` drawn with ``material_db``,
+        rendering it on a miss."""
+        material_db = self.material_db if material_db is None else material_db
+        key = figure_key(valve_data, material_db)
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png
+            self.misses += 1
+        # Render outside the lock; a concurrent miss on the same key only
+        # costs a duplicate render.
+        png = render_figure_png(valve_data, material_db)
+        self._store(key, png)
+        return png
+
+    def lookup(self, key):
+        """PNG bytes cached under the :func:`figure_key` ``key``, or None;
+        never renders."""
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png):
+        """Add a figure rendered elsewhere (e.g. in a worker process) under its
+        :func:`figure_key`."""
+        self._store(key, png)
+
+    def _store(self, key, png):
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters and the current fill of the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'bytes': sum(len(png) for png in self._entries.values()),
+            }
+
+    def warm_up(self, price_db, workers=None):
+        """Pre-render every figure the price and material databases allow.
+
+        Walks the cartesian product of sizes, ratings, body/ball/stem
+        materials and actuator types, skipping figures already cached, and
+        stops once the cache is full so warm-up never evicts its own renders.
+        Warm-up renders are not counted as misses. Returns the number of
+        figures rendered.
+        """
+        material_db = MATERIAL_DB if self.material_db is None else self.material_db
+        combinations = itertools.product(
+            price_db['Valve Size'], price_db['Pressure Rating'],
+            material_db['Body/Bonnet'], material_db['Ball'], material_db['Stem'],
+            price_db['Actuator Type'],
+        )
+        pending = []
+        for values in combinations:
+            if len(self._entries) + len(pending) >= self.maxsize:
+                break
+            valve_data = dict(zip(FIGURE_FIELDS, values))
+            key = figure_key(valve_data, material_db)
+            if key not in self._entries:
+                pending.append((key, valve_data))
+
+        def render(entry):
+            key, valve_data = entry
+            self._store(key, render_figure_png(valve_data, self.material_db))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(render, pending):
+                pass
+        return len(pending)
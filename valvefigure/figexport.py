@@ -0,0 +1,217 @@
+"""Batch figure export: every valve figure of a proposal as files.
+
+:func:`iter_figures_zip` writes one PNG per distinct figure (items whose
+:func:`~valvefigure.figcache.figure_key` match share it) and a
+``figures.csv`` index of the file each proposal line uses;
+:func:`iter_figure_sprite` tiles the same figures into a single sprite
+sheet PNG. Both are generators of byte chunks, like the CSV and streamed
+PDF writers.
+
+Figures are rendered by :func:`render_figures` in a process pool, in order
+of first use and only a few chunks ahead of the writer, and each one is
+written and dropped as soon as it is its turn, so memory stays flat however
+many figures a proposal has. The sprite sheet is encoded one row of tiles
+at a time.
+"""
+
+import os
+import re
+import struct
+import time
+import zlib
+import zipfile
+from collections import deque
+from io import BytesIO
+from itertools import islice
+
+from valvefigure.export import iter_proposal_csv
+from valvefigure.figcache import FIGURE_FIELDS, figure_key, render_figure_png
+
+INDEX_NAME = 'figures.csv'
+INDEX_COLUMNS = ('Line', 'Tag', 'Description', 'Quantity', 'Figure')
+
+# Figures rendered per worker task
+DEFAULT_CHUNK_SIZE = 16
+# Proposals up to this long render in the calling thread; starting worker
+# processes would take longer than the renders
+INLINE_MAX_ITEMS = 32
+# Chunks rendered ahead of the writer, per worker
+CHUNKS_AHEAD = 2
+
+SPRITE_COLUMNS = 10
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+# ========================
+# RENDERING
+# ========================
+def distinct_figures(valves, material_db=None):
+    """``(figure_key, valve)`` for the first valve of each distinct figure, in order."""
+    seen = set()
+    for valve in valves:
+        key = figure_key(valve, material_db)
+        if key not in seen:
+            seen.add(key)
+            yield key, valve
+
+
+def render_figure_chunk(valves, material_db=None):
+    """PNG bytes of each valve's figure. Runs in worker processes."""
+    return [render_figure_png(valve, material_db) for valve in valves]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def render_figures(valves, material_db=None, figure_cache=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield ``(figure_key, valve, png)`` for each distinct figure of the
+    sequence ``valves``, in order of first use.
+
+    Figures already in ``figure_cache`` (a
+    :class:`~valvefigure.figcache.FigureCache`) are taken from it; the
+    others are rendered and added to it. Renders run in a pool of ``workers`` processes (one per core by
+    default) for proposals longer than :data:`INLINE_MAX_ITEMS`, at most
+    :data:`CHUNKS_AHEAD` chunks per worker ahead of the consumer.
+    """
+    workers = workers or os.cpu_count() or 1
+    executor = None
+    if workers > 1 and len(valves) > INLINE_MAX_ITEMS:
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+
+        # Spawned workers do not inherit the server's threads and locks
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+
+    def finish(chunk, pngs, missing, future):
+        rendered = iter(future.result() if future is not None else render_figure_chunk(missing, material_db))
+        for (key, valve), png in zip(chunk, pngs):
+            if png is None:
+                png = next(rendered)
+                if figure_cache is not None:
+                    figure_cache.put(key, png)
+            yield key, valve, png
+
+    pending = deque()
+    try:
+        for chunk in _chunks(distinct_figures(valves, material_db), chunk_size):
+            pngs = [None if figure_cache is None else figure_cache.lookup(key) for key, _ in chunk]
+            # Workers only get the fields a figure is drawn from
+            missing = [{name: valve[name] for name in FIGURE_FIELDS}
+                       for (_, valve), png in zip(chunk, pngs) if png is None]
+            future = executor.submit(render_figure_chunk, missing, material_db) if executor and missing else None
+            pending.append((chunk, pngs, missing, future))
+            if len(pending) > CHUNKS_AHEAD * workers:
+                yield from finish(*pending.popleft())
+        while pending:
+            yield from finish(*pending.popleft())
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def figure_filename(valve, key=None):
+    """File name of a valve's figure: its size, rating, actuator and
+    materials, and the start of its :func:`~valvefigure.figcache.figure_key`."""
+    key = figure_key(valve) if key is None else key
+    name = '-'.join(str(valve[field]).replace('"', 'in') for field in
+                    ('size', 'pressure_rating', 'actuator_type', 'body_material', 'ball_material', 'stem_material'))
+    return f"{re.sub(r'[^A-Za-z0-9.]+', '_', name).strip('_')}-{key[:10]}.png"
+
+
+# ========================
+# ZIP ARCHIVE
+# ========================
+class _ChunkWriter:
+    """Write-only file object whose written bytes are taken with :meth:`take`."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_figures_zip(items, material_db=None, figure_cache=None, workers=None):
+    """Yield a ZIP archive of the distinct figures of ``items`` in byte chunks.
+
+    The archive holds one PNG per distinct figure, named by
+    :func:`figure_filename`, and :data:`INDEX_NAME`, listing
+    :data:`INDEX_COLUMNS` for every item. ``items`` is walked twice.
+    """
+    out = _ChunkWriter()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(out, 'w') as archive:
+        for key, valve, png in render_figures(items, material_db, figure_cache, workers):
+            # Stored as they are: PNGs are compressed already
+            archive.writestr(zipfile.ZipInfo(figure_filename(valve, key), date_time), png)
+            yield out.take()
+
+        rows = ({'Line': line, 'Tag': item.get('tag') or '',
+                 'Description': f"{item['size']} {item['type']} Valve",
+                 'Quantity': item['quantity'], 'Figure': figure_filename(item, figure_key(item, material_db))}
+                for line, item in enumerate(items, start=1))
+        info = zipfile.ZipInfo(INDEX_NAME, date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w') as index:
+            for chunk in iter_proposal_csv(rows, columns=INDEX_COLUMNS):
+                index.write(chunk)
+                yield out.take()
+    yield out.take()
+
+
+# ========================
+# SPRITE SHEET
+# ========================
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def iter_figure_sprite(items, material_db=None, figure_cache=None, columns=SPRITE_COLUMNS, workers=None):
+    """Yield one PNG tiling the distinct figures of ``items``, ``columns``
+    wide in order of first use, in byte chunks.
+
+    Rows of tiles are encoded as they fill, so only one row of figures is
+    held decoded. ``items`` is walked twice: once to size the sheet.
+    Raises ValueError for a proposal without items.
+    """
+    from PIL import Image
+
+    count = sum(1 for _ in distinct_figures(items, material_db))
+    if not count:
+        raise ValueError("The proposal has no figures to export")
+    columns = min(columns, count)
+    rows = -(-count // columns)
+    compressor = zlib.compressobj(6)
+    strip = None
+    for index, (_, _, png) in enumerate(render_figures(items, material_db, figure_cache, workers)):
+        tile = Image.open(BytesIO(png)).convert('RGB')
+        column = index % columns
+        if strip is None:
+            tile_width, tile_height = tile.size
+            yield _PNG_SIGNATURE + _png_chunk(b'IHDR', struct.pack(
+                '>IIBBBBB', columns * tile_width, rows * tile_height, 8, 2, 0, 0, 0))
+        if column == 0:
+            strip = Image.new('RGB', (columns * tile_width, tile_height), 'white')
+        strip.paste(tile, (column * tile_width, 0))
+        if column == columns - 1 or index == count - 1:
+            pixels = strip.tobytes()
+            stride = columns * tile_width * 3
+            # Each scanline starts with its filter type, 0 (none)
+            data = b''.join(compressor.compress(b'\x00' + pixels[offset:offset + stride])
+                            for offset in range(0, len(pixels), stride))
+            if data:
+                yield _png_chunk(b'IDAT', data)
+    yield _png_chunk(b'IDAT', compressor.flush()) + _png_chunk(b'IEND', b'')
@@ -0,0 +1,41 @@
+"""Valve figure rendering."""
+
+from PIL import Image, ImageDraw
+
+from valvefigure import metrics
+from valvefigure.pricing import MATERIAL_DB
+
+# ========================
+# VALVE FIGURE GENERATION
+# ========================
+@metrics.timed('figure_render_seconds')
+def generate_valve_figure(valve_data, material_db=None):
+    material_db = MATERIAL_DB if material_db is None else material_db
+
+    # Create a blank image with white background
+    img = Image.new('RGB', (400, 600), color='white')
+    draw = ImageDraw.Draw(img)
+
+    # Draw valve body
+    body_color = material_db['Body/Bonnet'][valve_data['body_material']]['color']
+    draw.rectangle([100, 100, 300, 400], fill=body_color, outline='black', width=2)
+
+    # Draw ball
+    ball_color = material_db['Ball'][valve_data['ball_material']]['color']
+    draw.ellipse([150, 200, 250, 300], fill=ball_color, outline='black', width=2)
+
+    # Draw stem
+    stem_color = material_db['Stem'][valve_data['stem_material']]['color']
+    draw.rectangle([190, 100, 210, 200], fill=stem_color, outline='black', width=1)
+
+    # Draw actuator
+    draw.rectangle([150, 50, 250, 100], fill='#FFD700', outline='black', width=2)
+
+    # Add labels
+    draw.text((200, 30), f"{valve_data['actuator_type']} Actuator", fill='black', anchor='ms')
+    draw.text((200, 450), f"{valve_data['size']} {valve_data['pressure_rating']}", fill='black', anchor='ms')
+    draw.text((200, 480), f"Body: {valve_data['body_material']}", fill='black', anchor='ms')
+    draw.text((200, 510), f"Ball: {valve_data['ball_material']}", fill='black', anchor='ms')
+    draw.text((200, 540), f"Stem: {valve_data['stem_material']}", fill='black', anchor='ms')
+
+    return img
@@ -0,0 +1,263 @@
+"""Proposal line items with stable IDs and running totals.
+
+Items are compact ``__slots__`` records rather than dict copies of the
+configured valve. :class:`ProposalItems` keeps them in insertion order under
+IDs that survive removals, and maintains the proposal totals on every add,
+edit and removal, so showing the total or a page of items never walks the
+whole proposal.
+"""
+
+import hashlib
+from operator import attrgetter
+
+# Fields of a priced valve configuration, in the order the configurator collects them
+ITEM_FIELDS = (
+    'op_pressure', 'op_temp', 'fluid_type', 'size', 'pressure_rating', 'type',
+    'fail_mode', 'actuator_type', 'accessories', 'quantity', 'notes',
+    'body_material', 'ball_material', 'stem_material', 'seat_material', 'trim_type',
+    'total_price', 'currency', 'price_version',
+)
+_ITEM_FIELD_SET = frozenset(ITEM_FIELDS)
+
+# Fields that define the valve itself: not its quantity, notes or price
+CONFIG_FIELDS = (
+    'op_pressure', 'op_temp', 'fluid_type', 'size', 'pressure_rating', 'type',
+    'fail_mode', 'actuator_type', 'accessories',
+    'body_material', 'ball_material', 'stem_material', 'seat_material', 'trim_type',
+)
+
+_ACCESSORIES = CONFIG_FIELDS.index('accessories')
+_NUMBERS = (CONFIG_FIELDS.index('op_pressure'), CONFIG_FIELDS.index('op_temp'))
+_config_of = attrgetter(*CONFIG_FIELDS)
+
+
+def _hash_config(values):
+    values = list(values)
+    values[_ACCESSORIES] = tuple(sorted(values[_ACCESSORIES] or ()))
+    for i in _NUMBERS:
+        # 50 and 50.0 bar are the same requirement
+        if type(values[i]) is int:
+            values[i] = float(values[i])
+    return hashlib.blake2b(repr(values).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def line_hash(valve):
+    """Hash of a valve's :data:`CONFIG_FIELDS`, as a hex string.
+
+    Equal for every line configuring the same valve, whatever its quantity,
+    notes, price or position, so it identifies a line across quote revisions.
+    """
+    if isinstance(valve, ProposalItem):
+        return valve.line_hash
+    return _hash_config([valve.get(name) for name in CONFIG_FIELDS])
+
+
+class ProposalItem:
+    """One priced valve in a proposal.
+
+    Supports read-only mapping access (``item['size']``, ``item.get()``,
+    ``dict(item)``) so it can be rendered like the valve dicts it replaces.
+    Fields outside :data:`ITEM_FIELDS` are kept in ``extra``.
+    """
+
+    __slots__ = ('item_id', 'extra', '_digest', '_line_hash', *ITEM_FIELDS)
+
+    def __init__(self, item_id, valve):
+        self.item_id = item_id
+        self.extra = None
+        self._digest = None
+        self._line_hash = None
+        for name in ITEM_FIELDS:
+            setattr(self, name, valve.get(name))
+        extra = {name: value for name, value in valve.items() if name not in _ITEM_FIELD_SET}
+        if extra:
+            self.extra = extra
+
+    def keys(self):
+        return [*ITEM_FIELDS, *(self.extra or ())]
+
+    def __getitem__(self, name):
+        if name in _ITEM_FIELD_SET:
+            return getattr(self, name)
+        if self.extra and name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in _ITEM_FIELD_SET or bool(self.extra and name in self.extra)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        return {name: self[name] for name in self.keys()}
+
+    @property
+    def digest(self):
+        """Content hash of the item's fields (not its ID), as bytes.
+
+        Computed once: records are replaced on every change, never mutated.
+        """
+        if self._digest is None:
+            content = repr((tuple(getattr(self, name) for name in ITEM_FIELDS),
+                            sorted((self.extra or {}).items())))
+            self._digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+        return self._digest
+
+    @property
+    def line_hash(self):
+        """The :func:`line_hash` of the item's configuration, computed once."""
+        if self._line_hash is None:
+            self._line_hash = _hash_config(_config_of(self))
+        return self._line_hash
+
+    def __getstate__(self):
+        return self.item_id, self.as_dict()
+
+    def __setstate__(self, state):
+        item_id, valve = state
+        self.__init__(item_id, valve)
+
+    def __repr__(self):
+        return f'ProposalItem({self.item_id}, {self.size} {self.type}, total_price={self.total_price})'
+
+
+class ProposalItems:
+    """Ordered collection of :class:`ProposalItem` records keyed by stable ID.
+
+    Iterating yields the items in the order they were added, or that
+    :meth:`reorder` set; IDs say nothing about position. ``total_price``
+    and ``total_quantity`` are kept up to date incrementally. When set,
+    ``on_change(item_id, item)`` is called after every change, with ``item``
+    None for a removal and both None when the collection is cleared, and
+    ``on_reorder(item_ids)`` after every :meth:`reorder`.
+    """
+
+    def __init__(self, valves=()):
+        self._items = {}
+        # Item IDs in order, for paging; None until needed again after a removal
+        self._order = []
+        self._next_id = 1
+        self.total_price = 0
+        self.total_quantity = 0
+        self.on_change = None
+        self.on_reorder = None
+        for valve in valves:
+            self.add(valve)
+
+    @classmethod
+    def from_records(cls, records):
+        """Rebuild a collection from ``(item_id, valve)`` pairs, keeping their
+        IDs and order."""
+        items = cls()
+        for item_id, valve in records:
+            item = ProposalItem(item_id, valve)
+            items._items[item_id] = item
+            items._order.append(item_id)
+            items._account(item, +1)
+            items._next_id = max(items._next_id, item_id + 1)
+        return items
+
+    def copy(self):
+        """A collection of the same items under the same IDs, sharing the
+        records (they are never mutated); the hooks are not copied."""
+        items = ProposalItems()
+        items._items = dict(self._items)
+        items._order = None if self._order is None else list(self._order)
+        items._next_id = self._next_id
+        items.total_price = self.total_price
+        items.total_quantity = self.total_quantity
+        return items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def get(self, item_id):
+        """The item with ``item_id``; raises KeyError when it was removed."""
+        return self._items[item_id]
+
+    def _account(self, item, sign):
+        self.total_price += sign * item.total_price
+        self.total_quantity += sign * item.quantity
+        if not self._items:
+            # Nothing left: drop any floating point residue
+            self.total_price = 0
+            self.total_quantity = 0
+
+    def add(self, valve):
+        """Add a priced valve (a mapping with ``total_price``); returns its ID."""
+        item = ProposalItem(self._next_id, valve)
+        self._next_id += 1
+        self._items[item.item_id] = item
+        if self._order is not None:
+            self._order.append(item.item_id)
+        self._account(item, +1)
+        self._changed(item.item_id, item)
+        return item.item_id
+
+    def remove(self, item_id):
+        item = self._items.pop(item_id)
+        # Rebuilt once by the next page() rather than searched on every removal
+        self._order = None
+        self._account(item, -1)
+        self._changed(item_id, None)
+        return item
+
+    def update(self, item_id, **changes):
+        """Change fields of an item, replacing its record and its share of the totals."""
+        old = self._items[item_id]
+        new = ProposalItem(item_id, {**old.as_dict(), **changes})
+        self._account(old, -1)
+        self._items[item_id] = new
+        self._account(new, +1)
+        self._changed(item_id, new)
+        return new
+
+    def clear(self):
+        self._items.clear()
+        self._order = []
+        self.total_price = 0
+        self.total_quantity = 0
+        self._changed(None, None)
+
+    def reorder(self, item_ids):
+        """Put the items in the order of ``item_ids``, which must list every
+        item's ID exactly once. IDs and records are kept."""
+        item_ids = list(item_ids)
+        if len(item_ids) != len(self._items) or set(item_ids) != self._items.keys():
+            raise ValueError("The new order must list every item exactly once")
+        self._items = {item_id: self._items[item_id] for item_id in item_ids}
+        self._order = list(item_ids)
+        if self.on_reorder is not None:
+            self.on_reorder(item_ids)
+
+    def _changed(self, item_id, item):
+        if self.on_change is not None:
+            self.on_change(item_id, item)
+
+    def page_count(self, per_page):
+        return max(1, -(-len(self._items) // per_page))
+
+    def page(self, number, per_page):
+        """Items on 1-based page ``number`` as (position, item) pairs.
+
+        Costs the page's length, not its offset, except for the first page
+        shown after a removal.
+        """
+        if self._order is None:
+            self._order = list(self._items)
+        start = (number - 1) * per_page
+        return [(position, self._items[item_id])
+                for position, item_id in enumerate(self._order[start:start + per_page], start=start + 1)]
@@ -0,0 +1,290 @@
+"""Background document exports: proposal PDF, CSV, Excel and figure files off the script thread.
+
+:class:`ExportQueue` renders documents in a small thread pool shared by every
+session, so a large proposal never freezes the page that asked for it and
+concurrent requests queue for a bounded number of workers instead of piling
+up on the server. Each :class:`ExportJob` renders a snapshot of the proposal
+taken when it was submitted and reports its progress as items are consumed.
+
+Finished documents are cached under :func:`proposal_digest`, a hash of the
+proposal's contents, the document kind and everything else it is rendered
+from: asking again for an unchanged proposal returns the finished job at
+once, and identical requests in flight share one job. Streamed PDFs also
+share a :class:`~valvefigure.pdfstream.PageCache`, so rendering a revision of
+a long proposal only lays out the pages that changed, and figure exports
+reuse the figures in the queue's
+:class:`~valvefigure.figcache.FigureCache`.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from io import BytesIO
+
+from valvefigure import metrics
+from valvefigure.export import XLSX_MIME, iter_proposal_csv, write_proposal_xlsx
+from valvefigure.items import ProposalItem
+
+PDF = 'pdf'
+CSV = 'csv'
+XLSX = 'xlsx'
+# Every distinct figure as a ZIP of PNGs, or tiled into one sprite sheet PNG
+FIGURES = 'figures'
+SPRITE = 'sprite'
+
+# Proposals longer than this are rendered with the streaming PDF writer
+STREAMING_PDF_ITEMS = 500
+
+DEFAULT_WORKERS = int(os.environ.get('VALVEFIGURE_EXPORT_WORKERS', 2))
+# Finished documents kept for repeat downloads, by total size
+DEFAULT_CACHE_BYTES = int(os.environ.get('VALVEFIGURE_EXPORT_CACHE_MB', 256)) * 1024 * 1024
+
+
+def _hash_value(digest, value):
+    digest.update(json.dumps(value, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(b'\x1e')
+
+
+def proposal_digest(kind, proposal, **inputs):
+    """Content hash of the ``kind`` document of ``proposal`` rendered with ``inputs``.
+
+    :class:`~valvefigure.items.ProposalItem` records contribute the digest
+    they keep, so hashing an unchanged proposal again costs little.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    _hash_value(digest, [kind, proposal.name, proposal.client_name, proposal.date, proposal.currency, inputs])
+    digest.update(hashlib.blake2b(proposal.logo_bytes or b'').digest())
+    for item in proposal.items:
+        if isinstance(item, ProposalItem):
+            digest.update(item.digest)
+        else:
+            _hash_value(digest, item)
+    return digest.hexdigest()
+
+
+class _TrackedItems:
+    """Proposal items that count how many have been consumed, over all passes."""
+
+    def __init__(self, items):
+        self._items = items
+        self.consumed = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        for item in self._items:
+            yield item
+            self.consumed += 1
+
+
+# ========================
+# DOCUMENTS
+# ========================
+# Renderers take the proposal and the job's inputs and return the document bytes
+def _render_pdf(proposal, figures=False, material_db=None, page_cache=None):
+    if len(proposal.items) > STREAMING_PDF_ITEMS:
+        from valvefigure.pdfstream import iter_proposal_pdf
+
+        return b''.join(iter_proposal_pdf(proposal, figures=figures, material_db=material_db,
+                                          page_cache=page_cache))
+    from valvefigure.proposal import generate_proposal_pdf
+
+    return generate_proposal_pdf(proposal, figures=figures, material_db=material_db).getvalue()
+
+
+def _pdf_passes(item_count, figures=False, material_db=None, page_cache=None):
+    # generate_proposal_pdf walks the items for the table and the figure section
+    return 1 if item_count > STREAMING_PDF_ITEMS or not figures else 2
+
+
+def _render_csv(proposal):
+    return b''.join(iter_proposal_csv(proposal.items))
+
+
+def _render_xlsx(proposal, price_db, material_db=None, price_tables=None):
+    buffer = BytesIO()
+    write_proposal_xlsx(proposal, buffer, price_db, material_db, price_tables)
+    return buffer.getvalue()
+
+
+def _render_figures(proposal, material_db=None, figure_cache=None):
+    from valvefigure.figexport import iter_figures_zip
+
+    return b''.join(iter_figures_zip(proposal.items, material_db, figure_cache))
+
+
+def _render_sprite(proposal, material_db=None, figure_cache=None):
+    from valvefigure.figexport import iter_figure_sprite
+
+    return b''.join(iter_figure_sprite(proposal.items, material_db, figure_cache))
+
+
+def _figure_passes(item_count, material_db=None, figure_cache=None):
+    # The figures and the ZIP's index, or the sprite sheet's size and its figures
+    return 2
+
+
+# kind: (render, passes over the items, MIME type, file extension)
+DOCUMENTS = {
+    PDF: (_render_pdf, _pdf_passes, 'application/pdf', 'pdf'),
+    CSV: (_render_csv, None, 'text/csv', 'csv'),
+    XLSX: (_render_xlsx, None, XLSX_MIME, 'xlsx'),
+    FIGURES: (_render_figures, _figure_passes, 'application/zip', 'zip'),
+    SPRITE: (_render_sprite, _figure_passes, 'image/png', 'png'),
+}
+
+
+class ExportJob:
+    """One document rendered in the background by an :class:`ExportQueue`.
+
+    Poll :attr:`progress` and :attr:`done`; once done, :attr:`data` holds the
+    document, or :attr:`failure` the exception that stopped it.
+    """
+
+    def __init__(self, kind, proposal, digest, inputs):
+        render, passes, self.mime, self.extension = DOCUMENTS[kind]
+        self.kind = kind
+        self.digest = digest
+        self.item_count = len(proposal.items)
+        self._items = _TrackedItems(proposal.items)
+        self._proposal = replace(proposal, items=self._items)
+        self._render = render
+        self._inputs = inputs
+        self._passes = passes(self.item_count, **inputs) if passes else 1
+        self.data = None
+        self.failure = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def progress(self):
+        """Fraction of the document rendered, from 0.0 to 1.0."""
+        if self.done:
+            return 1.0
+        if not self.item_count:
+            return 0.0
+        # Items are the bulk of the work; the last percent is the file itself
+        return min(self._items.consumed / (self.item_count * self._passes), 0.99)
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.submitted_at
+
+    def wait(self, timeout=None):
+        """Block until the job is done; returns :attr:`done`."""
+        return self._done.wait(timeout)
+
+    def _run(self):
+        try:
+            with metrics.timer('export_seconds', kind=self.kind):
+                self.data = self._render(self._proposal, **self._inputs)
+        except Exception as e:  # surfaced through .failure instead of dying silently
+            self.failure = e
+        finally:
+            # Drop the snapshot; only the document is kept
+            self._proposal = self._items = None
+            self.finished_at = time.time()
+            self._done.set()
+
+
+class ExportQueue:
+    """Renders proposal documents in ``workers`` background threads.
+
+    Safe to share between threads and sessions. Finished documents are kept,
+    least recently requested first out, up to ``cache_bytes`` in total.
+    Figure exports take figures from, and add them to, ``figure_cache``.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, cache_bytes=DEFAULT_CACHE_BYTES, figure_cache=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.cache_bytes = cache_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        # digest -> job, queued, running or finished
+        self._jobs = OrderedDict()
+        # digest -> size of each finished document
+        self._sizes = {}
+        self._page_cache = None
+        self.figure_cache = figure_cache
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def page_cache(self):
+        """Pages and figures of the streamed PDFs, created on first use."""
+        if self._page_cache is None:
+            from valvefigure.pdfstream import PageCache
+
+            with self._lock:
+                if self._page_cache is None:
+                    self._page_cache = PageCache()
+        return self._page_cache
+
+    def submit(self, kind, proposal, **inputs):
+        """The job rendering the ``kind`` document of ``proposal``.
+
+        ``inputs`` are the renderer's other arguments (PDF: ``figures``,
+        ``material_db``; Excel: ``price_db``, ``material_db``,
+        ``price_tables``; figures and sprite sheet: ``material_db``). The
+        items are copied, so the proposal may change while the job runs.
+        Returns a finished job at once when the same document was rendered
+        before.
+        """
+        if kind not in DOCUMENTS:
+            raise ValueError(f"Unknown document kind: {kind!r}")
+        # Items are replaced on change, never mutated, so a shallow copy is a snapshot
+        proposal = replace(proposal, items=list(proposal.items))
+        digest = proposal_digest(kind, proposal, **inputs)
+        if kind == PDF and len(proposal.items) > STREAMING_PDF_ITEMS:
+            # Cached pages only make rendering faster, so they stay out of the digest
+            inputs = {**inputs, 'page_cache': self.page_cache}
+        elif kind in (FIGURES, SPRITE) and self.figure_cache is not None:
+            inputs = {**inputs, 'figure_cache': self.figure_cache}
+        with self._lock:
+            job = self._jobs.get(digest)
+            if job is not None and job.failure is None:
+                self._jobs.move_to_end(digest)
+                self.hits += 1
+                return job
+            self.misses += 1
+            job = ExportJob(kind, proposal, digest, inputs)
+            self._jobs[digest] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        job._run()
+        with self._lock:
+            if self._jobs.get(job.digest) is not job:
+                return
+            if job.failure is not None:
+                # Failures are not cached: the next request tries again
+                del self._jobs[job.digest]
+                return
+            self._sizes[job.digest] = len(job.data)
+            cached_bytes = sum(self._sizes.values())
+            # Least recently requested first; queued and running jobs stay
+            for digest in [digest for digest in self._jobs if digest in self._sizes]:
+                if cached_bytes <= self.cache_bytes:
+                    break
+                del self._jobs[digest]
+                cached_bytes -= self._sizes.pop(digest)
+
+    def stats(self):
+        with self._lock:
+            return {'jobs': len(self._jobs), 'cached_bytes': sum(self._sizes.values()),
+                    'hits': self.hits, 'misses': self.misses}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,72 @@
+"""Company logo preparation for proposal documents.
+
+A logo is decoded, flattened onto white and downscaled once, then kept as a
+compressed RGB raster keyed by the digest of the uploaded bytes. Every page of
+a document, and every document using the same logo, embeds that one raster.
+"""
+
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+
+# Large enough for the 25 mm wide header logo at 600 dpi
+MAX_LOGO_PIXELS = 600
+
+_CACHE_SIZE = 16
+
+
+class LogoError(ValueError):
+    """The logo could not be decoded as an image."""
+
+
+@dataclass(frozen=True)
+class Logo:
+    """A decoded logo: ``data`` is its zlib-compressed 8-bit RGB pixels."""
+    digest: str
+    width: int
+    height: int
+    data: bytes
+
+    def height_for(self, width):
+        """Height of the logo drawn ``width`` units wide."""
+        return width * self.height / self.width
+
+
+_logos = OrderedDict()
+_logos_lock = threading.Lock()
+
+
+def _decode(logo_bytes, digest):
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(BytesIO(logo_bytes)) as img:
+            img.thumbnail((MAX_LOGO_PIXELS, MAX_LOGO_PIXELS))
+            img = img.convert('RGBA')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        raise LogoError(f"Could not read the logo image: {e}") from e
+    flat = Image.new('RGB', img.size, 'white')
+    flat.paste(img, mask=img.getchannel('A'))
+    return Logo(digest, flat.width, flat.height, zlib.compress(flat.tobytes()))
+
+
+def prepare_logo(logo_bytes):
+    """Decode ``logo_bytes`` into a :class:`Logo`, reusing earlier decodes.
+
+    Raises :class:`LogoError` when the bytes are not a readable image.
+    """
+    digest = hashlib.sha256(logo_bytes).hexdigest()
+    with _logos_lock:
+        logo = _logos.get(digest)
+        if logo is not None:
+            _logos.move_to_end(digest)
+            return logo
+    logo = _decode(logo_bytes, digest)
+    with _logos_lock:
+        _logos[digest] = logo
+        while len(_logos) > _CACHE_SIZE:
+            _logos.popitem(last=False)
+    return logo
@@ -0,0 +1,302 @@
+"""Hot-path timings, counters and gauges, exported as Prometheus text.
+
+Metrics are off unless ``VALVEFIGURE_METRICS`` (a file path) or
+``VALVEFIGURE_METRICS_PORT`` is set when the package is imported. While off,
+:func:`timed` returns the decorated function itself and :func:`timer`,
+:func:`observe`, :func:`count` and :func:`session_seen` do nothing, so instrumented code runs
+as if it were not.
+
+When on, durations are recorded in log-spaced histograms (about 9% wide
+buckets from 1 µs to 2 minutes), so recording is O(1) and memory is fixed
+however many calls are observed, and exported as Prometheus summaries with
+p50/p95/p99 estimated from the buckets. :class:`MetricsExporter` writes the
+text to ``VALVEFIGURE_METRICS`` every few seconds, for node_exporter's
+textfile collector or a sidecar, and serves it at
+``http://127.0.0.1:<VALVEFIGURE_METRICS_PORT>/metrics``.
+"""
+
+import contextlib
+import functools
+import math
+import os
+import threading
+import time
+
+METRICS_PATH = os.environ.get('VALVEFIGURE_METRICS')
+METRICS_PORT = os.environ.get('VALVEFIGURE_METRICS_PORT')
+ENABLED = bool(METRICS_PATH or METRICS_PORT)
+
+PREFIX = 'valvefigure_'
+QUANTILES = (0.5, 0.95, 0.99)
+WRITE_INTERVAL = 5.0
+# Sessions that reran within this many seconds count as active
+SESSION_WINDOW = 300.0
+
+# Histogram buckets: bucket i holds durations in [MIN * FACTOR**i, MIN * FACTOR**(i + 1))
+_MIN_SECONDS = 1e-6
+_FACTOR = 2 ** 0.125
+_BUCKETS = math.ceil(math.log(120 / _MIN_SECONDS, _FACTOR)) + 1
+_LOG_FACTOR = math.log(_FACTOR)
+
+# Exported families: name without PREFIX -> help text
+DESCRIPTIONS = {
+    'price_seconds': "Time to price one valve configuration.",
+    'figure_render_seconds': "Time to draw one raster valve figure.",
+    'proposal_pdf_seconds': "Time to render a proposal PDF in memory.",
+    'export_seconds': "Time to render a background export, by document kind.",
+    'tab_render_seconds': "Time to render the configurator page shown in a rerun, by page.",
+    'rerun_seconds': "Time of a whole configurator script run.",
+    'valves_quoted_total': "Valves added to proposals, by valve type and size.",
+    'active_sessions': f"Sessions that reran in the last {SESSION_WINDOW:.0f} seconds.",
+}
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * _BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = int(math.log(seconds / _MIN_SECONDS) / _LOG_FACTOR) if seconds > _MIN_SECONDS else 0
+        self.buckets[min(index, _BUCKETS - 1)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Estimate of the ``q`` quantile, interpolated geometrically within its
+        bucket and kept within the observed range."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                fraction = (rank - seen) / n
+                return min(max(_MIN_SECONDS * _FACTOR ** (index + fraction), self.min), self.max)
+            seen += n
+        return self.max
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Registry:
+    """Thread-safe store of every series, keyed by family name and label pairs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.sessions = {}
+        # name -> callable returning {label pairs: value}, sampled at export
+        self.collectors = {}
+
+    def histogram(self, name, labels):
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[name, labels] = _Histogram()
+            return histogram
+
+    def observe(self, name, labels, seconds):
+        histogram = self.histogram(name, labels)
+        with self._lock:
+            histogram.observe(seconds)
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[name, labels] = self.counters.get((name, labels), 0) + amount
+
+    def session_seen(self, session_id):
+        with self._lock:
+            self.sessions[session_id] = time.monotonic()
+
+    def active_sessions(self):
+        cutoff = time.monotonic() - SESSION_WINDOW
+        with self._lock:
+            for session_id, seen in list(self.sessions.items()):
+                if seen < cutoff:
+                    del self.sessions[session_id]
+            return len(self.sessions)
+
+    def render(self):
+        """Every series in the Prometheus text exposition format."""
+        families = {}
+        with self._lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                lines = families.setdefault((name, 'summary'), [])
+                for q in QUANTILES:
+                    lines.append(f'{PREFIX}{name}{_labels((*labels, ("quantile", q)))} '
+                                 f'{histogram.quantile(q):.6g}')
+                lines.append(f'{PREFIX}{name}_sum{_labels(labels)} {histogram.sum:.6g}')
+                lines.append(f'{PREFIX}{name}_count{_labels(labels)} {histogram.count}')
+            for (name, labels), value in sorted(self.counters.items()):
+                families.setdefault((name, 'counter'), []).append(f'{PREFIX}{name}{_labels(labels)} {value}')
+            collectors = list(self.collectors.items())
+        families[('active_sessions', 'gauge')] = [f'{PREFIX}active_sessions {self.active_sessions()}']
+        for name, collect in collectors:
+            kind = 'counter' if name.endswith('_total') else 'gauge'
+            families[(name, kind)] = [f'{PREFIX}{name}{_labels(labels)} {value}'
+                                      for labels, value in sorted(collect().items())]
+        out = []
+        for (name, kind), lines in families.items():
+            if name in DESCRIPTIONS:
+                out.append(f'# HELP {PREFIX}{name} {DESCRIPTIONS[name]}')
+            out.append(f'# TYPE {PREFIX}{name} {kind}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# ========================
+# INSTRUMENTATION
+# ========================
+def timed(name, **labels):
+    """Decorator recording each call's duration under ``name``; returns the
+    function unchanged when metrics are off."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        histogram = REGISTRY.histogram(name, tuple(sorted(labels.items())))
+        lock = REGISTRY._lock
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                with lock:
+                    histogram.observe(elapsed)
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def _timer(name, labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, labels, time.perf_counter() - start)
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def timer(name, **labels):
+    """Context manager recording the duration of its block under ``name``."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _timer(name, tuple(sorted(labels.items())))
+
+
+def observe(name, seconds, **labels):
+    """Record a duration measured by the caller under ``name``."""
+    if ENABLED:
+        REGISTRY.observe(name, tuple(sorted(labels.items())), seconds)
+
+
+def count(name, amount=1, **labels):
+    """Add ``amount`` to the counter ``name`` (end it in ``_total``)."""
+    if ENABLED:
+        REGISTRY.increment(name, tuple(sorted(labels.items())), amount)
+
+
+def session_seen(session_id):
+    """Mark the session as active now."""
+    if ENABLED:
+        REGISTRY.session_seen(session_id)
+
+
+def register_collector(name, collect, description=None):
+    """Sample ``collect()``, a ``{label pairs: value}`` dict, at every export as
+    the family ``name`` (a counter when it ends in ``_total``, else a gauge)."""
+    if ENABLED:
+        if description:
+            DESCRIPTIONS[name] = description
+        REGISTRY.collectors[name] = collect
+
+
+# ========================
+# EXPORT
+# ========================
+def write_metrics(path, registry=REGISTRY):
+    """Write the current metrics to ``path`` atomically."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+class MetricsExporter:
+    """Exports ``registry`` to ``path`` every ``interval`` seconds and over
+    HTTP at 127.0.0.1:``port``/metrics, for whichever is set.
+
+    Runs in daemon threads once started; a failed file write is kept in
+    ``last_error`` and retried at the next interval.
+    """
+
+    def __init__(self, path=METRICS_PATH, port=METRICS_PORT, interval=WRITE_INTERVAL, registry=REGISTRY):
+        self.path = path
+        self.port = int(port) if port else None
+        self.interval = interval
+        self.registry = registry
+        self.last_error = None
+        self.server = None
+
+    def start(self):
+        if self.path:
+            threading.Thread(target=self._write_forever, daemon=True, name='metrics-writer').start()
+        if self.port:
+            self.server = self._serve()
+        return self
+
+    def _write_forever(self):
+        while True:
+            try:
+                write_metrics(self.path, self.registry)
+            except OSError as e:  # keep exporting; surfaced through last_error
+                self.last_error = e
+            time.sleep(self.interval)
+
+    def _serve(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', self.port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+        return server
@@ -0,0 +1,539 @@
+"""Streaming PDF proposal renderer for very large proposals.
+
+:func:`generate_proposal_pdf` builds the whole FPDF document in memory. The
+renderer here writes the same proposal one page at a time: each page's
+content stream is compressed and emitted as soon as its rows are laid out,
+and only the byte offsets of finished objects are kept. Memory therefore
+stays flat as the item count grows, and a download can start with the first
+page. The table header is repeated on every page.
+
+Layout follows :func:`generate_proposal_pdf`: A4 portrait, millimetre
+coordinates, Helvetica core fonts in WinAnsi encoding.
+
+Rendering a revised proposal again can reuse the previous render's work
+through a :class:`PageCache`: every full page is keyed by what is drawn on
+it, so only the pages whose rows changed are laid out and compressed, and
+vector figures already compiled are not drawn again.
+"""
+
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+
+from valvefigure.logo import prepare_logo
+from valvefigure.pdftext import BOLD, FONTS, ITALIC, REGULAR, K, escape, pdf_text, text_width
+from valvefigure.proposal import (
+    FIGURE_CAPTION_HEIGHT, FIGURE_COLUMNS, FIGURE_ROW_HEIGHT, FIGURE_THUMB_HEIGHT, FIGURE_THUMB_WIDTH,
+    TABLE_COLUMNS, figure_caption, proposal_notes, table_columns, table_row,
+)
+
+PAGE_WIDTH = 210.0
+PAGE_HEIGHT = 297.0
+MARGIN = 10.0
+BOTTOM_MARGIN = 20.0
+CELL_MARGIN = 1.0
+ROW_HEIGHT = 10.0
+LINE_WIDTH = 0.2
+
+# Fixed object numbers; pages and their content streams follow.
+CATALOG_OBJ = 1
+PAGES_OBJ = 2
+RESOURCES_OBJ = 3
+FIRST_FONT_OBJ = 4
+LOGO_OBJ = FIRST_FONT_OBJ + len(FONTS)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Compressed pages a PageCache keeps, by total size
+DEFAULT_PAGE_CACHE_BYTES = 64 * 1024 * 1024
+# Compiled figures a PageCache keeps; a distinct figure's form is about a kB
+DEFAULT_MAX_FORMS = 20_000
+
+
+@lru_cache(maxsize=4096)
+def _fit(text, width, font, size):
+    """Truncate ``text`` with '...' so it fits a cell of ``width`` mm."""
+    room = width - 2 * CELL_MARGIN
+    if text_width(text, font, size) <= room:
+        return text
+    while text and text_width(text + '...', font, size) > room:
+        text = text[:-1]
+    return text + '...'
+
+
+def _wrap(text, width, font, size):
+    """Split ``text`` into lines no wider than ``width`` mm, breaking at spaces."""
+    lines, line = [], ''
+    for word in text.split(' '):
+        candidate = f'{line} {word}' if line else word
+        if line and text_width(candidate, font, size) > width - 2 * CELL_MARGIN:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    lines.append(line)
+    return lines
+
+
+class _Page:
+    """Content stream of one page being laid out, in FPDF's coordinate model
+    (origin top-left, millimetres, cursor moving down the page)."""
+
+    def __init__(self):
+        self.ops = [f'{LINE_WIDTH * K:.2f} w']
+        self.y = MARGIN
+
+    def cell(self, x, width, height, text, font, size, border=False, align='L'):
+        """Draw a cell at the cursor; ``text`` must already be passed through pdf_text."""
+        if border:
+            self.ops.append(f'{x * K:.2f} {(PAGE_HEIGHT - self.y) * K:.2f} '
+                            f'{width * K:.2f} {-height * K:.2f} re S')
+        if text:
+            if align == 'C':
+                dx = (width - text_width(text, font, size)) / 2
+            elif align == 'R':
+                dx = width - CELL_MARGIN - text_width(text, font, size)
+            else:
+                dx = CELL_MARGIN
+            baseline = self.y + 0.5 * height + 0.3 * size / K
+            self.ops.append(f'BT /{font} {size:.2f} Tf {(x + dx) * K:.2f} '
+                            f'{(PAGE_HEIGHT - baseline) * K:.2f} Td ({escape(text)}) Tj ET')
+
+    def line(self, text, font, size, height, align='L'):
+        """A full-width borderless cell, moving the cursor to the next line."""
+        self.cell(MARGIN, PAGE_WIDTH - 2 * MARGIN, height, pdf_text(text), font, size, align=align)
+        self.y += height
+
+    def image(self, name, x, y, width, height):
+        self.ops.append(f'q {width * K:.2f} 0 0 {height * K:.2f} {x * K:.2f} '
+                        f'{(PAGE_HEIGHT - y - height) * K:.2f} cm /{name} Do Q')
+
+    def form(self, name, x, y, width, height, box_width, box_height):
+        """Draw form XObject ``name`` with a ``box_width`` x ``box_height``
+        bounding box scaled into the given rectangle."""
+        self.ops.append(f'q {width * K / box_width:.4f} 0 0 {height * K / box_height:.4f} {x * K:.2f} '
+                        f'{(PAGE_HEIGHT - y - height) * K:.2f} cm /{name} Do Q')
+
+    def fits(self, height):
+        return self.y + height <= PAGE_HEIGHT - BOTTOM_MARGIN
+
+    def content(self):
+        return zlib.compress('\n'.join(self.ops).encode('latin1'))
+
+
+class PageCache:
+    """Page content streams, table rows and figure forms kept between renders.
+
+    Safe to share between threads and renders. Pages are keyed by their
+    page number and everything drawn on them, rows by their contents and
+    position, so a page with one changed row only lays that row out again.
+    Both are dropped least recently used first past ``max_bytes``. Figure
+    forms are dropped when a render uses another ``material_db``, as their
+    colors come from it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_PAGE_CACHE_BYTES, max_forms=DEFAULT_MAX_FORMS):
+        self.max_bytes = max_bytes
+        self.max_forms = max_forms
+        # key -> (compressed page or row ops, size in bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._forms = {}
+        self._material_db = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self._bytes -= dropped
+
+    def page(self, key):
+        """The compressed content stream stored under ``key``, or None."""
+        return self._get(key)
+
+    def put_page(self, key, content):
+        self._put(key, content, len(content))
+
+    def row(self, key):
+        """The drawing ops of the table row stored under ``key``, or None."""
+        return self._get(key)
+
+    def put_row(self, key, ops):
+        self._put(key, ops, sum(map(len, ops)))
+
+    def form(self, key, material_db):
+        """Form XObject body of the figure stored under ``key`` for ``material_db``, or None."""
+        with self._lock:
+            if material_db is not self._material_db:
+                self._material_db = material_db
+                self._forms.clear()
+            return self._forms.get(key)
+
+    def put_form(self, key, material_db, body):
+        with self._lock:
+            if material_db is self._material_db and len(self._forms) < self.max_forms:
+                self._forms[key] = body
+
+    def copy(self):
+        """A new cache holding this one's entries."""
+        cache = PageCache(self.max_bytes, self.max_forms)
+        with self._lock:
+            cache._entries = OrderedDict(self._entries)
+            cache._bytes = self._bytes
+            cache._forms = dict(self._forms)
+            cache._material_db = self._material_db
+        return cache
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'forms': len(self._forms),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def _row_digest(item):
+    """Content hash of an item's table row: the digest proposal items keep
+    (covering every field, so never stale), else a hash of the row itself."""
+    digest = getattr(item, 'digest', None)
+    if isinstance(digest, bytes):
+        return digest
+    return hashlib.blake2b(repr(table_row(item)).encode('utf-8'), digest_size=16).digest()
+
+
+def _image_xobject(raster):
+    """PDF image XObject body for a decoded RGB raster such as a logo."""
+    header = (f'<< /Type /XObject /Subtype /Image /Width {raster.width} /Height {raster.height} '
+              f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode '
+              f'/Length {len(raster.data)} >>\nstream\n').encode('latin1')
+    return header + raster.data + b'\nendstream'
+
+
+class _ProposalLayout:
+    """Lays the proposal out page by page."""
+
+    def __init__(self, proposal, logo=None, figures=False, material_db=None, page_cache=None):
+        self.proposal = proposal
+        self.logo = logo
+        self.page_no = 0
+        self.figures = figures
+        self.material_db = material_db
+        self.page_cache = page_cache
+        # (resource name, form XObject body) of each distinct vector figure, by its fields
+        self.forms = {}
+        # Rows that fit under the table header of the first page and of later
+        # pages, and thumbnail rows on the first and later figure pages
+        self.rows_per_page = [int((PAGE_HEIGHT - BOTTOM_MARGIN - self.start_table_page(first).y) // ROW_HEIGHT)
+                              for first in (True, False)]
+        self.figure_rows_per_page = [
+            max(int((PAGE_HEIGHT - BOTTOM_MARGIN - self.start_figure_page(first).y) // FIGURE_ROW_HEIGHT), 1)
+            for first in (True, False)]
+        self.page_no = 0
+        # Everything drawn on every page besides its own rows
+        self.document_key = hashlib.blake2b(repr((
+            proposal.name, proposal.client_name, proposal.date, proposal.currency,
+            hashlib.blake2b(proposal.logo_bytes or b'').digest(),
+        )).encode('utf-8'), digest_size=16).digest()
+
+    def new_page(self):
+        self.page_no += 1
+        page = _Page()
+        # Page header
+        if self.logo:
+            page.image('Logo', 10, 8, 25, self.logo.height_for(25))
+        page.line(self.proposal.name, BOLD, 16, 10, align='C')
+        page.line(f'Prepared for: {self.proposal.client_name}', REGULAR, 12, 10, align='C')
+        page.line(f'Date: {self.proposal.date}', REGULAR, 12, 10, align='C')
+        page.y += 10
+        return page
+
+    def finish_page(self, page):
+        # Page footer
+        page.y = PAGE_HEIGHT - 15
+        page.line(f'Page {self.page_no}', ITALIC, 8, 10, align='C')
+        return page.content()
+
+    def table_header(self, page):
+        x = MARGIN
+        for header, width in table_columns(self.proposal.currency):
+            page.cell(x, width, ROW_HEIGHT, pdf_text(header), BOLD, 10, border=True, align='C')
+            x += width
+        page.y += ROW_HEIGHT
+
+    def start_table_page(self, first):
+        """A new page up to the table header, with the introduction on the ``first`` page."""
+        page = self.new_page()
+        if first:
+            page.line('Valve Configuration Proposal', BOLD, 14, 10, align='C')
+            page.y += 5
+            page.line(f'Client: {self.proposal.client_name}', REGULAR, 12, 10)
+            page.line(f'Proposal Date: {self.proposal.date}', REGULAR, 12, 10)
+            page.line('Prepared By: VASTAŞ Valve Solutions', REGULAR, 12, 10)
+            page.y += 10
+            page.line('Valve Configurations', BOLD, 12, 10)
+            page.y += 5
+        self.table_header(page)
+        return page
+
+    def draw_rows(self, page, rows, digests=None):
+        """Draw ``rows`` down the page, reusing the cached ops of rows with
+        the same ``digests`` drawn at the same height before."""
+        for i, item in enumerate(rows):
+            key = digests[i] + b'%.2f' % page.y if digests else None
+            ops = self.page_cache.row(key) if key else None
+            if ops is not None:
+                page.ops.extend(ops)
+                page.y += ROW_HEIGHT
+                continue
+            start = len(page.ops)
+            x = MARGIN
+            for text, (_, width) in zip(table_row(item), TABLE_COLUMNS):
+                page.cell(x, width, ROW_HEIGHT, _fit(pdf_text(text), width, REGULAR, 10),
+                          REGULAR, 10, border=True)
+                x += width
+            if key:
+                self.page_cache.put_row(key, page.ops[start:])
+            page.y += ROW_HEIGHT
+
+    def cached_page(self, kind, entries, draw):
+        """Content stream of the next page, from the page cache when an
+        identical page was rendered before; ``draw()`` lays it out otherwise."""
+        if self.page_cache is None:
+            return self.finish_page(draw())
+        key = hashlib.blake2b(self.document_key, digest_size=20)
+        key.update(b'%s %d\x1e' % (kind, self.page_no + 1))
+        for entry in entries:
+            key.update(entry)
+        key = key.digest()
+        content = self.page_cache.page(key)
+        if content is None:
+            content = self.finish_page(draw())
+            self.page_cache.put_page(key, content)
+        else:
+            self.page_no += 1
+        return content
+
+    def pages(self):
+        """Yield the compressed content stream of each page in turn."""
+        total_price = 0
+        # (form name, caption) of each item, for the figure section
+        thumbnails = []
+        position = 0
+        items = iter(self.proposal.items)
+        # Full pages are known to be full by the rows of the next one; the
+        # last page also carries the total, so it is always laid out
+        first = True
+        rows = list(islice(items, self.rows_per_page[0]))
+        while True:
+            following = list(islice(items, self.rows_per_page[1]))
+            for item in rows:
+                position += 1
+                if self.figures:
+                    thumbnails.append((self.figure_form(item), figure_caption(position, item)))
+                total_price += item['total_price']
+            digests = [_row_digest(item) for item in rows] if self.page_cache is not None else None
+            if not following:
+                break
+
+            def draw(rows=rows, first=first, digests=digests):
+                page = self.start_table_page(first)
+                self.draw_rows(page, rows, digests)
+                return page
+            yield self.cached_page(b'table', digests, draw)
+            rows, first = following, False
+        page = self.start_table_page(first)
+        self.draw_rows(page, rows, digests)
+
+        # Total and notes
+        notes = _wrap(pdf_text(proposal_notes(self.proposal.currency)), PAGE_WIDTH - 2 * MARGIN, ITALIC, 10)
+        if not page.fits(ROW_HEIGHT):
+            yield self.finish_page(page)
+            page = self.new_page()
+        label_width = sum(width for _, width in TABLE_COLUMNS[:-1])
+        page.cell(MARGIN, label_width, ROW_HEIGHT, 'TOTAL:', BOLD, 10, border=True, align='R')
+        page.cell(MARGIN + label_width, TABLE_COLUMNS[-1][1], ROW_HEIGHT,
+                  f'{total_price:,.2f}', BOLD, 10, border=True)
+        page.y += ROW_HEIGHT + 10
+        if not page.fits(5 * len(notes)):
+            yield self.finish_page(page)
+            page = self.new_page()
+        for note in notes:
+            page.cell(MARGIN, PAGE_WIDTH - 2 * MARGIN, 5, note, ITALIC, 10)
+            page.y += 5
+        if thumbnails:
+            yield self.finish_page(page)
+            yield from self.figure_pages(thumbnails)
+            return
+        yield self.finish_page(page)
+
+    def figure_form(self, item):
+        """Resource name of the vector figure form for ``item``, compiling it on first use.
+
+        Names derive from the figure's fields, so a figure keeps its name
+        across revisions and the pages showing it stay cacheable.
+        """
+        from valvefigure.vector import VECTOR_FIELDS, figure_form_xobject, render_valve_pdf_ops
+
+        key = tuple(item.get(name) for name in VECTOR_FIELDS)
+        form = self.forms.get(key)
+        if form is None:
+            body = self.page_cache.form(key, self.material_db) if self.page_cache is not None else None
+            if body is None:
+                ops = render_valve_pdf_ops(item, self.material_db, font=REGULAR)
+                body = figure_form_xobject(ops, f'{RESOURCES_OBJ} 0 R')
+                if self.page_cache is not None:
+                    self.page_cache.put_form(key, self.material_db, body)
+            name = 'Fig' + hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).hexdigest()
+            form = self.forms[key] = (name, body)
+        return form[0]
+
+    def start_figure_page(self, first):
+        page = self.new_page()
+        if first:
+            page.line('Valve Figures', BOLD, 12, 10)
+        return page
+
+    def figure_pages(self, thumbnails):
+        from valvefigure.vector import FIGURE_HEIGHT, FIGURE_WIDTH
+
+        cell_width = (PAGE_WIDTH - 2 * MARGIN) / FIGURE_COLUMNS
+
+        def draw(chunk, first):
+            page = self.start_figure_page(first)
+            for i, (form, caption) in enumerate(chunk):
+                column = i % FIGURE_COLUMNS
+                if column == 0 and i:
+                    page.y += FIGURE_ROW_HEIGHT
+                x = MARGIN + column * cell_width
+                page.form(form, x + (cell_width - FIGURE_THUMB_WIDTH) / 2, page.y,
+                          FIGURE_THUMB_WIDTH, FIGURE_THUMB_HEIGHT, FIGURE_WIDTH, FIGURE_HEIGHT)
+                page.y += FIGURE_THUMB_HEIGHT
+                page.cell(x, cell_width, FIGURE_CAPTION_HEIGHT, _fit(pdf_text(caption), cell_width, REGULAR, 8),
+                          REGULAR, 8, align='C')
+                page.y -= FIGURE_THUMB_HEIGHT
+            return page
+
+        start = 0
+        while True:
+            first = start == 0
+            end = start + self.figure_rows_per_page[0 if first else 1] * FIGURE_COLUMNS
+            chunk = thumbnails[start:end]
+            yield self.cached_page(b'figures', [repr(chunk).encode('utf-8')],
+                                   lambda chunk=chunk, first=first: draw(chunk, first))
+            start = end
+            if start >= len(thumbnails):
+                break
+
+
+def iter_proposal_pdf(proposal, chunk_size=DEFAULT_CHUNK_SIZE, figures=False, material_db=None,
+                      page_cache=None):
+    """Render ``proposal`` as a PDF, yielding it in chunks of about ``chunk_size`` bytes.
+
+    ``proposal.items`` may be any iterable, including a generator, and is
+    consumed exactly once. With ``figures``, a Valve Figures section shows a
+    vector thumbnail of every item; each distinct figure is written once as
+    a form XObject, so only a small caption record per item is kept until
+    the section is laid out. With a :class:`PageCache`, pages and figures
+    identical to ones rendered before are taken from it. Raises
+    :class:`~valvefigure.logo.LogoError` before anything is yielded when the
+    logo cannot be decoded.
+    """
+    logo = prepare_logo(proposal.logo_bytes) if proposal.logo_bytes else None
+    offsets = {}
+    page_objs = []
+    buffer = bytearray()
+    position = 0
+
+    def put(obj_no, body):
+        nonlocal position
+        offsets[obj_no] = position + len(buffer)
+        buffer.extend(b'%d 0 obj\n' % obj_no)
+        buffer.extend(body)
+        buffer.extend(b'\nendobj\n')
+
+    def drain():
+        nonlocal position
+        chunk = bytes(buffer)
+        position += len(chunk)
+        buffer.clear()
+        return chunk
+
+    buffer.extend(b'%PDF-1.3\n%\xe2\xe3\xcf\xd3\n')
+    put(CATALOG_OBJ, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_OBJ)
+    for i, (base_font, _) in enumerate(FONTS.values()):
+        put(FIRST_FONT_OBJ + i, f'<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} '
+                                f'/Encoding /WinAnsiEncoding >>'.encode('latin1'))
+    font_refs = ' '.join(f'/{name} {FIRST_FONT_OBJ + i} 0 R' for i, name in enumerate(FONTS))
+    xobjects = []
+    if logo:
+        put(LOGO_OBJ, _image_xobject(logo))
+        xobjects.append(f'/Logo {LOGO_OBJ} 0 R')
+
+    next_obj = LOGO_OBJ + 1
+    layout = _ProposalLayout(proposal, logo, figures, material_db, page_cache)
+    for content in layout.pages():
+        content_obj, page_obj = next_obj, next_obj + 1
+        next_obj += 2
+        put(content_obj, b'<< /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream'
+            % (len(content), content))
+        put(page_obj, (f'<< /Type /Page /Parent {PAGES_OBJ} 0 R '
+                       f'/MediaBox [0 0 {PAGE_WIDTH * K:.2f} {PAGE_HEIGHT * K:.2f}] '
+                       f'/Resources {RESOURCES_OBJ} 0 R /Contents {content_obj} 0 R >>').encode('latin1'))
+        page_objs.append(page_obj)
+        if len(buffer) >= chunk_size:
+            yield drain()
+
+    # Resources go last: the figure forms are only known once every item is laid out
+    for name, body in layout.forms.values():
+        put(next_obj, body)
+        xobjects.append(f'/{name} {next_obj} 0 R')
+        next_obj += 1
+    xobject_refs = f" /XObject << {' '.join(xobjects)} >>" if xobjects else ''
+    put(RESOURCES_OBJ, f'<< /ProcSet [/PDF /Text /ImageB /ImageC /ImageI] '
+                       f'/Font << {font_refs} >>{xobject_refs} >>'.encode('latin1'))
+
+    kids = ' '.join(f'{obj} 0 R' for obj in page_objs)
+    put(PAGES_OBJ, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_objs)} >>'.encode('latin1'))
+    xref_position = position + len(buffer)
+    size = max(offsets) + 1
+    buffer.extend(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+    for obj_no in range(1, size):
+        # Object numbers are contiguous except a missing logo, which is listed as free
+        if obj_no in offsets:
+            buffer.extend(b'%010d 00000 n \n' % offsets[obj_no])
+        else:
+            buffer.extend(b'0000000000 65535 f \n')
+    buffer.extend(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                  % (size, CATALOG_OBJ, xref_position))
+    yield drain()
+
+
+def write_proposal_pdf(proposal, fp, chunk_size=DEFAULT_CHUNK_SIZE, figures=False, material_db=None,
+                       page_cache=None):
+    """Stream ``proposal`` as a PDF into the binary file object ``fp``.
+
+    Returns the number of bytes written.
+    """
+    written = 0
+    for chunk in iter_proposal_pdf(proposal, chunk_size, figures, material_db, page_cache):
+        fp.write(chunk)
+        written += len(chunk)
+    return written
@@ -0,0 +1,57 @@
+"""Text in PDF core fonts: encoding, escaping and metrics.
+
+Shared by the proposal renderers and the vector figures, which all write
+Helvetica in WinAnsi encoding and lay it out in FPDF's font metrics.
+"""
+
+import unicodedata
+from functools import lru_cache
+
+K = 72 / 25.4  # points per millimetre
+
+# Resource names of the core fonts: (PDF base font, FPDF metrics key)
+FONTS = {
+    'F1': ('Helvetica', 'helvetica'),
+    'F2': ('Helvetica-Bold', 'helveticaB'),
+    'F3': ('Helvetica-Oblique', 'helveticaI'),
+}
+REGULAR, BOLD, ITALIC = 'F1', 'F2', 'F3'
+
+
+def pdf_text(text):
+    """Make ``text`` printable with FPDF's core fonts.
+
+    The core fonts use WinAnsi (cp1252) encoding while FPDF writes pages as
+    latin-1, so cp1252 characters such as '€' are mapped onto their byte
+    values. Anything else falls back to its unaccented form ('Ş' -> 'S'),
+    or '?' when there is none.
+    """
+    text = str(text)
+    try:
+        return text.encode('cp1252').decode('latin1')
+    except UnicodeEncodeError:
+        pass
+    chars = []
+    for char in text:
+        try:
+            chars.append(char.encode('cp1252').decode('latin1'))
+        except UnicodeEncodeError:
+            base = unicodedata.normalize('NFKD', char).encode('ascii', 'ignore').decode('ascii')
+            chars.append(base or '?')
+    return ''.join(chars)
+
+
+def escape(text):
+    """``text`` escaped for a PDF string literal ``(...)``."""
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('\r', '\\r')
+
+
+@lru_cache(maxsize=4096)
+def text_width(text, font, size):
+    """Width in mm of ``text`` (already passed through pdf_text) in the core
+    font ``font`` (a :data:`FONTS` name) at ``size`` points."""
+    # FPDF is only loaded once text is laid out
+    from fpdf.fonts import fpdf_charwidths
+
+    widths = fpdf_charwidths[FONTS[font][1]]
+    return sum(widths.get(char, 0) for char in text) * size / 1000 / K
@@ -0,0 +1,295 @@
+"""Excel price books: loading, compiled lookup tables and hot reload.
+
+A price book workbook has two sheets:
+
+``Prices``
+    Columns ``Table | Item | Value``, where Table is one of the price
+    database tables (Valve Size, Pressure Rating, Actuator Type, Accessories).
+``Materials``
+    Columns ``Category | Material | Price | Color``, one row per
+    ``MATERIAL_DB`` entry.
+
+The workbook is read in openpyxl's read-only mode and compiled into a
+:class:`PriceBook` whose price tables and material prices are indexed
+arrays. The compiled book is pickled next to the workbook, keyed on its
+modification time, size and SHA-256, so restarts do not parse the Excel
+file again.
+:func:`export_price_book` writes the built-in databases in this format as a
+starting point.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections.abc import Mapping
+from types import MappingProxyType
+
+PRICE_TABLES = ('Valve Size', 'Pressure Rating', 'Actuator Type', 'Accessories')
+PRICES_SHEET = 'Prices'
+MATERIALS_SHEET = 'Materials'
+
+# Bump when the compiled format changes, so stale pickles are ignored
+CACHE_VERSION = 2
+
+
+class PriceBookError(ValueError):
+    """The price book workbook is missing data or has malformed rows."""
+
+
+class PriceTable(Mapping):
+    """Read-only mapping from item name to price, stored as an indexed array."""
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, items):
+        items = list(items)
+        self._index = {key: i for i, (key, _) in enumerate(items)}
+        self._values = array('d', (value for _, value in items))
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getstate__(self):
+        return self._index, self._values
+
+    def __setstate__(self, state):
+        self._index, self._values = state
+
+    def __repr__(self):
+        return f'PriceTable({dict(self)!r})'
+
+
+class MaterialTable(Mapping):
+    """Read-only mapping from material name to ``{'price': ..., 'color': ...}``,
+    stored as an indexed array of prices and a tuple of colors.
+
+    Each material's entry is a read-only view built from them once, when the
+    table is built or unpickled, so a price lookup stays two dict lookups.
+    """
+
+    __slots__ = ('_entries', '_prices', '_colors')
+
+    def __init__(self, materials):
+        materials = list(materials)
+        self._prices = array('d', (props['price'] for _, props in materials))
+        self._colors = tuple(props['color'] for _, props in materials)
+        self._entries = self._build(name for name, _ in materials)
+
+    def _build(self, names):
+        return {name: MappingProxyType({'price': price, 'color': color})
+                for name, price, color in zip(names, self._prices, self._colors)}
+
+    def __getitem__(self, key):
+        return self._entries[key]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        return tuple(self._entries), self._prices, self._colors
+
+    def __setstate__(self, state):
+        names, self._prices, self._colors = state
+        self._entries = self._build(names)
+
+    def __repr__(self):
+        return f'MaterialTable({ {name: dict(entry) for name, entry in self.items()}!r})'
+
+
+class PriceBook:
+    """A compiled price book, immutable once loaded.
+
+    ``price_db`` and ``material_db`` have the shapes of
+    :func:`~valvefigure.pricing.load_price_database` and
+    :data:`~valvefigure.pricing.MATERIAL_DB`, so they can be passed to the
+    pricing and figure functions directly.
+    """
+
+    def __init__(self, price_db, material_db, digest=None):
+        self.price_db = {name: PriceTable(table.items()) for name, table in price_db.items()}
+        self.material_db = {category: MaterialTable(materials.items())
+                            for category, materials in material_db.items()}
+        self.digest = digest
+
+
+def _read_rows(workbook, sheet, columns):
+    if sheet not in workbook.sheetnames:
+        raise PriceBookError(f"Price book has no '{sheet}' sheet")
+    rows = workbook[sheet].iter_rows(values_only=True)
+    header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+    if header[:len(columns)] != list(columns):
+        raise PriceBookError(f"Sheet '{sheet}' must start with columns {', '.join(columns)}")
+    for row_no, row in enumerate(rows, start=2):
+        row = tuple(row[:len(columns)]) + (None,) * (len(columns) - len(row))
+        if all(cell is None for cell in row):
+            continue
+        yield row_no, row
+
+
+def _number(value, sheet, row_no):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise PriceBookError(f"Sheet '{sheet}' row {row_no}: {value!r} is not a number")
+    return value
+
+
+def parse_price_book(path):
+    """Parse a price book workbook into a :class:`PriceBook`."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        price_db = {name: {} for name in PRICE_TABLES}
+        for row_no, (table, item, value) in _read_rows(workbook, PRICES_SHEET, ('Table', 'Item', 'Value')):
+            if table not in price_db:
+                raise PriceBookError(f"Sheet '{PRICES_SHEET}' row {row_no}: unknown table {table!r}")
+            price_db[table][str(item)] = _number(value, PRICES_SHEET, row_no)
+        material_db = {}
+        for row_no, (category, material, price, color) in _read_rows(
+                workbook, MATERIALS_SHEET, ('Category', 'Material', 'Price', 'Color')):
+            material_db.setdefault(str(category), {})[str(material)] = {
+                'price': _number(price, MATERIALS_SHEET, row_no),
+                'color': str(color or '#D3D3D3'),
+            }
+    finally:
+        workbook.close()
+    empty = [name for name, table in price_db.items() if not table]
+    if empty:
+        raise PriceBookError(f"Price book has no rows for: {', '.join(empty)}")
+    return PriceBook(price_db, material_db)
+
+
+def _file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _cache_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f'.{name}.pricebook.pickle')
+
+
+def load_price_book(path, use_cache=True):
+    """Load the price book at ``path``, from its compiled cache when current.
+
+    The cache is trusted without hashing when the workbook's mtime and size
+    match; otherwise the workbook is hashed, and only parsed again when its
+    content actually changed.
+    """
+    stat = os.stat(path)
+    cache_path = _cache_path(path)
+    cached = None
+    if use_cache:
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            cached = None
+        if cached and cached['version'] == CACHE_VERSION and \
+                (cached['mtime_ns'], cached['size']) == (stat.st_mtime_ns, stat.st_size):
+            return cached['book']
+
+    digest = _file_digest(path)
+    if cached and cached['version'] == CACHE_VERSION and cached['book'].digest == digest:
+        book = cached['book']
+    else:
+        book = parse_price_book(path)
+        book.digest = digest
+    if use_cache:
+        # Write to a temporary name first so readers never see a partial pickle
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns,
+                             'size': stat.st_size, 'book': book}, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # A read-only directory only costs the cache
+            pass
+    return book
+
+
+def export_price_book(path, price_db, material_db):
+    """Write ``price_db`` and ``material_db`` as a price book workbook."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    prices = workbook.create_sheet(PRICES_SHEET)
+    prices.append(['Table', 'Item', 'Value'])
+    for table in PRICE_TABLES:
+        for item, value in price_db[table].items():
+            prices.append([table, item, value])
+    materials = workbook.create_sheet(MATERIALS_SHEET)
+    materials.append(['Category', 'Material', 'Price', 'Color'])
+    for category, entries in material_db.items():
+        for material, props in entries.items():
+            materials.append([category, material, props['price'], props['color']])
+    workbook.save(path)
+
+
+class PriceBookSource:
+    """The current price book of a workbook, reloaded when the file changes.
+
+    :meth:`get` never waits for a reload: at most every ``check_interval``
+    seconds it stats the workbook, and when it changed a background thread
+    loads the new book and swaps it in. Books are immutable, so pricing that
+    already holds the previous book finishes with consistent prices. A
+    failed reload keeps the previous book and is kept in ``last_error``.
+    """
+
+    def __init__(self, path, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.last_error = None
+        self._book = load_price_book(path)
+        self._stat = self._stat_key()
+        self._checked = time.monotonic()
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def _stat_key(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            stat = self._stat_key()
+            with self._lock:
+                start = stat is not None and stat != self._stat and not self._reloading
+                if start:
+                    self._reloading = True
+            if start:
+                threading.Thread(target=self._reload, args=(stat,), daemon=True).start()
+        return self._book
+
+    def _reload(self, stat):
+        try:
+            book = load_price_book(self.path)
+        except Exception as e:  # keep serving the previous book
+            self.last_error = e
+        else:
+            self._book = book
+            self.last_error = None
+        finally:
+            with self._lock:
+                self._stat = stat
+                self._reloading = False
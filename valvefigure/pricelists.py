@@ -0,0 +1,287 @@
+"""Versioned price lists: dated snapshots of the price and material databases.
+
+A :class:`PriceLists` holds one :class:`PriceListVersion` per effective date,
+all priced in one base currency. Versions share structure: a table or a
+material category a version does not change is the very object of the
+version before it, so forty quarterly lists that each touch a few prices
+cost little more than one. Tables are shared, so treat them as read-only.
+
+A JSON price list file (see :func:`load_price_lists`) gives the first version
+in full and every later one as the entries it changes. Proposal items pin
+the version they were priced with (``price_version``) and their
+``currency``; :meth:`PriceLists.tables` returns a version's tables converted
+to another currency, precomputed once per pair, for the single-valve code
+paths, and :func:`reprice` prices a whole proposal in another currency or
+version in one vectorized pass.
+"""
+
+import json
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from operator import attrgetter
+
+from valvefigure.currency import DEFAULT_CURRENCY
+from valvefigure.items import ProposalItem
+from valvefigure.pricing import (MATERIAL_COLUMNS, accessory_costs, encode_accessories, lookup_prices,
+                                 price_breakdown)
+
+# Price tables whose values are multipliers, not money
+UNITLESS_TABLES = ('Pressure Rating',)
+
+# Name of the single version built from a price book or the built-in databases
+CURRENT_VERSION = 'current'
+
+
+class PriceListError(ValueError):
+    """The price list file is missing data or has malformed entries."""
+
+
+@dataclass(frozen=True)
+class PriceListVersion:
+    """The price and material databases in force from ``effective`` (an ISO date)."""
+    name: str
+    effective: str
+    price_db: dict
+    material_db: dict
+
+
+def _merge(previous, changes):
+    """``previous`` with ``changes`` applied (None removes an entry), sharing it when nothing changed."""
+    if not changes:
+        return previous
+    merged = dict(previous)
+    for key, value in changes.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _share(previous, tables):
+    """``tables`` with every table equal to the one in ``previous`` replaced by it."""
+    return {name: previous[name] if name in previous and previous[name] == table else table
+            for name, table in tables.items()}
+
+
+class PriceLists:
+    """Price list versions in one base ``currency``, ordered by effective date."""
+
+    def __init__(self, currency=DEFAULT_CURRENCY):
+        self.currency = currency
+        self.versions = []
+        self._by_name = {}
+        self._converted = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def single(cls, price_db, material_db, currency=DEFAULT_CURRENCY):
+        """Price lists with one version, :data:`CURRENT_VERSION`, of the given databases."""
+        lists = cls(currency)
+        lists.add_version('', price_db, material_db, name=CURRENT_VERSION)
+        return lists
+
+    def __len__(self):
+        return len(self.versions)
+
+    def __iter__(self):
+        return iter(self.versions)
+
+    @property
+    def names(self):
+        return [version.name for version in self.versions]
+
+    @property
+    def latest(self):
+        return self.versions[-1]
+
+    def add_version(self, effective, price_db, material_db, name=None):
+        """Add the full databases in force from ``effective``; returns the version.
+
+        Tables and material categories equal to the previous version's are
+        shared with it. Versions must be added in effective date order.
+        """
+        if self.versions and effective <= self.versions[-1].effective:
+            raise PriceListError(f"Version {effective} is not after {self.versions[-1].effective}")
+        previous = self.versions[-1] if self.versions else None
+        price_db = {table: dict(values) for table, values in price_db.items()}
+        material_db = {category: {material: dict(props) for material, props in materials.items()}
+                       for category, materials in material_db.items()}
+        if previous is not None:
+            price_db = _share(previous.price_db, price_db)
+            material_db = {category: _share(previous.material_db.get(category, {}), materials)
+                           for category, materials in material_db.items()}
+            material_db = _share(previous.material_db, material_db)
+        return self._append(PriceListVersion(name or effective, effective, price_db, material_db))
+
+    def add_changes(self, effective, price_changes=None, material_changes=None, name=None):
+        """Add a version that changes the latest one; returns it.
+
+        ``price_changes`` maps tables to ``{item: price or None}`` and
+        ``material_changes`` maps categories to ``{material: props or None}``,
+        props being merged into the previous ones; None removes an entry.
+        Everything not changed is shared with the previous version.
+        """
+        if not self.versions:
+            raise PriceListError("The first price list version must be given in full")
+        previous = self.versions[-1]
+        if effective <= previous.effective:
+            raise PriceListError(f"Version {effective} is not after {previous.effective}")
+        price_db = dict(previous.price_db)
+        for table, changes in (price_changes or {}).items():
+            price_db[table] = _merge(previous.price_db.get(table, {}), changes)
+        material_db = dict(previous.material_db)
+        for category, changes in (material_changes or {}).items():
+            materials = previous.material_db.get(category, {})
+            material_db[category] = _merge(materials, {
+                material: None if props is None else {**materials.get(material, {}), **props}
+                for material, props in changes.items()
+            })
+        return self._append(PriceListVersion(name or effective, effective, price_db, material_db))
+
+    def _append(self, version):
+        if version.name in self._by_name:
+            raise PriceListError(f"Duplicate price list version: {version.name}")
+        self.versions.append(version)
+        self._by_name[version.name] = version
+        return version
+
+    def get(self, name):
+        """The version called ``name``; raises KeyError when there is none."""
+        return self._by_name[name]
+
+    def effective_on(self, date):
+        """The version in force on ``date`` (an ISO date), or the earliest one before it."""
+        index = bisect_right([version.effective for version in self.versions], date)
+        return self.versions[max(index - 1, 0)]
+
+    def tables(self, version, currency, rates):
+        """``(price_db, material_db)`` of ``version`` converted to ``currency``.
+
+        Converted tables are computed once per version and currency; in the
+        base currency they are the version's own. Raises KeyError when
+        ``rates`` has no rate for ``currency``.
+        """
+        if currency == self.currency:
+            return version.price_db, version.material_db
+        key = (version.name, currency)
+        converted = self._converted.get(key)
+        if converted is None:
+            rate = rates.rate(self.currency, currency)
+            price_db = {table: values if table in UNITLESS_TABLES else
+                        {item: price * rate for item, price in values.items()}
+                        for table, values in version.price_db.items()}
+            material_db = {category: {material: {**props, 'price': props['price'] * rate}
+                                      for material, props in materials.items()}
+                           for category, materials in version.material_db.items()}
+            converted = (price_db, material_db)
+            with self._lock:
+                self._converted[key] = converted
+        return converted
+
+
+def load_price_lists(path):
+    """Read a JSON price list file into :class:`PriceLists`.
+
+    The file holds the base ``currency`` and a list of ``versions`` in
+    effective date order. The first version gives ``price_db`` and
+    ``material_db`` in full; each later one gives only the entries it
+    changes, with null removing an entry::
+
+        {"currency": "EUR",
+         "versions": [
+             {"effective": "2026-01-01", "price_db": {...}, "material_db": {...}},
+             {"effective": "2026-04-01", "price_db": {"Valve Size": {"2\\"": 1900}},
+              "material_db": {"Seat": {"PEEK": {"price": 260}}}}]}
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise PriceListError(f"Could not read price lists {path}: {e}") from e
+    lists = PriceLists(data.get('currency', DEFAULT_CURRENCY))
+    for i, entry in enumerate(data.get('versions', [])):
+        try:
+            effective = str(entry['effective'])
+            if i == 0:
+                lists.add_version(effective, entry['price_db'], entry['material_db'], name=entry.get('name'))
+            else:
+                lists.add_changes(effective, entry.get('price_db'), entry.get('material_db'), name=entry.get('name'))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise PriceListError(f"Price list version {i + 1} is malformed: {e!r}") from e
+    if not lists.versions:
+        raise PriceListError(f"Price lists {path} have no versions")
+    return lists
+
+
+# ========================
+# VECTORIZED REPRICING
+# ========================
+def _stacked(tables):
+    """Union of the tables' keys, and a (version, key) array of their values (NaN when absent)."""
+    import numpy as np
+
+    labels = list(dict.fromkeys(key for table in tables for key in table))
+    index = {label: i for i, label in enumerate(labels)}
+    values = np.full((len(tables), len(labels)), np.nan)
+    for row, table in enumerate(tables):
+        for key, value in table.items():
+            values[row, index[key]] = value
+    return labels, values
+
+
+def reprice(items, price_lists, rates, currency, version=None, default_version=None):
+    """Price every item in ``currency`` in one vectorized pass.
+
+    Items are priced with ``version`` when given, else with the version they
+    pin (``price_version``), falling back to ``default_version`` (the latest
+    by default) for items that pin none or an unknown one. Returns a
+    DataFrame with the columns of
+    :func:`~valvefigure.pricing.calculate_prices_bulk` plus the
+    ``price_version`` each row was priced with; rows whose keys the version
+    has no price data for get NaN prices and a ``missing`` list. Raises
+    KeyError when ``rates`` has no rate for ``currency``.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rate = rates.rate(price_lists.currency, currency)
+    versions = price_lists.versions
+    position = {v.name: i for i, v in enumerate(versions)}
+    fallback = position[(default_version or price_lists.latest).name]
+    fields = ['size', 'pressure_rating', *MATERIAL_COLUMNS, 'actuator_type', 'accessories', 'quantity',
+              'price_version']
+    # Slot records read much faster through attrgetter than through item.get
+    record = attrgetter(*fields)
+    frame = pd.DataFrame.from_records(
+        [record(item) if isinstance(item, ProposalItem) else tuple(item.get(name) for name in fields)
+         for item in items], columns=fields)
+    n = len(frame)
+    if version is not None:
+        rows = np.full(n, position[version.name])
+    else:
+        rows = frame['price_version'].map(position).fillna(fallback).to_numpy(dtype=np.intp)
+
+    lookups = [
+        ('size', [v.price_db['Valve Size'] for v in versions]),
+        ('pressure_rating', [v.price_db['Pressure Rating'] for v in versions]),
+        *((col, [{mat: props['price'] for mat, props in v.material_db.get(category, {}).items()}
+                 for v in versions])
+          for col, category in MATERIAL_COLUMNS.items()),
+        ('actuator_type', [v.price_db['Actuator Type'] for v in versions]),
+    ]
+    missing = np.full(n, '', dtype=object)
+    looked_up = {}
+    for col, tables in lookups:
+        labels, prices = _stacked(tables)
+        looked_up[col] = lookup_prices(frame[col], labels, prices, missing, rows)
+
+    # Accessories without price data cost nothing, as in calculate_valve_price
+    accessory_names, accessory_prices = _stacked([v.price_db['Accessories'] for v in versions])
+    masks = encode_accessories(frame['accessories'], accessory_names)
+    accessories_cost = accessory_costs(masks, np.nan_to_num(accessory_prices), rows)
+
+    result = price_breakdown(looked_up, accessories_cost, frame['quantity'], missing, rate=rate)
+    result['price_version'] = np.array([v.name for v in versions], dtype=object)[rows]
+    return result
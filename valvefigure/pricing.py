@@ -0,0 +1,281 @@
+"""Valve pricing: the material and price databases and the price calculation.
+
+Nothing here imports Streamlit; pandas and NumPy are only loaded by the bulk
+pricing functions that need them.
+"""
+
+from valvefigure import metrics
+
+# ========================
+# MATERIAL DATABASE
+# ========================
+MATERIAL_DB = {
+    'Body/Bonnet': {
+        'Carbon Steel': {'price': 150, 'color': '#A9A9A9'},
+        'Stainless Steel 316': {'price': 300, 'color': '#C0C0C0'},
+        'Duplex Steel': {'price': 450, 'color': '#4682B4'},
+        'Super Duplex': {'price': 600, 'color': '#5F9EA0'},
+        'Alloy 20': {'price': 700, 'color': '#6495ED'},
+        'Hastelloy C': {'price': 1200, 'color': '#B0C4DE'},
+    },
+    'Ball': {
+        'Stainless Steel 316': {'price': 200, 'color': '#C0C0C0'},
+        'Stellite 6': {'price': 500, 'color': '#FF6347'},
+        'Alloy 6': {'price': 800, 'color': '#FFA500'},
+        'Hastelloy C': {'price': 1500, 'color': '#B0C4DE'},
+    },
+    'Stem': {
+        'Stainless Steel 316': {'price': 100, 'color': '#C0C0C0'},
+        '17-4 PH': {'price': 250, 'color': '#9370DB'},
+        'Monel': {'price': 400, 'color': '#D8BFD8'},
+        'Inconel 718': {'price': 600, 'color': '#DA70D6'},
+    },
+    'Seat': {
+        'PTFE': {'price': 80, 'color': '#FFFFFF'},
+        'RPTFE': {'price': 120, 'color': '#F0F8FF'},
+        'PEEK': {'price': 200, 'color': '#ADD8E6'},
+        'Metal': {'price': 300, 'color': '#D3D3D3'},
+        'Graphoil': {'price': 350, 'color': '#708090'},
+    },
+    'Trim': {
+        'Standard': {'price': 100, 'color': '#D3D3D3'},
+        'Anti-cavitation': {'price': 300, 'color': '#87CEEB'},
+        'Low Noise': {'price': 400, 'color': '#20B2AA'},
+        'Cryogenic': {'price': 600, 'color': '#00BFFF'},
+    }
+}
+
+# ========================
+# VALVE OPTIONS
+# ========================
+FLUID_TYPES = ["Water", "Steam", "Oil", "Gas", "Chemical", "Cryogenic"]
+VALVE_TYPES = ["Ball", "Globe", "Butterfly", "Gate", "Check"]
+FAIL_MODES = ["Fail to Close", "Fail to Open", "Fail in Position"]
+# Largest quantity of one line, as the configurator's quantity inputs allow
+MAX_QUANTITY = 100
+
+# ========================
+# EXCEL PRICE DATABASE
+# ========================
+def load_price_database():
+    return {
+        'Valve Size': {
+            '0.5"': 500,
+            '1"': 800,
+            '1.5"': 1200,
+            '2"': 1800,
+            '3"': 2500,
+            '4"': 3500,
+            '6"': 5000,
+            '8"': 7000,
+            '10"': 10000,
+            '12"': 14000,
+        },
+        'Pressure Rating': {
+            '150#': 1.0,
+            '300#': 1.2,
+            '600#': 1.5,
+            '900#': 1.8,
+            '1500#': 2.2,
+            '2500#': 3.0,
+        },
+        'Actuator Type': {
+            'Pneumatic': 800,
+            'Electric': 1500,
+            'Hydraulic': 2500,
+        },
+        'Accessories': {
+            'Positioner': 400,
+            'Solenoid Valve': 200,
+            'Limit Switches': 300,
+            'Air Filter Regulator': 150,
+            'Boosters': 350,
+        }
+    }
+
+# ========================
+# PRICE CALCULATION
+# ========================
+@metrics.timed('price_seconds')
+def calculate_valve_price(valve_data, price_db, material_db=None):
+    """Price a single valve configuration.
+
+    Raises ``KeyError`` naming the first key without price data; the caller
+    decides how to report it.
+    """
+    material_db = MATERIAL_DB if material_db is None else material_db
+
+    # Base price based on size
+    base_price = price_db['Valve Size'][valve_data['size']]
+    
+    # Pressure rating multiplier
+    pressure_multiplier = price_db['Pressure Rating'][valve_data['pressure_rating']]
+    
+    # Material costs
+    body_cost = material_db['Body/Bonnet'][valve_data['body_material']]['price']
+    ball_cost = material_db['Ball'][valve_data['ball_material']]['price']
+    stem_cost = material_db['Stem'][valve_data['stem_material']]['price']
+    seat_cost = material_db['Seat'][valve_data['seat_material']]['price']
+    trim_cost = material_db['Trim'][valve_data['trim_type']]['price']
+    
+    # Actuator cost
+    actuator_cost = price_db['Actuator Type'][valve_data['actuator_type']]
+    
+    # Accessories cost
+    accessories_cost = 0
+    for accessory in valve_data['accessories']:
+        accessories_cost += price_db['Accessories'].get(accessory, 0)
+    
+    # Calculate total price
+    material_cost = body_cost + ball_cost + stem_cost + seat_cost + trim_cost
+    total_price = (base_price + material_cost + actuator_cost + accessories_cost) * pressure_multiplier
+    
+    # Apply quantity
+    total_price *= valve_data['quantity']
+    
+    return {
+        'base_price': base_price,
+        'pressure_multiplier': pressure_multiplier,
+        'material_cost': material_cost,
+        'actuator_cost': actuator_cost,
+        'accessories_cost': accessories_cost,
+        'total_price': total_price
+    }
+
+# ========================
+# BULK PRICE CALCULATION
+# ========================
+# Valve config columns looked up in MATERIAL_DB, keyed by their category
+MATERIAL_COLUMNS = {
+    'body_material': 'Body/Bonnet',
+    'ball_material': 'Ball',
+    'stem_material': 'Stem',
+    'seat_material': 'Seat',
+    'trim_type': 'Trim',
+}
+
+PRICE_COLUMNS = ['base_price', 'pressure_multiplier', 'material_cost',
+                 'actuator_cost', 'accessories_cost', 'total_price']
+
+def _category_codes(values, categories):
+    """Encode a column as categorical codes into ``categories`` (-1 for unknown keys)."""
+    import pandas as pd
+
+    return pd.Categorical(values, categories=list(categories)).codes
+
+def lookup_prices(values, labels, prices, missing, rows=None):
+    """Look up the price of every entry of the column ``values``.
+
+    ``prices`` holds one price per label of ``labels``, or, with ``rows``,
+    one row of them per price list and ``rows`` the row each entry is priced
+    from. Entries without a price are NaN and appended to the ``missing``
+    array of ``", 'label'"`` strings.
+    """
+    import numpy as np
+
+    codes = _category_codes(values, labels)
+    found = prices[codes] if rows is None else prices[rows, codes]
+    unknown = (codes < 0) | np.isnan(found)
+    if unknown.any():
+        unknown_labels = np.asarray(values, dtype=object)[unknown]
+        missing[unknown] += np.array([f", {label!r}" for label in unknown_labels], dtype=object)
+    return np.where(unknown, np.nan, found)
+
+def encode_accessories(accessories, names):
+    """Encode accessory lists as bitmasks over the accessory ``names``
+    (e.g. ``price_db['Accessories']``).
+
+    Each distinct accessory combination is encoded once; None encodes as no
+    accessories. Names that are not in ``names`` get no bit, matching the zero cost the scalar calculation
+    gives them. Duplicates collapse into a single bit, which is what the
+    Accessories multiselect produces anyway.
+    """
+    import numpy as np
+    import pandas as pd
+
+    bits = {name: 1 << i for i, name in enumerate(names)}
+    combos = pd.Series(accessories, dtype=object).map(tuple, na_action='ignore')
+    # None (no accessories) gets code -1
+    codes, uniques = pd.factorize(combos)
+    combo_masks = np.array(
+        [sum(bits[name] for name in set(combo) if name in bits) for combo in uniques] + [0],
+        dtype=np.int64,
+    )
+    return combo_masks[codes]
+
+def accessory_costs(masks, prices, rows=None):
+    """Accessory cost of every :func:`encode_accessories` bitmask, from one
+    price per bit, or, with ``rows``, from the row of ``prices`` each mask
+    is priced from."""
+    import numpy as np
+
+    cost = np.zeros(len(masks))
+    for bit in range(prices.shape[-1]):
+        cost += ((masks >> bit) & 1) * (prices[bit] if rows is None else prices[rows, bit])
+    return cost
+
+def price_breakdown(looked_up, accessories_cost, quantity, missing, rate=1.0, index=None):
+    """The bulk pricing result: a DataFrame of :data:`PRICE_COLUMNS` and
+    ``missing`` from the prices :func:`lookup_prices` found per column.
+
+    Money is converted at ``rate``; the pressure multiplier is not. Rows
+    with missing keys get NaN prices.
+    """
+    import numpy as np
+    import pandas as pd
+
+    base_price = looked_up['size']
+    pressure_multiplier = looked_up['pressure_rating']
+    material_cost = sum(looked_up[col] for col in MATERIAL_COLUMNS)
+    actuator_cost = looked_up['actuator_type']
+    if rate != 1:
+        base_price, material_cost, actuator_cost, accessories_cost = (
+            cost * rate for cost in (base_price, material_cost, actuator_cost, accessories_cost))
+    total_price = (base_price + material_cost + actuator_cost + accessories_cost) * pressure_multiplier
+    total_price = total_price * np.asarray(quantity, dtype=float)
+
+    incomplete = missing != ''
+    result = pd.DataFrame({
+        'base_price': base_price,
+        'pressure_multiplier': pressure_multiplier,
+        'material_cost': material_cost,
+        'actuator_cost': actuator_cost,
+        'accessories_cost': accessories_cost,
+        'total_price': total_price,
+    }, index=index)
+    result.loc[incomplete, PRICE_COLUMNS] = np.nan
+    result['missing'] = np.where(incomplete, [m[2:] for m in missing], None)
+    return result
+
+def calculate_prices_bulk(valves, price_db, material_db=None):
+    """Price a DataFrame of valve configurations in one vectorized pass.
+
+    ``valves`` needs the same fields as ``calculate_valve_price`` uses
+    (size, pressure_rating, the five material columns, actuator_type,
+    accessories and quantity). Returns a DataFrame on the same index with one
+    column per price component, identical to the scalar results, plus a
+    ``missing`` column listing the keys without price data for each row
+    (None when the row priced cleanly). Price columns are NaN on those rows.
+    """
+    import numpy as np
+
+    material_db = MATERIAL_DB if material_db is None else material_db
+    required = ['size', 'pressure_rating', *MATERIAL_COLUMNS, 'actuator_type', 'accessories', 'quantity']
+    absent = [col for col in required if col not in valves.columns]
+    if absent:
+        raise KeyError(f"Valve data is missing columns: {', '.join(absent)}")
+
+    lookups = [
+        ('size', price_db['Valve Size']),
+        ('pressure_rating', price_db['Pressure Rating']),
+        *((col, {mat: props['price'] for mat, props in material_db[category].items()})
+          for col, category in MATERIAL_COLUMNS.items()),
+        ('actuator_type', price_db['Actuator Type']),
+    ]
+    missing = np.full(len(valves), '', dtype=object)
+    looked_up = {col: lookup_prices(valves[col], table, np.array(list(table.values()), dtype=float), missing)
+                 for col, table in lookups}
+
+    masks = encode_accessories(valves['accessories'], price_db['Accessories'])
+    accessories_cost = accessory_costs(masks, np.array(list(price_db['Accessories'].values()), dtype=float))
+    return price_breakdown(looked_up, accessories_cost, valves['quantity'], missing, index=valves.index)
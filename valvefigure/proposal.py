@@ -0,0 +1,268 @@
+"""Proposal documents: the proposal and its PDF rendering.
+
+Everything is rendered from an explicit :class:`Proposal`, so batch jobs and
+workers can produce the same documents as the Streamlit app.
+"""
+
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from fpdf import FPDF
+
+from valvefigure import metrics
+from valvefigure.currency import DEFAULT_CURRENCY, currency_name, currency_symbol
+from valvefigure.logo import prepare_logo
+from valvefigure.pdftext import pdf_text
+
+
+@dataclass
+class Proposal:
+    """A proposal as rendered into documents.
+
+    ``items`` are priced valve configurations: the fields of a configured
+    valve plus its ``total_price``, in ``currency``.
+    """
+    name: str = "Valve Proposal"
+    client_name: str = ""
+    date: str = ""
+    items: list = field(default_factory=list)
+    logo_bytes: bytes = None
+    currency: str = DEFAULT_CURRENCY
+
+
+# ========================
+# PDF REPORT GENERATION
+# ========================
+# Proposal table columns: (header, width in mm)
+TABLE_COLUMNS = [
+    ('Description', 40),
+    ('Size', 30),
+    ('Material', 25),
+    ('Actuator', 25),
+    ('Fail Mode', 25),
+    ('Qty', 25),
+    ('Price (€)', 30),
+]
+
+NOTES = 'Notes: Prices are in Euros (€). Delivery time is 8-12 weeks from order confirmation. Prices valid for 30 days.'
+
+def pdf_currency_symbol(currency):
+    """The currency's symbol if the core fonts can print it ('₺' cannot), else its code."""
+    symbol = currency_symbol(currency)
+    try:
+        symbol.encode('cp1252')
+    except UnicodeEncodeError:
+        return currency
+    return symbol
+
+def table_columns(currency=DEFAULT_CURRENCY):
+    """:data:`TABLE_COLUMNS` with the price column labelled in ``currency``."""
+    header, width = TABLE_COLUMNS[-1]
+    return [*TABLE_COLUMNS[:-1], (header.replace('€', pdf_currency_symbol(currency)), width)]
+
+def proposal_notes(currency=DEFAULT_CURRENCY):
+    """:data:`NOTES` for prices in ``currency``."""
+    return NOTES.replace('Euros (€)', f'{currency_name(currency)} ({pdf_currency_symbol(currency)})')
+
+# Figure section: thumbnails per row, thumbnail size and caption height in mm
+FIGURE_COLUMNS = 5
+FIGURE_THUMB_WIDTH = 34
+FIGURE_THUMB_HEIGHT = 51
+FIGURE_CAPTION_HEIGHT = 6
+FIGURE_ROW_HEIGHT = FIGURE_THUMB_HEIGHT + FIGURE_CAPTION_HEIGHT + 4
+
+def figure_caption(position, item):
+    """Caption of a proposal item's figure thumbnail."""
+    return f"{position}. {item['size']} {item['type']}"
+
+def table_row(item):
+    """Cell texts of a proposal item's row in the proposal table."""
+    return [
+        f"{item['size']} {item['type']} Valve",
+        item['size'],
+        item['body_material'],
+        item['actuator_type'],
+        item['fail_mode'],
+        str(item['quantity']),
+        f"{item['total_price']:,.2f}",
+    ]
+
+class PDF(FPDF):
+    def __init__(self, proposal, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.proposal = proposal
+        # [name, figure ops, object number] of each distinct vector figure, by its fields
+        self.figure_forms = {}
+        self.logo_name = None
+        if proposal.logo_bytes:
+            self.logo_name = self.add_raster(prepare_logo(proposal.logo_bytes))
+
+    def add_raster(self, raster):
+        """Register a decoded RGB raster (e.g. a :class:`~valvefigure.logo.Logo`)
+        as an image of this document and return the name to draw it with.
+
+        FPDF writes each registered image once and references it from every
+        page that draws it, so nothing is written to disk or decoded again.
+        """
+        name = f'raster:{raster.digest}'
+        if name not in self.images:
+            # FPDF drops 'data' from the dict once written, so each document
+            # gets its own dict around the shared bytes.
+            self.images[name] = {
+                'i': len(self.images) + 1,
+                'w': raster.width,
+                'h': raster.height,
+                'cs': 'DeviceRGB',
+                'bpc': 8,
+                'f': 'FlateDecode',
+                'data': raster.data,
+            }
+        return name
+
+    def add_figure_form(self, valve_data, material_db=None):
+        """Register the vector figure of ``valve_data`` as a form XObject of
+        this document and return the name to draw it with :meth:`figure`.
+
+        Identical figures share one form. Labels use the regular Arial
+        (Helvetica) core font, which must have been selected before.
+        """
+        from valvefigure.vector import VECTOR_FIELDS, render_valve_pdf_ops
+
+        key = tuple(valve_data.get(name) for name in VECTOR_FIELDS)
+        form = self.figure_forms.get(key)
+        if form is None:
+            ops = render_valve_pdf_ops(valve_data, material_db, font=f"F{self.fonts['helvetica']['i']}")
+            form = self.figure_forms[key] = [f'Fig{len(self.figure_forms) + 1}', ops, None]
+        return form[0]
+
+    def figure(self, name, x, y, w, h):
+        """Draw the figure form ``name`` scaled into the given rectangle."""
+        from valvefigure.vector import FIGURE_HEIGHT, FIGURE_WIDTH
+
+        self._out(f'q {w * self.k / FIGURE_WIDTH:.4f} 0 0 {h * self.k / FIGURE_HEIGHT:.4f} '
+                  f'{x * self.k:.2f} {(self.h - y - h) * self.k:.2f} cm /{name} Do Q')
+
+    # FPDF has no public hook for extra XObjects; these two extend the ones
+    # that write the images and list them in the resource dictionary
+    def _putimages(self):
+        from valvefigure.vector import figure_form_xobject
+
+        super()._putimages()
+        if not self.figure_forms:
+            return
+        # Forms name the labels' font in resources of their own, from the
+        # font object FPDF has just written
+        font = self.fonts['helvetica']
+        resources = f"<< /Font << /F{font['i']} {font['n']} 0 R >> >>"
+        for form in self.figure_forms.values():
+            self._newobj()
+            form[2] = self.n
+            self._out(figure_form_xobject(form[1], resources))
+            self._out('endobj')
+
+    def _putxobjectdict(self):
+        super()._putxobjectdict()
+        for name, _, obj in self.figure_forms.values():
+            self._out(f'/{name} {obj} 0 R')
+
+    def header(self):
+        if self.logo_name:
+            self.image(self.logo_name, 10, 8, 25)
+        self.set_font('Arial', 'B', 16)
+        self.cell(0, 10, pdf_text(self.proposal.name), 0, 1, 'C')
+        self.set_font('Arial', '', 12)
+        self.cell(0, 10, pdf_text(f'Prepared for: {self.proposal.client_name}'), 0, 1, 'C')
+        self.cell(0, 10, f'Date: {self.proposal.date}', 0, 1, 'C')
+        self.ln(10)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+@metrics.timed('proposal_pdf_seconds')
+def generate_proposal_pdf(proposal, figures=False, material_db=None):
+    """Render ``proposal`` as a PDF in memory.
+
+    With ``figures``, a Valve Figures section after the notes shows a
+    vector thumbnail of every item's figure, as :func:`iter_proposal_pdf
+    <valvefigure.pdfstream.iter_proposal_pdf>` draws it. Each distinct
+    figure is embedded once as a form XObject; ``proposal.items`` is then
+    iterated twice.
+
+    Raises :class:`~valvefigure.logo.LogoError` when the proposal's logo
+    cannot be decoded.
+    """
+    pdf = PDF(proposal)
+    pdf.add_page()
+
+    # Add title
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, 'Valve Configuration Proposal', 0, 1, 'C')
+    pdf.ln(5)
+
+    # Add client info
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, pdf_text(f'Client: {proposal.client_name}'), 0, 1)
+    pdf.cell(0, 10, f'Proposal Date: {proposal.date}', 0, 1)
+    pdf.cell(0, 10, pdf_text('Prepared By: VASTAŞ Valve Solutions'), 0, 1)
+    pdf.ln(10)
+
+    # Add valve configurations
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 10, 'Valve Configurations', 0, 1)
+    pdf.ln(5)
+
+    # Create table headers
+    columns = table_columns(proposal.currency)
+    col_widths = [width for _, width in columns]
+
+    pdf.set_font('Arial', 'B', 10)
+    for header, width in columns:
+        pdf.cell(width, 10, pdf_text(header), 1, 0, 'C')
+    pdf.ln()
+
+    # Add valve items
+    pdf.set_font('Arial', '', 10)
+    total_price = 0
+    for item in proposal.items:
+        for text, width in zip(table_row(item), col_widths):
+            pdf.cell(width, 10, pdf_text(text), 1)
+        pdf.ln()
+        total_price += item['total_price']
+
+    # Add total
+    pdf.set_font('Arial', 'B', 10)
+    pdf.cell(sum(col_widths[:-1]), 10, 'TOTAL:', 1, 0, 'R')
+    pdf.cell(col_widths[-1], 10, f"{total_price:,.2f}", 1, 1)
+
+    # Add notes
+    pdf.ln(10)
+    pdf.set_font('Arial', 'I', 10)
+    pdf.multi_cell(0, 5, pdf_text(proposal_notes(proposal.currency)))
+
+    if figures and proposal.items:
+        pdf.add_page()
+        pdf.set_font('Arial', 'B', 12)
+        pdf.cell(0, 10, 'Valve Figures', 0, 1)
+        pdf.set_font('Arial', '', 8)
+        cell_width = (pdf.w - pdf.l_margin - pdf.r_margin) / FIGURE_COLUMNS
+        y = pdf.get_y()
+        for position, item in enumerate(proposal.items, start=1):
+            column = (position - 1) % FIGURE_COLUMNS
+            if column == 0 and position > 1:
+                y += FIGURE_ROW_HEIGHT
+                if y + FIGURE_ROW_HEIGHT > pdf.page_break_trigger:
+                    pdf.add_page()
+                    pdf.set_font('Arial', '', 8)
+                    y = pdf.get_y()
+            x = pdf.l_margin + column * cell_width
+            name = pdf.add_figure_form(item, material_db)
+            pdf.figure(name, x + (cell_width - FIGURE_THUMB_WIDTH) / 2, y, FIGURE_THUMB_WIDTH, FIGURE_THUMB_HEIGHT)
+            pdf.set_xy(x, y + FIGURE_THUMB_HEIGHT)
+            pdf.cell(cell_width, FIGURE_CAPTION_HEIGHT, pdf_text(figure_caption(position, item)), 0, 0, 'C')
+
+    # Save to bytes buffer
+    pdf_bytes = BytesIO(pdf.output(dest='S').encode('latin1'))
+    pdf_bytes.seek(0)
+    return pdf_bytes
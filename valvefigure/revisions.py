@@ -0,0 +1,284 @@
+"""Quote revisions: line-by-line diffs between two versions of a proposal.
+
+A revised schedule usually changes a handful of lines of a long quote.
+:func:`diff_quotes` pairs every line of the new revision with a line of the
+old one, by ``tag`` when both carry one and else by configuration
+(:func:`~valvefigure.items.line_hash`), and classifies each as added,
+removed, changed or unchanged. Only added and changed lines need pricing
+(:attr:`QuoteDiff.to_price`); :meth:`QuoteDiff.merge` combines their new
+prices with the unchanged lines' old ones, :meth:`QuoteDiff.redline`
+tabulates the price deltas and :meth:`QuoteDiff.apply` writes them to the
+proposal, as long as it has not changed since (:meth:`QuoteDiff.is_current`).
+"""
+
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+from valvefigure.items import CONFIG_FIELDS, line_hash
+from valvefigure.pricing import calculate_valve_price
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+# Fields an unchanged line has the same values of by definition, or takes from the old one
+_MATCHED_FIELDS = frozenset((*CONFIG_FIELDS, 'quantity', 'total_price', 'currency', 'price_version'))
+
+REDLINE_COLUMNS = ('Line', 'Tag', 'Description', 'Change', 'Old Qty', 'New Qty',
+                   'Old Price', 'New Price', 'Delta')
+
+
+class RevisionError(ValueError):
+    """The proposal changed since the revision was compared with it."""
+
+
+def _price(valve):
+    return None if valve is None else valve.get('total_price')
+
+
+@dataclass(frozen=True)
+class LineChange:
+    """One line of a :class:`QuoteDiff`: the ``old`` and ``new`` valve, None
+    for the side it is missing from, and their 1-based positions."""
+    status: str
+    old: object
+    new: object
+    old_line: int = None
+    new_line: int = None
+
+    @property
+    def old_price(self):
+        return _price(self.old)
+
+    @property
+    def new_price(self):
+        return _price(self.new)
+
+    @property
+    def delta(self):
+        """New total price less the old one; None while either is unknown."""
+        old = self.old_price if self.old is not None else 0
+        new = self.new_price if self.new is not None else 0
+        return None if old is None or new is None else new - old
+
+
+class QuoteDiff:
+    """The :class:`LineChange` of every line, in the new revision's order
+    with removed lines last."""
+
+    def __init__(self, changes):
+        self.changes = changes
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    @property
+    def counts(self):
+        counts = dict.fromkeys((ADDED, REMOVED, CHANGED, UNCHANGED), 0)
+        for change in self.changes:
+            counts[change.status] += 1
+        return counts
+
+    @property
+    def to_price(self):
+        """The new valves of added and changed lines: all that needs pricing."""
+        return [change.new for change in self.changes if change.status in (ADDED, CHANGED)]
+
+    def merge(self, priced):
+        """A diff whose new valves carry prices, from ``priced``: the priced
+        :attr:`to_price` valves in the same order, None for any that failed.
+
+        Unchanged lines keep the price, currency and price list version they
+        were quoted with. Lines that failed keep their unpriced valve.
+        """
+        priced = iter(priced)
+        changes = []
+        for change in self.changes:
+            if change.status in (ADDED, CHANGED):
+                valve = next(priced)
+            elif change.status == UNCHANGED:
+                old = change.old
+                valve = {**change.new, 'total_price': old['total_price'],
+                         'currency': old.get('currency'), 'price_version': old.get('price_version')}
+            else:
+                valve = None
+            if valve is not None:
+                change = LineChange(change.status, change.old, valve, change.old_line, change.new_line)
+            changes.append(change)
+        return QuoteDiff(changes)
+
+    def is_current(self, items):
+        """Whether the :class:`~valvefigure.items.ProposalItems` ``items``
+        still hold every old line as it was when the diff was taken.
+
+        Records are replaced on every edit, never mutated, so a line that was
+        removed or edited since no longer is the diffed record.
+        """
+        for change in self.changes:
+            if change.old is None:
+                continue
+            item_id = change.old.item_id
+            if item_id not in items or items.get(item_id) is not change.old:
+                return False
+        return True
+
+    def apply(self, items):
+        """Make the old revision's :class:`~valvefigure.items.ProposalItems`
+        ``items`` the merged new one; returns the number of items written.
+
+        Changed lines are updated in place, removed ones removed and added
+        ones added, so matched items keep their IDs and unchanged ones their
+        records. When the revision reorders lines or adds them between
+        existing ones, the items are then put in its order in one
+        :meth:`~valvefigure.items.ProposalItems.reorder`. Lines that failed
+        pricing are left as they were.
+
+        Raises :class:`RevisionError`, before changing anything, when
+        ``items`` are no longer :meth:`current <is_current>`.
+        """
+        if not self.is_current(items):
+            raise RevisionError("The proposal changed since the revision was compared with it")
+        written = 0
+        # Item IDs in the new revision's order
+        order = []
+        for change in self.changes:
+            if change.status == REMOVED:
+                items.remove(change.old.item_id)
+                written += 1
+                continue
+            if change.status != ADDED:
+                order.append(change.old.item_id)
+            if change.new_price is None:
+                continue
+            elif change.status == ADDED:
+                order.append(items.add(change.new))
+            elif change.status == CHANGED or any(change.old.get(name) != value
+                                                 for name, value in change.new.items()
+                                                 if name not in _MATCHED_FIELDS):
+                items.update(change.old.item_id, **change.new)
+            else:
+                continue
+            written += 1
+        # Items added since the diff was taken stay last
+        listed = set(order)
+        order += [item.item_id for item in items if item.item_id not in listed]
+        if order != [item.item_id for item in items]:
+            items.reorder(order)
+        return written
+
+    @property
+    def valves(self):
+        """The new revision's priced valves, in order."""
+        return [change.new for change in self.changes
+                if change.new is not None and change.new_price is not None]
+
+    @property
+    def price_delta(self):
+        """Change of the proposal total, over the lines whose delta is known."""
+        return sum(change.delta for change in self.changes if change.delta is not None)
+
+    def redline(self, include_unchanged=False):
+        """Rows of :data:`REDLINE_COLUMNS` for every line that differs."""
+        rows = []
+        for change in self.changes:
+            if change.status == UNCHANGED and not include_unchanged:
+                continue
+            valve = change.new if change.new is not None else change.old
+            rows.append({
+                'Line': change.new_line if change.new_line is not None else change.old_line,
+                'Tag': valve.get('tag') or '',
+                'Description': f"{valve['size']} {valve['type']} Valve",
+                'Change': change.status,
+                'Old Qty': None if change.old is None else change.old['quantity'],
+                'New Qty': None if change.new is None else change.new['quantity'],
+                'Old Price': change.old_price,
+                'New Price': change.new_price,
+                'Delta': change.delta,
+            })
+        return rows
+
+
+def diff_quotes(old, new):
+    """Pair the lines of two revisions of a quote; returns a :class:`QuoteDiff`.
+
+    ``old`` and ``new`` are valves or proposal items. Lines are paired by
+    ``tag`` when both carry one, then by identical configuration, first
+    unpaired match first, then by position. A paired line is unchanged
+    when its configuration and quantity are the same, else changed.
+    """
+    old = list(old)
+    new = list(new)
+    old_hashes = [line_hash(valve) for valve in old]
+    new_hashes = [line_hash(valve) for valve in new]
+    pairs = [None] * len(new)
+    paired_old = set()
+
+    by_tag = defaultdict(deque)
+    for i, valve in enumerate(old):
+        if valve.get('tag'):
+            by_tag[valve['tag']].append(i)
+    for j, valve in enumerate(new):
+        candidates = by_tag.get(valve.get('tag')) if valve.get('tag') else None
+        if candidates:
+            pairs[j] = candidates.popleft()
+            paired_old.add(pairs[j])
+
+    by_hash = defaultdict(deque)
+    for i in range(len(old)):
+        if i not in paired_old:
+            by_hash[old_hashes[i]].append(i)
+    for j in range(len(new)):
+        if pairs[j] is None:
+            candidates = by_hash.get(new_hashes[j])
+            if candidates:
+                pairs[j] = candidates.popleft()
+                paired_old.add(pairs[j])
+
+    # Lines left over at the same position are the same line edited, unless
+    # their tags say otherwise
+    for j, valve in enumerate(new):
+        if pairs[j] is None and j < len(old) and j not in paired_old \
+                and not (valve.get('tag') and old[j].get('tag')):
+            pairs[j] = j
+            paired_old.add(j)
+
+    changes = []
+    for j, valve in enumerate(new):
+        i = pairs[j]
+        if i is None:
+            changes.append(LineChange(ADDED, None, valve, new_line=j + 1))
+            continue
+        previous = old[i]
+        same = old_hashes[i] == new_hashes[j] and previous['quantity'] == valve['quantity']
+        changes.append(LineChange(UNCHANGED if same else CHANGED, previous, valve, i + 1, j + 1))
+    changes.extend(LineChange(REMOVED, valve, None, old_line=i + 1)
+                   for i, valve in enumerate(old) if i not in paired_old)
+    return QuoteDiff(changes)
+
+
+def requote(old, new, price_db, material_db, **pinned):
+    """Price the revision ``new`` of the quote ``old``, pricing only the
+    lines that differ; returns ``(diff, errors)``.
+
+    ``diff`` is the merged :class:`QuoteDiff` and ``errors`` holds a
+    ``(line, message)`` pair for every line without price data. ``pinned``
+    fields (e.g. ``currency`` and ``price_version``) are set on every
+    repriced valve.
+    """
+    diff = diff_quotes(old, new)
+    priced, errors = [], []
+    for change in diff.changes:
+        if change.status not in (ADDED, CHANGED):
+            continue
+        try:
+            total_price = calculate_valve_price(change.new, price_db, material_db)['total_price']
+        except KeyError as e:
+            errors.append((change.new_line, f"Missing price data for: {e}"))
+            priced.append(None)
+        else:
+            priced.append({**change.new, 'total_price': total_price, **pinned})
+    return diff.merge(priced), errors
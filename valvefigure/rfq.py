@@ -0,0 +1,252 @@
+"""Batch RFQ import: read a valve schedule, validate it, price and render it.
+
+A schedule is a CSV or XLSX file with one valve per row and the fields of a
+configured valve as columns (see :data:`SCHEDULE_COLUMNS`). Headers are
+matched case-insensitively with spaces or underscores. Accessories are
+separated by ';' (or ',').
+
+:class:`ImportJob` prices the validated rows with ``calculate_valve_price``
+and renders each distinct figure once, in a process pool, so large schedules
+never block the caller. Results become visible as chunks finish and the job
+can be cancelled at any time.
+"""
+
+import csv
+import re
+import threading
+from io import TextIOWrapper
+
+from valvefigure.figcache import figure_key, render_figure_png
+from valvefigure.pricing import (
+    FAIL_MODES, FLUID_TYPES, MATERIAL_COLUMNS, MAX_QUANTITY, VALVE_TYPES, calculate_valve_price,
+)
+
+REQUIRED_COLUMNS = ('size', 'pressure_rating', 'type', 'fail_mode', 'actuator_type',
+                    *MATERIAL_COLUMNS, 'quantity')
+OPTIONAL_COLUMNS = ('tag', 'accessories', 'op_pressure', 'op_temp', 'fluid_type', 'notes')
+SCHEDULE_COLUMNS = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+DEFAULT_CHUNK_SIZE = 50
+
+
+class ScheduleError(ValueError):
+    """The schedule file cannot be read as a valve schedule at all."""
+
+
+def _column_name(header):
+    return re.sub(r'[\s_]+', '_', str(header or '').strip().lower())
+
+
+def read_schedule(fileobj, filename):
+    """Read the rows of a CSV or XLSX schedule as dicts keyed by column name.
+
+    ``fileobj`` is a binary file object such as a Streamlit upload. Rows are
+    returned as ``(row_number, row)`` pairs, numbered as in the file.
+    """
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = [_column_name(cell) for cell in next(rows, ())]
+            records = [(row_no, dict(zip(header, row))) for row_no, row in enumerate(rows, start=2)]
+        finally:
+            workbook.close()
+    elif filename.lower().endswith('.csv'):
+        reader = csv.reader(TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+        header = [_column_name(cell) for cell in next(reader, [])]
+        records = [(row_no, dict(zip(header, row))) for row_no, row in enumerate(reader, start=2)]
+    else:
+        raise ScheduleError(f"Unsupported schedule file type: {filename}")
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise ScheduleError(f"Schedule is missing columns: {', '.join(missing)}")
+    return [(row_no, row) for row_no, row in records
+            if any(value not in (None, '') for value in row.values())]
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def validate_schedule(records, price_db, material_db, rules=None):
+    """Check schedule rows against the price and material databases.
+
+    With a :class:`~valvefigure.rules.RuleSet` as ``rules``, rows whose
+    options their operating conditions rule out are rejected too.
+
+    Returns ``(valves, errors)``: the valid rows as valve dicts ready to
+    price, each with its ``row`` number, and ``(row_number, message)`` pairs
+    for every problem found.
+    """
+    choices = {
+        'size': price_db['Valve Size'],
+        'pressure_rating': price_db['Pressure Rating'],
+        'type': VALVE_TYPES,
+        'fail_mode': FAIL_MODES,
+        'actuator_type': price_db['Actuator Type'],
+        **{col: material_db[category] for col, category in MATERIAL_COLUMNS.items()},
+    }
+    valves, errors = [], []
+    for row_no, row in records:
+        problems = []
+        valve = {'row': row_no}
+        for name, options in choices.items():
+            value = _text(row.get(name))
+            # Sizes are written as 2" in the price database; accept a bare 2
+            if name == 'size' and value and value not in options and f'{value}"' in options:
+                value = f'{value}"'
+            if value not in options:
+                problems.append(f"{name} {value!r} is not a known option" if value else f"{name} is empty")
+            valve[name] = value
+        try:
+            valve['quantity'] = int(float(_text(row.get('quantity'))))
+            if valve['quantity'] < 1:
+                raise ValueError
+        except ValueError:
+            problems.append(f"quantity {_text(row.get('quantity'))!r} is not a positive whole number")
+        else:
+            if valve['quantity'] > MAX_QUANTITY:
+                problems.append(f"quantity {valve['quantity']} is over the maximum of {MAX_QUANTITY} per line")
+        accessories = [name.strip() for name in re.split(r'[;,]', _text(row.get('accessories'))) if name.strip()]
+        unknown = [name for name in accessories if name not in price_db['Accessories']]
+        if unknown:
+            problems.append(f"unknown accessories: {', '.join(unknown)}")
+        valve['accessories'] = accessories
+        for name in ('op_pressure', 'op_temp'):
+            value = _text(row.get(name))
+            try:
+                valve[name] = float(value) if value else None
+            except ValueError:
+                problems.append(f"{name} {value!r} is not a number")
+        fluid_type = _text(row.get('fluid_type'))
+        if fluid_type and fluid_type not in FLUID_TYPES:
+            problems.append(f"fluid_type {fluid_type!r} is not a known option")
+        valve['fluid_type'] = fluid_type or None
+        valve['notes'] = _text(row.get('notes'))
+        valve['tag'] = _text(row.get('tag')) or None
+        if rules is not None and not problems:
+            problems.extend(rules.violations(valve))
+        if problems:
+            errors.extend((row_no, problem) for problem in problems)
+        else:
+            valves.append(valve)
+    return valves, errors
+
+
+def process_chunk(chunk, price_db, material_db):
+    """Price a chunk of valves and render the figures it is responsible for.
+
+    ``chunk`` holds ``(index, valve, render)`` triples. Returns
+    ``(index, valve_with_price or None, error or None, figure_key, png or None)``
+    for each. Runs in worker processes.
+    """
+    results = []
+    for index, valve, render in chunk:
+        key = figure_key(valve, material_db)
+        try:
+            total_price = calculate_valve_price(valve, price_db, material_db)['total_price']
+        except KeyError as e:
+            results.append((index, None, f"Missing price data for: {e}", key, None))
+            continue
+        png = render_figure_png(valve, material_db) if render else None
+        results.append((index, {**valve, 'total_price': total_price}, None, key, png))
+    return results
+
+
+class ImportJob:
+    """Prices and renders validated schedule rows in a background process pool.
+
+    Each distinct figure is rendered once. Call :meth:`start`, then poll
+    :attr:`progress`, :meth:`results` and :attr:`done`; rendered figures are
+    collected in :attr:`figures` keyed by :func:`~valvefigure.figcache.figure_key`.
+    """
+
+    def __init__(self, valves, price_db, material_db, render_figures=True,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None):
+        self.valves = valves
+        self.price_db = price_db
+        self.material_db = material_db
+        self.render_figures = render_figures
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.figures = {}
+        self.errors = []
+        self.cancelled = False
+        self.failure = None
+        self._priced = {}
+        self._completed = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = []
+        self._thread = None
+
+    @property
+    def total(self):
+        return len(self.valves)
+
+    @property
+    def progress(self):
+        """Fraction of rows processed, from 0.0 to 1.0."""
+        return self._completed / self.total if self.total else 1.0
+
+    @property
+    def done(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def start(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+
+        seen = set()
+        tasks = []
+        for index, valve in enumerate(self.valves):
+            key = figure_key(valve, self.material_db)
+            render = self.render_figures and key not in seen
+            seen.add(key)
+            tasks.append((index, valve, render))
+        chunks = [tasks[i:i + self.chunk_size] for i in range(0, len(tasks), self.chunk_size)]
+        # Spawned workers do not inherit the server's threads and locks
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context('spawn'))
+        self._futures = [self._executor.submit(process_chunk, chunk, self.price_db, self.material_db)
+                         for chunk in chunks]
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+        return self
+
+    def _collect(self):
+        from concurrent.futures import as_completed
+
+        try:
+            for future in as_completed(self._futures):
+                if future.cancelled():
+                    continue
+                for index, valve, error, key, png in future.result():
+                    with self._lock:
+                        if error:
+                            self.errors.append((self.valves[index]['row'], error))
+                        else:
+                            self._priced[index] = valve
+                        if png is not None:
+                            self.figures[key] = png
+                        self._completed += 1
+        except Exception as e:  # surfaced through .failure instead of dying silently
+            self.failure = e
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def cancel(self):
+        """Stop the job: queued chunks are dropped, running ones finish."""
+        self.cancelled = True
+        for future in self._futures:
+            future.cancel()
+
+    def results(self):
+        """The valves priced so far, in schedule order."""
+        with self._lock:
+            return [self._priced[index] for index in sorted(self._priced)]
@@ -0,0 +1,239 @@
+"""Engineering compatibility rules for valve configurations.
+
+Rules are declarative dicts (see :data:`DEFAULT_RULES`), one of:
+
+``{'kind': 'temperature', 'column': ..., 'material': ..., 'min': °C, 'max': °C}``
+    The material may only be used between ``min`` and ``max`` inclusive.
+``{'kind': 'pressure_temperature', 'rating': ..., 'points': [(°C, bar), ...]}``
+    Maximum working pressure of a pressure class, linearly interpolated
+    between the points. Below the first point the first pressure applies;
+    above the last point the class is not rated.
+``{'kind': 'fluid', 'fluid': ..., 'column': ..., 'material': ..., 'reason': ...}``
+    The material must not be used with the fluid.
+
+:class:`RuleSet` compiles them into indexed tables: per column, the
+temperature axis is cut at every rule boundary into intervals, each holding
+a bitmask of the materials not allowed in it, so the materials ruled out at
+a temperature are one bisection away whatever the number of rules, and
+pressure classes are interpolated from sorted breakpoints. Rules
+only apply to the operating conditions a valve actually has:
+``op_temp``, ``op_pressure`` and ``fluid_type`` may be None.
+"""
+
+import math
+from bisect import bisect_right
+
+from valvefigure.pricing import MATERIAL_COLUMNS
+
+TEMPERATURE = 'temperature'
+PRESSURE_TEMPERATURE = 'pressure_temperature'
+FLUID = 'fluid'
+
+RULE_COLUMNS = (*MATERIAL_COLUMNS, 'pressure_rating')
+
+
+class RuleError(ValueError):
+    """A rule is malformed."""
+
+
+# ========================
+# DEFAULT RULES
+# ========================
+def _temperature(column, material, low, high):
+    return {'kind': TEMPERATURE, 'column': column, 'material': material, 'min': low, 'max': high}
+
+
+def _fluid(fluid, column, material, reason):
+    return {'kind': FLUID, 'fluid': fluid, 'column': column, 'material': material, 'reason': reason}
+
+
+_PT_TEMPERATURES = (-29, 38, 50, 100, 150, 200, 250, 300, 325, 350, 375, 400, 425, 450, 475, 500, 538)
+
+# Standard class ratings of ASME B16.34 material group 1.1 (e.g. WCB), in bar
+_PT_PRESSURES = {
+    '150#': (19.6, 19.6, 19.2, 17.7, 15.8, 13.8, 12.1, 10.2, 9.3, 8.4, 7.4, 6.5, 5.5, 4.6, 3.7, 2.8, 1.4),
+    '300#': (51.1, 51.1, 50.1, 46.6, 45.1, 43.8, 41.9, 39.8, 38.7, 37.6, 36.4, 34.7, 28.8, 23.0, 17.4, 11.8, 5.9),
+    '600#': (102.1, 102.1, 100.2, 93.2, 90.2, 87.6, 83.9, 79.6, 77.4, 75.1, 72.7, 69.4, 57.5, 46.0, 34.9, 23.5,
+             11.8),
+    '900#': (153.2, 153.2, 150.4, 139.8, 135.2, 131.4, 125.8, 119.5, 116.1, 112.7, 109.1, 104.2, 86.3, 69.0, 52.3,
+             35.3, 17.7),
+    '1500#': (255.3, 255.3, 250.6, 233.0, 225.4, 219.0, 209.7, 199.1, 193.6, 187.8, 181.8, 173.6, 143.8, 115.0,
+              87.2, 58.8, 29.5),
+    '2500#': (425.5, 425.5, 417.7, 388.3, 375.6, 365.0, 349.5, 331.8, 322.6, 313.0, 303.1, 289.3, 239.7, 191.7,
+              145.3, 97.9, 49.2),
+}
+
+DEFAULT_RULES = [
+    # Body/Bonnet
+    _temperature('body_material', 'Carbon Steel', -29, 425),
+    _temperature('body_material', 'Stainless Steel 316', -196, 538),
+    _temperature('body_material', 'Duplex Steel', -50, 300),
+    _temperature('body_material', 'Super Duplex', -50, 300),
+    _temperature('body_material', 'Alloy 20', -100, 316),
+    _temperature('body_material', 'Hastelloy C', -196, 677),
+    # Ball
+    _temperature('ball_material', 'Stainless Steel 316', -196, 538),
+    _temperature('ball_material', 'Stellite 6', -196, 650),
+    _temperature('ball_material', 'Alloy 6', -196, 650),
+    _temperature('ball_material', 'Hastelloy C', -196, 677),
+    # Stem
+    _temperature('stem_material', 'Stainless Steel 316', -196, 538),
+    _temperature('stem_material', '17-4 PH', -29, 343),
+    _temperature('stem_material', 'Monel', -196, 482),
+    _temperature('stem_material', 'Inconel 718', -253, 650),
+    # Seat
+    _temperature('seat_material', 'PTFE', -50, 200),
+    _temperature('seat_material', 'RPTFE', -50, 230),
+    _temperature('seat_material', 'PEEK', -50, 260),
+    _temperature('seat_material', 'Metal', -196, 550),
+    _temperature('seat_material', 'Graphoil', -200, 500),
+    # Trim
+    _temperature('trim_type', 'Standard', -29, 538),
+    _temperature('trim_type', 'Anti-cavitation', -29, 538),
+    _temperature('trim_type', 'Low Noise', -29, 538),
+    _temperature('trim_type', 'Cryogenic', -196, 65),
+    # Pressure classes
+    *({'kind': PRESSURE_TEMPERATURE, 'rating': rating, 'points': list(zip(_PT_TEMPERATURES, pressures))}
+      for rating, pressures in _PT_PRESSURES.items()),
+    # Fluids
+    _fluid('Chemical', 'body_material', 'Carbon Steel', "corrodes in chemical service"),
+    _fluid('Chemical', 'stem_material', '17-4 PH', "is prone to stress corrosion in chemical service"),
+    _fluid('Steam', 'seat_material', 'PTFE', "creeps and erodes in steam service"),
+    _fluid('Cryogenic', 'body_material', 'Carbon Steel', "becomes brittle at cryogenic temperatures"),
+    _fluid('Cryogenic', 'body_material', 'Duplex Steel', "becomes brittle at cryogenic temperatures"),
+    _fluid('Cryogenic', 'body_material', 'Super Duplex', "becomes brittle at cryogenic temperatures"),
+    _fluid('Cryogenic', 'stem_material', '17-4 PH', "becomes brittle at cryogenic temperatures"),
+    _fluid('Cryogenic', 'trim_type', 'Standard', "needs extended-bonnet cryogenic trim"),
+    _fluid('Cryogenic', 'trim_type', 'Anti-cavitation', "needs extended-bonnet cryogenic trim"),
+    _fluid('Cryogenic', 'trim_type', 'Low Noise', "needs extended-bonnet cryogenic trim"),
+]
+
+
+# ========================
+# COMPILED RULES
+# ========================
+class _IntervalTable:
+    """Materials ruled out per temperature interval of one column, as bitmasks."""
+
+    __slots__ = ('bits', 'limits', 'bounds', 'excluded')
+
+    def __init__(self, limits):
+        # limits: {material: (min, max)}, already intersected per material
+        self.limits = limits
+        self.bits = {material: 1 << i for i, material in enumerate(limits)}
+        # Interval i is [bounds[i-1], bounds[i]); a closed max becomes the next
+        # float up so that max itself is still allowed. One sweep over the
+        # sorted boundaries flips each material's bit where its range starts
+        # and ends.
+        events = {}
+        for material, (low, high) in limits.items():
+            bit = self.bits[material]
+            events.setdefault(low, [0, 0])[0] |= bit
+            events.setdefault(math.nextafter(high, math.inf), [0, 0])[1] |= bit
+        self.bounds = sorted(events)
+        mask = (1 << len(limits)) - 1
+        self.excluded = [mask]
+        for bound in self.bounds:
+            enter, leave = events[bound]
+            mask = (mask & ~enter) | leave
+            self.excluded.append(mask)
+
+    def excluded_at(self, temperature):
+        return self.excluded[bisect_right(self.bounds, temperature)]
+
+
+class RuleSet:
+    """Compiled compatibility rules; see the module docstring for the rule format."""
+
+    def __init__(self, rules=DEFAULT_RULES):
+        limits = {}
+        ratings = {}
+        fluids = {}
+        for rule in rules:
+            try:
+                kind = rule['kind']
+                if kind == TEMPERATURE:
+                    low, high = float(rule['min']), float(rule['max'])
+                    if low > high:
+                        raise RuleError(f"Temperature rule for {rule['material']} has min above max")
+                    column_limits = limits.setdefault(rule['column'], {})
+                    current = column_limits.get(rule['material'], (-math.inf, math.inf))
+                    column_limits[rule['material']] = (max(current[0], low), min(current[1], high))
+                elif kind == PRESSURE_TEMPERATURE:
+                    points = sorted((float(t), float(p)) for t, p in rule['points'])
+                    if not points:
+                        raise RuleError(f"Pressure-temperature rule for {rule['rating']} has no points")
+                    ratings[rule['rating']] = ([t for t, _ in points], [p for _, p in points])
+                elif kind == FLUID:
+                    fluids.setdefault((rule['fluid'], rule['column']), {})[rule['material']] = rule['reason']
+                else:
+                    raise RuleError(f"Unknown rule kind: {kind!r}")
+            except RuleError:
+                raise
+            except (KeyError, TypeError, ValueError) as e:
+                raise RuleError(f"Malformed rule {rule!r}: {e}") from e
+        self.temperature_tables = {column: _IntervalTable(column_limits) for column, column_limits in limits.items()}
+        self.ratings = ratings
+        self.fluids = fluids
+
+    def max_pressure(self, rating, temperature):
+        """Maximum working pressure in bar of ``rating`` at ``temperature``;
+        None when the class has no rule, 0.0 above its rated temperatures."""
+        if rating not in self.ratings:
+            return None
+        temperatures, pressures = self.ratings[rating]
+        if temperature <= temperatures[0]:
+            return pressures[0]
+        if temperature > temperatures[-1]:
+            return 0.0
+        i = bisect_right(temperatures, temperature)
+        if i == len(temperatures):
+            return pressures[-1]
+        t0, t1 = temperatures[i - 1], temperatures[i]
+        p0, p1 = pressures[i - 1], pressures[i]
+        return p0 + (p1 - p0) * (temperature - t0) / (t1 - t0)
+
+    def _reason(self, column, value, valve, excluded_mask=None):
+        """Why the valve's conditions rule out ``value`` for ``column``, or None."""
+        op_temp = valve.get('op_temp')
+        if column == 'pressure_rating':
+            op_pressure = valve.get('op_pressure')
+            if op_temp is None or op_pressure is None or value not in self.ratings:
+                return None
+            allowed = self.max_pressure(value, op_temp)
+            if op_pressure <= allowed:
+                return None
+            if not allowed:
+                return f"is not rated at {op_temp:g} °C"
+            return f"is rated {allowed:.1f} bar at {op_temp:g} °C, below {op_pressure:g} bar"
+        table = self.temperature_tables.get(column)
+        if table is not None and op_temp is not None and value in table.bits:
+            if excluded_mask is None:
+                excluded_mask = table.excluded_at(op_temp)
+            if excluded_mask & table.bits[value]:
+                low, high = table.limits[value]
+                return f"is limited to {low:g} to {high:g} °C, not {op_temp:g} °C"
+        fluid_type = valve.get('fluid_type')
+        if fluid_type is not None:
+            return self.fluids.get((fluid_type, column), {}).get(value)
+        return None
+
+    def allowed(self, column, options, valve):
+        """The ``options`` of ``column`` compatible with the valve's operating conditions."""
+        table = self.temperature_tables.get(column)
+        op_temp = valve.get('op_temp')
+        # One bisection covers the temperature rules of every option
+        mask = table.excluded_at(op_temp) if table is not None and op_temp is not None else 0
+        return [option for option in options if self._reason(column, option, valve, mask) is None]
+
+    def violations(self, valve):
+        """Messages for every field of ``valve`` its operating conditions rule out."""
+        messages = []
+        for column in RULE_COLUMNS:
+            value = valve.get(column)
+            if value is None:
+                continue
+            reason = self._reason(column, value, valve)
+            if reason:
+                messages.append(f"{column} {value} {reason}")
+        return messages
@@ -0,0 +1,406 @@
+"""Server-side proposal persistence in SQLite, with batched write-behind.
+
+:class:`ProposalStore` keeps each proposal's metadata, saved valve
+configurations and line items in a SQLite database in WAL mode, so readers
+never wait for the writer and several app processes can share one file.
+
+Writes never block the caller: :meth:`ProposalStore.save_meta` and the
+``on_change`` hook installed by :meth:`ProposalStore.track` only record the
+latest state of what changed, and a background thread writes everything
+pending in one transaction at most every ``flush_interval`` seconds. Several
+edits of the same item between flushes cost a single row write. A batch whose
+transaction fails (e.g. "database is locked" while another process writes)
+stays pending and is retried. Loading a proposal reads its unwritten changes
+from memory, over what the database holds, rather than waiting for them.
+
+Proposals are indexed by client and date for :meth:`ProposalStore.search`,
+which reads only summary columns; items are read when a proposal is opened.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from dataclasses import dataclass
+
+from valvefigure.items import ProposalItems
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS proposals (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    client_name TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    date TEXT NOT NULL DEFAULT '',
+    valves TEXT NOT NULL DEFAULT '[]',
+    logo BLOB,
+    currency TEXT NOT NULL DEFAULT 'EUR',
+    item_count INTEGER NOT NULL DEFAULT 0,
+    total_price REAL NOT NULL DEFAULT 0,
+    item_order TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS proposals_client ON proposals (client_name, date);
+CREATE INDEX IF NOT EXISTS proposals_date ON proposals (date);
+CREATE TABLE IF NOT EXISTS items (
+    proposal_id TEXT NOT NULL REFERENCES proposals (id) ON DELETE CASCADE,
+    item_id INTEGER NOT NULL,
+    total_price REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (proposal_id, item_id)
+) WITHOUT ROWID;
+"""
+
+# Columns added since the first schema: (table, column, definition), for older databases
+MIGRATIONS = [
+    ('proposals', 'currency', "TEXT NOT NULL DEFAULT 'EUR'"),
+    ('proposals', 'item_order', 'TEXT'),
+]
+
+META_FIELDS = ('name', 'client_name', 'date', 'valves', 'logo', 'currency')
+# Metadata of a proposal not written yet, as the schema's column defaults
+META_DEFAULTS = {'name': '', 'client_name': '', 'date': '', 'valves': '[]', 'logo': None, 'currency': 'EUR'}
+
+DEFAULT_FLUSH_INTERVAL = 0.5
+# How long a write waits for another process's transaction before failing
+BUSY_TIMEOUT_MS = 5000
+
+
+@dataclass(frozen=True)
+class ProposalSummary:
+    """A row of :meth:`ProposalStore.search` results."""
+
+    id: str
+    name: str
+    client_name: str
+    date: str
+    item_count: int
+    total_price: float
+    currency: str
+    updated_at: float
+
+
+class ProposalStore:
+    """Proposals persisted in the SQLite database at ``path``.
+
+    Safe to share between threads. Call :meth:`flush` to wait for pending
+    writes, e.g. before shutdown; a failed background write is kept in
+    ``last_error``.
+    """
+
+    def __init__(self, path, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.last_error = None
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self._migrate()
+        self._reader = self._connect()
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # Latest unwritten state, swapped out as a whole by each flush
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._items = {}
+        self._cleared = set()
+        # proposal ID -> item IDs in order, or None for item ID order
+        self._orders = {}
+        self._saved_meta = {}
+        # The batch a flush is writing, still read by loads until it commits
+        self._flushing = None
+        # proposal ID -> weak reference to the ProposalItems tracked for it
+        self._tracked = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # WAL keeps committed transactions safe from crashes; syncing every
+        # commit only protects against power loss
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('PRAGMA foreign_keys=ON')
+        connection.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return connection
+
+    def _migrate(self):
+        for table, column, definition in MIGRATIONS:
+            columns = {row[1] for row in self._writer.execute(f'PRAGMA table_info({table})')}
+            if column not in columns:
+                self._writer.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    @staticmethod
+    def new_proposal_id():
+        return uuid.uuid4().hex
+
+    # ------------------------
+    # Write-behind
+    # ------------------------
+    def save_meta(self, proposal_id, **meta):
+        """Queue the proposal's metadata (any of :data:`META_FIELDS`).
+
+        Values equal to what was last saved are not written again.
+        """
+        unknown = set(meta) - set(META_FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown proposal fields: {', '.join(sorted(unknown))}")
+        if 'valves' in meta:
+            # Compare and store a snapshot: the caller keeps appending to its list
+            meta['valves'] = json.dumps(meta['valves'])
+        with self._lock:
+            saved = self._saved_meta.setdefault(proposal_id, {})
+            changed = {name: value for name, value in meta.items() if saved.get(name, ...) != value}
+            if not changed:
+                return
+            saved.update(changed)
+            self._meta.setdefault(proposal_id, {}).update(changed)
+        self._wake.set()
+
+    def has_saved(self, proposal_id):
+        """Whether the proposal's metadata was saved or loaded through this store."""
+        with self._lock:
+            return proposal_id in self._saved_meta
+
+    def forget(self, proposal_id):
+        """Drop what is remembered of the proposal's saved metadata; its
+        pending writes still go ahead."""
+        with self._lock:
+            self._saved_meta.pop(proposal_id, None)
+
+    def track(self, proposal_id, items):
+        """Persist every later change of the :class:`ProposalItems` ``items``.
+
+        The proposal is forgotten (see :meth:`forget`) once ``items`` is
+        garbage collected, e.g. when its session ends, unless it was tracked
+        again meanwhile.
+        """
+        def collected(ref):
+            with self._lock:
+                if self._tracked.get(proposal_id) is ref:
+                    del self._tracked[proposal_id]
+                    self._saved_meta.pop(proposal_id, None)
+
+        items.on_change = lambda item_id, item: self._item_changed(proposal_id, item_id, item)
+        items.on_reorder = lambda item_ids: self._items_reordered(proposal_id, item_ids)
+        with self._lock:
+            self._tracked[proposal_id] = weakref.ref(items, collected)
+
+    def _item_changed(self, proposal_id, item_id, item):
+        with self._lock:
+            if item_id is None:
+                # Cleared: earlier pending item writes are moot
+                self._items = {key: item for key, item in self._items.items() if key[0] != proposal_id}
+                self._cleared.add(proposal_id)
+                self._orders[proposal_id] = None
+            else:
+                # Records are replaced, never mutated, so serializing can wait for the flush
+                self._items[proposal_id, item_id] = item
+        self._wake.set()
+
+    def _items_reordered(self, proposal_id, item_ids):
+        with self._lock:
+            self._orders[proposal_id] = item_ids
+        self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait()
+            # Let a burst of edits coalesce into one transaction
+            time.sleep(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:  # keep serving; the batch is pending again, so retry
+                self.last_error = e
+                self._wake.set()
+            except Exception as e:  # keep serving; surfaced through last_error
+                self.last_error = e
+            else:
+                self.last_error = None
+
+    def flush(self):
+        """Write everything pending now, in one transaction.
+
+        When the transaction fails, its writes are pending again, under any
+        queued since. Items that cannot be serialized are left out, and the
+        first such error is raised once the rest is written.
+        """
+        with self._write_lock:
+            with self._lock:
+                meta, items, cleared, orders = self._meta, self._items, self._cleared, self._orders
+                if not (meta or items or cleared or orders):
+                    return
+                self._meta, self._items, self._cleared, self._orders = {}, {}, set(), {}
+                self._flushing = meta, items, cleared, orders
+            rows, failure = [], None
+            for key, item in items.items():
+                if item is None:
+                    continue
+                try:
+                    rows.append((*key, item['total_price'], json.dumps(item.as_dict())))
+                except (KeyError, TypeError, ValueError) as e:
+                    failure = failure or e
+            now = time.time()
+            touched = set(meta) | cleared | set(orders) | {proposal_id for proposal_id, _ in items}
+            db = self._writer
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                self._write(db, now, touched, meta, items, cleared, orders, rows)
+            except BaseException:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+                self._requeue(meta, items, cleared, orders)
+                raise
+            with self._lock:
+                self._flushing = None
+            if failure is not None:
+                raise failure
+
+    def _write(self, db, now, touched, meta, items, cleared, orders, rows):
+        db.executemany('INSERT OR IGNORE INTO proposals (id, updated_at) VALUES (?, ?)',
+                       [(proposal_id, now) for proposal_id in touched])
+        for proposal_id, fields in meta.items():
+            db.execute(f"UPDATE proposals SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                       [*fields.values(), proposal_id])
+        db.executemany('DELETE FROM items WHERE proposal_id = ?', [(pid,) for pid in cleared])
+        db.executemany('DELETE FROM items WHERE proposal_id = ? AND item_id = ?',
+                       [key for key, item in items.items() if item is None])
+        db.executemany('INSERT OR REPLACE INTO items (proposal_id, item_id, total_price, data) '
+                       'VALUES (?, ?, ?, ?)', rows)
+        db.executemany('UPDATE proposals SET item_order = ? WHERE id = ?',
+                       [(None if order is None else json.dumps(order), proposal_id)
+                        for proposal_id, order in orders.items()])
+        db.executemany(
+            'UPDATE proposals SET updated_at = ?, '
+            '(item_count, total_price) = (SELECT count(*), coalesce(sum(total_price), 0) '
+            'FROM items WHERE proposal_id = proposals.id) WHERE id = ?',
+            [(now, proposal_id) for proposal_id in touched])
+        db.execute('COMMIT')
+
+    def _requeue(self, meta, items, cleared, orders):
+        """Make a failed batch pending again, under what was queued since."""
+        with self._lock:
+            for proposal_id, fields in meta.items():
+                pending = self._meta.get(proposal_id, {})
+                # Values that never reached the database are not saved,
+                # unless saved again since
+                saved = self._saved_meta.get(proposal_id, {})
+                for name in fields.keys() - pending.keys():
+                    saved.pop(name, None)
+                self._meta[proposal_id] = {**fields, **pending}
+            for key, item in items.items():
+                # Items of a proposal cleared since are moot
+                if key[0] not in self._cleared:
+                    self._items.setdefault(key, item)
+            for proposal_id, order in orders.items():
+                self._orders.setdefault(proposal_id, order)
+            self._cleared |= cleared
+            self._flushing = None
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        self._writer.close()
+        self._reader.close()
+
+    # ------------------------
+    # Reads
+    # ------------------------
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def search(self, client=None, date_from=None, date_to=None, limit=50):
+        """Summaries of saved proposals, most recent date first.
+
+        ``client`` matches the start of the client name, ignoring case;
+        ``date_from`` and ``date_to`` are inclusive ISO dates.
+        """
+        conditions, params = [], []
+        if client:
+            # Prefix LIKE on a NOCASE column can use the client index
+            conditions.append("client_name LIKE ? ESCAPE '\\'")
+            params.append(client.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if date_from:
+            conditions.append('date >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append('date <= ?')
+            params.append(date_to)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self._query(
+            'SELECT id, name, client_name, date, item_count, total_price, currency, updated_at FROM proposals '
+            f'{where} ORDER BY date DESC, updated_at DESC LIMIT ?', [*params, limit])
+        return [ProposalSummary(*row) for row in rows]
+
+    def _pending(self, proposal_id):
+        """The proposal's unwritten changes, oldest first, as a list of
+        ``(meta, items, cleared, order)`` batches: the batch being flushed,
+        if any, then the one queued since. ``items`` maps item IDs to
+        records, None for a removal; ``order`` is ``...`` when unchanged.
+
+        Taken before reading the database, so a change is either still here
+        or already committed when it is read.
+        """
+        with self._lock:
+            batches = [(self._meta, self._items, self._cleared, self._orders)]
+            if self._flushing is not None:
+                batches.insert(0, self._flushing)
+            return [(meta.get(proposal_id, {}),
+                     {item_id: item for (pid, item_id), item in items.items() if pid == proposal_id},
+                     proposal_id in cleared,
+                     orders.get(proposal_id, ...))
+                    for meta, items, cleared, orders in batches]
+
+    def load_meta(self, proposal_id):
+        """The saved metadata of a proposal as a dict, or None when unknown."""
+        pending = self._pending(proposal_id)
+        rows = self._query(f"SELECT {', '.join(META_FIELDS)} FROM proposals WHERE id = ?", (proposal_id,))
+        if rows:
+            meta = dict(zip(META_FIELDS, rows[0]))
+        elif any(fields or items or cleared or order is not ... for fields, items, cleared, order in pending):
+            meta = dict(META_DEFAULTS)
+        else:
+            return None
+        for fields, *_ in pending:
+            meta.update(fields)
+        with self._lock:
+            self._saved_meta[proposal_id] = dict(meta)
+        meta['valves'] = json.loads(meta['valves'])
+        return meta
+
+    def load_items(self, proposal_id):
+        """The saved items of a proposal as :class:`ProposalItems`, IDs and order kept."""
+        pending = self._pending(proposal_id)
+        rows = dict(self._query('SELECT item_id, data FROM items WHERE proposal_id = ?', (proposal_id,)))
+        order = self._query('SELECT item_order FROM proposals WHERE id = ?', (proposal_id,))
+        order = json.loads(order[0][0]) if order and order[0][0] else None
+        for _, items, cleared, new_order in pending:
+            if cleared:
+                rows = {}
+            for item_id, item in items.items():
+                if item is None:
+                    rows.pop(item_id, None)
+                else:
+                    rows[item_id] = item
+            if new_order is not ...:
+                order = new_order
+        item_ids = sorted(rows)
+        if order:
+            # Items added after the last reorder follow in ID order
+            position = {item_id: i for i, item_id in enumerate(order)}
+            item_ids.sort(key=lambda item_id: position.get(item_id, len(position)))
+        return ProposalItems.from_records(
+            (item_id, json.loads(rows[item_id]) if isinstance(rows[item_id], str) else rows[item_id].as_dict())
+            for item_id in item_ids)
+
+    def delete(self, proposal_id):
+        self.flush()
+        with self._write_lock:
+            self._writer.execute('DELETE FROM proposals WHERE id = ?', (proposal_id,))
+        with self._lock:
+            self._saved_meta.pop(proposal_id, None)
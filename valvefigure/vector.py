@@ -0,0 +1,260 @@
+"""Vector valve figures from compiled per-valve-type SVG templates.
+
+Each valve type (:data:`~valvefigure.pricing.VALVE_TYPES`) has an SVG
+template in :data:`TEMPLATES` whose fill colors and label texts are
+``{placeholders}``. A template is parsed once into a list of literal
+fragments and fields, so rendering a figure is a string join of the
+material colors and labels, and the SVG is a few kilobytes instead of a
+400x600 PNG.
+
+The same parsed shapes are compiled into PDF drawing operators, so a figure
+can be embedded in a PDF as a form XObject and stays sharp at any scale
+(see :func:`figure_form_xobject` and :func:`valve_figure_pdf`). Templates
+may only use ``rect``, ``ellipse``, ``polygon``, ``line`` and ``text``
+elements with the attributes the PDF compiler understands.
+"""
+
+import zlib
+from functools import lru_cache
+from string import Formatter
+
+from valvefigure.pdftext import REGULAR, K, escape, pdf_text, text_width
+from valvefigure.pricing import MATERIAL_DB, VALVE_TYPES
+
+FIGURE_WIDTH = 400
+FIGURE_HEIGHT = 600
+
+# Helvetica is one of the PDF core fonts, so figures need no embedded font
+FONT_FAMILY = 'Helvetica, Arial, sans-serif'
+LABEL_SIZE = 14
+
+# Valve fields that determine what a vector figure shows
+VECTOR_FIELDS = ('type', 'size', 'pressure_rating', 'body_material', 'ball_material',
+                 'stem_material', 'actuator_type')
+
+SVG_MIME = 'image/svg+xml'
+
+_XML_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'})
+
+# Bezier handle length of a quarter ellipse, as a fraction of the radius
+KAPPA = 0.5522847498
+
+# ========================
+# TEMPLATES
+# ========================
+_ACTUATOR = '''
+  <rect x="150" y="50" width="100" height="50" fill="#FFD700" stroke="#000000" stroke-width="2"/>
+  <rect x="190" y="100" width="20" height="100" fill="{stem_color}" stroke="#000000" stroke-width="1"/>'''
+
+_LABELS = '''
+  <text x="200" y="30">{actuator_type} Actuator</text>
+  <text x="200" y="450">{size} {pressure_rating}</text>
+  <text x="200" y="480">Body: {body_material}</text>
+  <text x="200" y="510">%s: {ball_material}</text>
+  <text x="200" y="540">Stem: {stem_material}</text>'''
+
+_PIPES = '''
+  <line x1="20" y1="250" x2="100" y2="250" stroke="#808080" stroke-width="3"/>
+  <line x1="300" y1="250" x2="380" y2="250" stroke="#808080" stroke-width="3"/>'''
+
+
+def _svg(body, closure_name):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{FIGURE_WIDTH}" height="{FIGURE_HEIGHT}" '
+            f'viewBox="0 0 {FIGURE_WIDTH} {FIGURE_HEIGHT}" font-family="{FONT_FAMILY}" '
+            f'font-size="{LABEL_SIZE}" text-anchor="middle">'
+            f'\n  <rect x="0" y="0" width="{FIGURE_WIDTH}" height="{FIGURE_HEIGHT}" fill="#FFFFFF"/>'
+            f'{_PIPES}{body}{_LABELS % closure_name}\n</svg>\n')
+
+
+TEMPLATES = {
+    'Ball': _svg('''
+  <rect x="100" y="100" width="200" height="300" fill="{body_color}" stroke="#000000" stroke-width="2"/>''' + _ACTUATOR + '''
+  <ellipse cx="200" cy="250" rx="50" ry="50" fill="{ball_color}" stroke="#000000" stroke-width="2"/>
+  <rect x="150" y="238" width="100" height="24" fill="#FFFFFF" stroke="#000000" stroke-width="1"/>''', 'Ball'),
+    'Globe': _svg('''
+  <rect x="60" y="215" width="40" height="70" fill="{body_color}" stroke="#000000" stroke-width="2"/>
+  <rect x="300" y="215" width="40" height="70" fill="{body_color}" stroke="#000000" stroke-width="2"/>
+  <ellipse cx="200" cy="270" rx="100" ry="110" fill="{body_color}" stroke="#000000" stroke-width="2"/>
+  <rect x="160" y="140" width="80" height="30" fill="{body_color}" stroke="#000000" stroke-width="2"/>''' + _ACTUATOR + '''
+  <line x1="140" y1="290" x2="260" y2="290" stroke="#000000" stroke-width="3"/>
+  <polygon points="175,200 225,200 215,285 185,285" fill="{ball_color}" stroke="#000000" stroke-width="2"/>''',
+                  'Plug'),
+    'Butterfly': _svg('''
+  <rect x="130" y="120" width="140" height="260" fill="{body_color}" stroke="#000000" stroke-width="2"/>
+  <ellipse cx="200" cy="250" rx="60" ry="100" fill="#FFFFFF" stroke="#000000" stroke-width="1"/>''' + _ACTUATOR + '''
+  <ellipse cx="200" cy="250" rx="14" ry="96" fill="{ball_color}" stroke="#000000" stroke-width="2"/>''', 'Disc'),
+    'Gate': _svg('''
+  <rect x="100" y="170" width="200" height="230" fill="{body_color}" stroke="#000000" stroke-width="2"/>
+  <rect x="150" y="110" width="100" height="60" fill="{body_color}" stroke="#000000" stroke-width="2"/>''' + _ACTUATOR + '''
+  <polygon points="170,180 230,180 220,320 180,320" fill="{ball_color}" stroke="#000000" stroke-width="2"/>''',
+                 'Gate'),
+    'Check': _svg('''
+  <rect x="100" y="150" width="200" height="250" fill="{body_color}" stroke="#000000" stroke-width="2"/>
+  <rect x="140" y="110" width="120" height="40" fill="{body_color}" stroke="#000000" stroke-width="2"/>
+  <polygon points="195,180 205,180 235,320 225,324" fill="{ball_color}" stroke="#000000" stroke-width="2"/>
+  <ellipse cx="200" cy="180" rx="9" ry="9" fill="{stem_color}" stroke="#000000" stroke-width="1"/>
+  <polygon points="120,360 170,360 170,350 190,365 170,380 170,370 120,370" fill="#000000"/>''', 'Disc'),
+}
+
+
+def _template_values(valve_data, material_db):
+    return {
+        'body_color': material_db['Body/Bonnet'][valve_data['body_material']]['color'],
+        'ball_color': material_db['Ball'][valve_data['ball_material']]['color'],
+        'stem_color': material_db['Stem'][valve_data['stem_material']]['color'],
+        **{name: str(valve_data[name]) for name in VECTOR_FIELDS if name != 'type'},
+    }
+
+
+def _template_for(valve_data):
+    valve_type = valve_data.get('type') or VALVE_TYPES[0]
+    if valve_type not in TEMPLATES:
+        raise KeyError(f"No figure template for valve type {valve_type!r}")
+    return valve_type
+
+
+# ========================
+# SVG
+# ========================
+@lru_cache(maxsize=None)
+def _compiled_svg(valve_type):
+    """The template split into ``(literal, field)`` pairs; field is None at the end."""
+    return tuple((literal, field) for literal, field, _, _ in Formatter().parse(TEMPLATES[valve_type]))
+
+
+def render_valve_svg(valve_data, material_db=None):
+    """The vector figure for ``valve_data`` as an SVG document string."""
+    material_db = MATERIAL_DB if material_db is None else material_db
+    values = _template_values(valve_data, material_db)
+    parts = []
+    for literal, field in _compiled_svg(_template_for(valve_data)):
+        parts.append(literal)
+        if field is not None:
+            parts.append(values[field].translate(_XML_ESCAPES))
+    return ''.join(parts)
+
+
+# ========================
+# PDF
+# ========================
+@lru_cache(maxsize=256)
+def _pdf_color(color):
+    """'#RRGGBB' as PDF color components."""
+    color = color.lstrip('#')
+    return ' '.join(f'{int(color[i:i + 2], 16) / 255:.3f}' for i in (0, 2, 4))
+
+
+def _ellipse_path(cx, cy, rx, ry):
+    ox, oy = rx * KAPPA, ry * KAPPA
+    return (f'{cx + rx:.2f} {cy:.2f} m '
+            f'{cx + rx:.2f} {cy + oy:.2f} {cx + ox:.2f} {cy + ry:.2f} {cx:.2f} {cy + ry:.2f} c '
+            f'{cx - ox:.2f} {cy + ry:.2f} {cx - rx:.2f} {cy + oy:.2f} {cx - rx:.2f} {cy:.2f} c '
+            f'{cx - rx:.2f} {cy - oy:.2f} {cx - ox:.2f} {cy - ry:.2f} {cx:.2f} {cy - ry:.2f} c '
+            f'{cx + ox:.2f} {cy - ry:.2f} {cx + rx:.2f} {cy - oy:.2f} {cx + rx:.2f} {cy:.2f} c')
+
+
+def _shape_path(element):
+    """Path operators of a shape in PDF space (origin bottom-left, y up)."""
+    tag = element.tag.rsplit('}', 1)[-1]
+    number = lambda name: float(element.get(name))  # noqa: E731
+    if tag == 'rect':
+        return (f"{number('x'):.2f} {FIGURE_HEIGHT - number('y') - number('height'):.2f} "
+                f"{number('width'):.2f} {number('height'):.2f} re")
+    if tag == 'ellipse':
+        return _ellipse_path(number('cx'), FIGURE_HEIGHT - number('cy'), number('rx'), number('ry'))
+    if tag == 'polygon':
+        points = [point.split(',') for point in element.get('points').split()]
+        path = [f'{float(x):.2f} {FIGURE_HEIGHT - float(y):.2f}' for x, y in points]
+        return ' '.join([f'{path[0]} m', *(f'{point} l' for point in path[1:]), 'h'])
+    if tag == 'line':
+        return (f"{number('x1'):.2f} {FIGURE_HEIGHT - number('y1'):.2f} m "
+                f"{number('x2'):.2f} {FIGURE_HEIGHT - number('y2'):.2f} l")
+    raise ValueError(f"Unsupported element in figure template: <{tag}>")
+
+
+@lru_cache(maxsize=None)
+def _compiled_pdf(valve_type):
+    """The template as PDF operators: literal strings, ``('color', field, op)``
+    for a fill or stroke from a placeholder and ``('text', format, x, y)`` for
+    a centred label."""
+    from xml.etree import ElementTree
+
+    root = ElementTree.fromstring(TEMPLATES[valve_type])
+    ops = []
+    for element in root:
+        if element.tag.rsplit('}', 1)[-1] == 'text':
+            ops.append(('text', element.text, float(element.get('x')), FIGURE_HEIGHT - float(element.get('y'))))
+            continue
+        fill, stroke = element.get('fill', 'none'), element.get('stroke', 'none')
+        ops.append('q')
+        for color, op in ((fill, 'rg'), (stroke, 'RG')):
+            if color.startswith('{'):
+                ops.append(('color', color.strip('{}'), op))
+            elif color != 'none':
+                ops.append(f'{_pdf_color(color)} {op}')
+        if stroke != 'none':
+            ops.append(f"{float(element.get('stroke-width', 1)):.2f} w")
+        painting = 'B' if fill != 'none' and stroke != 'none' else 'f' if fill != 'none' else 'S'
+        ops.append(f'{_shape_path(element)} {painting} Q')
+    return tuple(ops)
+
+
+def render_valve_pdf_ops(valve_data, material_db=None, font='F1'):
+    """PDF content-stream operators drawing the figure for ``valve_data``.
+
+    Coordinates are in figure units with the origin at the bottom left of a
+    :data:`FIGURE_WIDTH` x :data:`FIGURE_HEIGHT` box; labels use the
+    font resource ``font``, which must name the regular Helvetica.
+    """
+    material_db = MATERIAL_DB if material_db is None else material_db
+    values = _template_values(valve_data, material_db)
+    ops = []
+    for op in _compiled_pdf(_template_for(valve_data)):
+        if isinstance(op, str):
+            ops.append(op)
+        elif op[0] == 'color':
+            ops.append(f'{_pdf_color(values[op[1]])} {op[2]}')
+        else:
+            _, text, x, y = op
+            text = pdf_text(text.format_map(values))
+            width = text_width(text, REGULAR, LABEL_SIZE) * K
+            ops.append(f'BT 0 g /{font} {LABEL_SIZE} Tf {x - width / 2:.2f} {y:.2f} Td ({escape(text)}) Tj ET')
+    return '\n'.join(ops)
+
+
+def figure_form_xobject(ops, resources):
+    """PDF form XObject body wrapping figure ``ops``.
+
+    ``resources`` is the resource dictionary or reference the labels' font
+    is looked up in, e.g. ``'3 0 R'``.
+    """
+    content = zlib.compress(ops.encode('latin1'))
+    header = (f'<< /Type /XObject /Subtype /Form /BBox [0 0 {FIGURE_WIDTH} {FIGURE_HEIGHT}] '
+              f'/Resources {resources} /Filter /FlateDecode /Length {len(content)} >>\nstream\n')
+    return header.encode('latin1') + content + b'\nendstream'
+
+
+def valve_figure_pdf(valve_data, material_db=None):
+    """A one-page vector PDF of the figure for ``valve_data``, as bytes."""
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {FIGURE_WIDTH} {FIGURE_HEIGHT}] '
+         f'/Resources 4 0 R /Contents 6 0 R >>').encode('latin1'),
+        b'<< /ProcSet [/PDF /Text] /Font << /F1 5 0 R >> /XObject << /Figure 7 0 R >> >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Length 13 >>\nstream\nq /Figure Do Q\nendstream',
+        figure_form_xobject(render_valve_pdf_ops(valve_data, material_db), '4 0 R'),
+    ]
+    pdf = bytearray(b'%PDF-1.3\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for obj_no, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf.extend(b'%d 0 obj\n%s\nendobj\n' % (obj_no, body))
+    xref_position = len(pdf)
+    pdf.extend(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        pdf.extend(b'%010d 00000 n \n' % offset)
+    pdf.extend(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+               % (len(objects) + 1, xref_position))
+    return bytes(pdf)